@@ -1,16 +1,16 @@
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from fastapi import Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer
 from pydantic import EmailStr
-from models import db_engine, db_models, redis_db
+from auth import token_store, user_cache
+from models import replica
 from typing import Annotated
-from sqlalchemy.orm import Session
-import jwt, os
+import jwt, os, uuid
 
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth")
-redis = redis_db.redis_factory()
 
 TOKEN_EXCEPTION = HTTPException(
     status_code=status.HTTP_401_UNAUTHORIZED,
@@ -20,26 +20,22 @@ TOKEN_EXCEPTION = HTTPException(
 load_dotenv()
 
 
-def is_user_verified(mail: EmailStr):
-    """checks if the user email is verified"""
+def is_user_verified(mail: EmailStr) -> dict:
+    """checks if the user email is verified and returns the cached user
+    state
+    """
 
-    db = next(db_engine.get_db())
-    try:
-        user = db.query(db_models.User).filter_by(email=mail).first()
-
-    except Exception as err:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Server encountered some issues, check back later",
-        )
+    user = user_cache.get_user_state(mail)
+    if not user:
+        raise TOKEN_EXCEPTION
 
-    if not user.is_verified:
+    if not user["is_verified"]:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not verified",
         )
 
-    return True
+    return user
 
 
 def email_verification_token(email: EmailStr) -> str:
@@ -81,7 +77,14 @@ def create_token(user) -> str:
     dup_data = data.copy()
     iat = datetime.utcnow()
     exp = datetime.utcnow() + timedelta(minutes=int(os.getenv("TOKEN_EXPIRATION_TIME")))
-    dup_data.update({"iat": iat, "exp": exp})
+    dup_data.update(
+        {
+            "iat": iat,
+            "exp": exp,
+            "jti": uuid.uuid4().hex,
+            "ver": token_store.token_version(user.user_id),
+        }
+    )
 
     token = jwt.encode(
         dup_data, os.getenv("SECRET_KEY"), os.getenv("ALGORITHM")
@@ -89,16 +92,11 @@ def create_token(user) -> str:
     return token
 
 
-def verify_token(token: Annotated[str, Depends(oauth2_scheme)]) -> dict:
+async def verify_token(
+    token: Annotated[str, Depends(oauth2_scheme)]
+) -> dict:
     """verify token integrity and returns the user data encoded in token"""
 
-    revoked_tokens = redis.lrange("revoked_tokens", 0, -1)
-    if token in revoked_tokens:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid access token",
-        )
-
     try:
         data = jwt.decode(
             token, os.getenv("SECRET_KEY"), os.getenv("ALGORITHM")
@@ -113,18 +111,45 @@ def verify_token(token: Annotated[str, Depends(oauth2_scheme)]) -> dict:
     except Exception as err:
         raise TOKEN_EXCEPTION
 
-    is_user_verified(data["email"])
+    if await token_store.is_revoked(token, data):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid access token",
+        )
+
+    # lets models.replica send the user's reads to the primary after writes
+    replica.current_user.set(data["sub"])
+
+    # versioned tokens are revoked on role and password changes, so their
+    # claims can be trusted as is. Verifying the email doesn't revoke them,
+    # an unverified claim is checked against the user state
+    if "ver" in data and data["is_verified"]:
+        return data
+
+    user = await run_in_threadpool(is_user_verified, data["email"])
+
+    # the role on the token could be stale after a role change
+    data["role"] = user["role"]
+    data["is_verified"] = user["is_verified"]
     return data
 
 
 def revoke_token(token: str = Depends(oauth2_scheme)) -> None:
     """revokes user token"""
 
-    revoked_tokens = redis.lrange("revoked_tokens", 0, -1)
-    if token in revoked_tokens:
+    try:
+        data = jwt.decode(
+            token,
+            os.getenv("SECRET_KEY"),
+            os.getenv("ALGORITHM"),
+            options={"verify_exp": False},
+        )
+
+    except Exception as err:
+        raise TOKEN_EXCEPTION
+
+    if not token_store.revoke(token, data):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid access Token",
         )
-
-    redis.rpush("revoked_tokens", token)
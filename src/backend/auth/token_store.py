@@ -0,0 +1,123 @@
+# This module keeps track of revoked access tokens
+# every revoked token is stored under its own key "revoked_token:<token_id>"
+# and expires together with the token, so a lookup is a single redis call
+# and redis only holds tokens that could still be used.
+#
+# each user also has a token version counter "token_version:<user_id>".
+# tokens carry the version they were issued with in the "ver" claim, so
+# bumping the counter revokes every token of the user at once.
+#
+# run `python -m auth.token_store` from src/backend to move the tokens kept
+# in the old "revoked_tokens" list into the new store.
+
+from models import redis_db
+from dotenv import load_dotenv
+import datetime, hashlib, jwt, os
+
+
+redis = redis_db.redis_factory()
+
+REVOKED_PREFIX = "revoked_token:"
+VERSION_PREFIX = "token_version:"
+LEGACY_REVOKED_LIST = "revoked_tokens"
+
+load_dotenv()
+
+
+def token_id(token: str, payload: dict) -> str:
+    """returns the identifier used to track the token, the jti claim or a
+    sha256 hash of the token for tokens issued without one
+    """
+
+    if payload.get("jti"):
+        return payload["jti"]
+
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def seconds_left(payload: dict) -> int:
+    """returns the number of seconds before the token expires"""
+
+    now = datetime.datetime.now(datetime.timezone.utc).timestamp()
+    return int(payload["exp"] - now)
+
+
+async def is_revoked(token: str, payload: dict) -> bool:
+    """checks if the token has been revoked, either on its own or by a
+    bump of the user token version
+    """
+
+    revoked, version = await redis_db.async_redis_factory().mget(
+        REVOKED_PREFIX + token_id(token, payload),
+        VERSION_PREFIX + str(payload["sub"]),
+    )
+
+    if revoked:
+        return True
+
+    # tokens issued before token versions existed don't carry the claim
+    if "ver" in payload and payload["ver"] != int(version or 0):
+        return True
+
+    return False
+
+
+def revoke(token: str, payload: dict) -> bool:
+    """revokes the token till it expires
+
+    returns False if the token was already revoked
+    """
+
+    ttl = seconds_left(payload)
+    if ttl <= 0:
+        # expired tokens can't be used anymore
+        return True
+
+    key = REVOKED_PREFIX + token_id(token, payload)
+    return bool(redis.set(key, 1, ex=ttl, nx=True))
+
+
+def token_version(user_id: int) -> int:
+    """returns the current token version of the user"""
+
+    return int(redis.get(VERSION_PREFIX + str(user_id)) or 0)
+
+
+def bump_token_version(user_id: int) -> int:
+    """revokes all the tokens issued to the user"""
+
+    return redis.incr(VERSION_PREFIX + str(user_id))
+
+
+def migrate_revoked_list() -> dict:
+    """moves the tokens in the legacy revoked_tokens list to the new store
+    and deletes the list
+    """
+
+    report = {"migrated": 0, "expired": 0, "invalid": 0}
+    for token in redis.lrange(LEGACY_REVOKED_LIST, 0, -1):
+        try:
+            payload = jwt.decode(
+                token,
+                os.getenv("SECRET_KEY"),
+                os.getenv("ALGORITHM"),
+                options={"verify_exp": False},
+            )
+
+        except Exception:
+            report["invalid"] += 1
+            continue
+
+        if seconds_left(payload) <= 0:
+            report["expired"] += 1
+            continue
+
+        revoke(token, payload)
+        report["migrated"] += 1
+
+    redis.delete(LEGACY_REVOKED_LIST)
+    return report
+
+
+if __name__ == "__main__":
+    print(migrate_revoked_list())
@@ -0,0 +1,84 @@
+# This module caches the verification status and role of users so that
+# authenticating a request doesn't hit the db.
+# lookups go through a small per-process TTL cache, then redis and only
+# then the users table. Routes that change the user record should call
+# invalidate() so the next request picks up the new state.
+
+from cachetools import TTLCache
+from fastapi import HTTPException, status
+from models import db_engine, db_models, redis_db
+from pydantic import EmailStr
+from dotenv import load_dotenv
+import json, os, threading
+
+
+load_dotenv()
+redis = redis_db.redis_factory()
+
+USER_STATE_PREFIX = "user_state:"
+
+# the local cache is not shared between workers, keep its ttl short
+LOCAL_TTL = int(os.getenv("USER_STATE_LOCAL_TTL", 30))
+REDIS_TTL = int(os.getenv("USER_STATE_TTL", 900))
+
+_local_cache = TTLCache(maxsize=10000, ttl=LOCAL_TTL)
+_lock = threading.Lock()
+
+
+def load_user_state(mail: EmailStr) -> dict | None:
+    """reads the user verification status and role from the db"""
+
+    try:
+        with db_engine.SessionLocal() as db:
+            user = (
+                db.query(db_models.User.is_verified, db_models.User.role)
+                .filter_by(email=mail)
+                .first()
+            )
+
+    except Exception as err:
+        print(f"err at load_user_state => {err}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Server encountered some issues, check back later",
+        )
+
+    if not user:
+        return None
+
+    return {"is_verified": bool(user.is_verified), "role": user.role}
+
+
+def get_user_state(mail: EmailStr) -> dict | None:
+    """returns the cached verification status and role of the user"""
+
+    with _lock:
+        state = _local_cache.get(mail)
+
+    if state:
+        return state
+
+    key = USER_STATE_PREFIX + mail
+    cached = redis.get(key)
+    if cached:
+        state = json.loads(cached)
+
+    else:
+        state = load_user_state(mail)
+        if not state:
+            return None
+
+        redis.set(key, json.dumps(state), ex=REDIS_TTL)
+
+    with _lock:
+        _local_cache[mail] = state
+
+    return state
+
+
+def invalidate(mail: EmailStr) -> None:
+    """drops the cached state of the user"""
+
+    redis.delete(USER_STATE_PREFIX + mail)
+    with _lock:
+        _local_cache.pop(mail, None)
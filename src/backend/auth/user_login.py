@@ -8,10 +8,15 @@ from fastapi import (
 from fastapi.templating import Jinja2Templates
 from fastapi.requests import Request
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
-from models import db_crud, db_engine, db_models, redis_db, schema
-from utils import email_notification, password_hash, redis_user_token
-from auth import oauth2_users, auth_schema
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import async_crud, db_engine, db_models, redis_db, schema
+from utils import (
+    email_notification,
+    login_tracker,
+    password_hash,
+    redis_user_token,
+)
+from auth import oauth2_users, auth_schema, token_store, user_cache
 from typing import Annotated
 from dotenv import load_dotenv
 from pydantic import BaseModel, EmailStr
@@ -25,6 +30,7 @@ import datetime, jwt, pathlib, os
 
 load_dotenv()
 router = APIRouter(prefix="/auth", tags=["Authentication"])
+redis = redis_db.redis_factory()
 
 CREDENTIALS_EXCEPTION = HTTPException(
     status_code=status.HTTP_404_NOT_FOUND, detail="Invalid credentials"
@@ -61,27 +67,34 @@ def validate_email_token(token: str) -> dict:
 )
 async def authenticate_user(
     form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
-    db: Annotated[Session, Depends(db_engine.get_db)],
+    db: Annotated[AsyncSession, Depends(db_engine.get_async_db)],
 ):
     """authenticates a user based on details sent and returns a token"""
 
-    user = db_crud.get_specific_record(
+    user = await async_crud.get_specific_record(
         db, db_models.User, email=form_data.username
     )
 
     if not user:
         raise CREDENTIALS_EXCEPTION
 
-    if not password_hash.verify_pwd(form_data.password, user.password):
-        raise CREDENTIALS_EXCEPTION
+    is_valid, new_hash = await password_hash.async_verify_and_update(
+        form_data.password, user.password
+    )
 
-    # update last login
-    user.last_login = datetime.datetime.utcnow()
-    db.commit()
-    db.refresh(user)
+    if not is_valid:
+        raise CREDENTIALS_EXCEPTION
 
     token = oauth2_users.create_token(user)
 
+    # rehash passwords created with an outdated cost
+    if new_hash:
+        user.password = new_hash
+        await db.commit()
+
+    # the users table is updated in batches by the login tracker
+    await login_tracker.record_login(user.user_id, datetime.datetime.utcnow())
+
     return {"access_token": token, "token_type": "Bearer"}
 
 
@@ -98,11 +111,10 @@ async def generate_email_token(
     verv_type: auth_schema.TokenType,
     req: Request,
     bg_task: BackgroundTasks,
-    db: Annotated[Session, Depends(db_engine.get_db)],
+    db: Annotated[AsyncSession, Depends(db_engine.get_async_db)],
 ):
     """generate email verification token to email address"""
 
-    redis = redis_db.redis_factory()
     key = mail + ":email_token"
 
     #if redis.exists(key):
@@ -111,7 +123,7 @@ async def generate_email_token(
     #        detail="User already has an active validation token",
     #    )
 
-    user = db_crud.get_specific_record(db, db_models.User, email=mail)
+    user = await async_crud.get_specific_record(db, db_models.User, email=mail)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -180,7 +192,7 @@ async def generate_email_token(
     response_model=auth_schema.SuccessfullEmailVerification,
 )
 async def verify_user_email(
-    token: str, db: Annotated[Session, Depends(db_engine.get_db)]
+    token: str, db: Annotated[AsyncSession, Depends(db_engine.get_async_db)]
 ):
     """verify"s the user email address provided and updates user
     verification status to True
@@ -188,22 +200,21 @@ async def verify_user_email(
 
     encoded_data = validate_email_token(token)
     key = encoded_data["email"] + ":email_token"
-    redis = redis_db.redis_factory()
     if not redis.exists(key):
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail="User already Verified",
         )
 
-    user = db_crud.get_specific_record(
+    user = await async_crud.get_specific_record(
         db, db_models.User, email=encoded_data["email"]
     )
 
     user.is_verified = True
 
     try:
-        db.commit()
-        db.refresh(user)
+        await db.commit()
+        await db.refresh(user)
 
     except Exception as err:
         print(f"err on saving new details => {err}")
@@ -214,6 +225,7 @@ async def verify_user_email(
         )
 
     redis.delete(key)
+    user_cache.invalidate(user.email)
     return {
         "msg": "User account verified",
         "name": f"{user.first_name} {user.last_name}",
@@ -229,13 +241,12 @@ async def verify_user_email(
 )
 async def change_user_password(
     payload: auth_schema.ChangePassword,
-    db: Annotated[Session, Depends(db_engine.get_db)],
+    db: Annotated[AsyncSession, Depends(db_engine.get_async_db)],
 ):
     """Updates the user password"""
 
     encoded_data = validate_email_token(payload.token)
     key = encoded_data["email"] + ":email_token"
-    redis = redis_db.redis_factory()
 
     if not redis.exists(key):
         raise HTTPException(
@@ -243,15 +254,15 @@ async def change_user_password(
             detail="Passowrd already changed",
         )
 
-    user = db_crud.get_specific_record(
+    user = await async_crud.get_specific_record(
         db, db_models.User, email=encoded_data["email"]
     )
 
-    user.password = password_hash.hash_pwd(payload.new_pwd)
+    user.password = await password_hash.async_hash_pwd(payload.new_pwd)
 
     try:
-        db.commit()
-        db.refresh(user)
+        await db.commit()
+        await db.refresh(user)
 
     except Exception as err:
         print(f"Error while changing users pwd: {err}")
@@ -261,6 +272,8 @@ async def change_user_password(
         )
 
     redis.delete(key)
+    user_cache.invalidate(user.email)
+    token_store.bump_token_version(user.user_id)
     return {"msg": "succesful"}
 
 
@@ -275,3 +288,19 @@ async def logout_user(token: str = Depends(oauth2_users.oauth2_scheme)):
     oauth2_users.revoke_token(token)
 
     return {"msg": "logout succesful"}
+
+
+@router.get(
+    "/logoutAll",
+    summary="Invalidates all the tokens of the active user",
+    description="Logs the active user out of every device",
+    responses=logout.response_codes,
+)
+async def logout_all_devices(
+    active_user: Annotated[dict, Depends(oauth2_users.verify_token)],
+):
+    """revokes all the tokens issued to the active user"""
+
+    token_store.bump_token_version(active_user["sub"])
+
+    return {"msg": "logout succesful"}
@@ -0,0 +1,123 @@
+# This benchmark compares the sync Session and the AsyncSession in routes
+# it seeds a throwaway sqlite database with INVOICES paid invoices, then
+# runs CONCURRENCY copies of the /payments/totalRevenue aggregate at once,
+# through a sync Session called from the coroutines as the routes used to
+# and through the AsyncSession, while a ticker coroutine records how late
+# its 1ms sleeps wake.
+#
+# run `python -m benchmarks.async_session [INVOICES] [CONCURRENCY]` from
+# src/backend, they default to 300000 and 8. DATABASE_URI is replaced, like
+# the tests do, as the engines are built on import.
+
+import datetime, os, sys, tempfile
+
+
+os.environ["DATABASE_URI"] = "sqlite:///" + os.path.join(
+    tempfile.mkdtemp(), "benchmark.sqlite"
+)
+os.environ.pop("ASYNC_DATABASE_URI", None)
+os.environ.pop("READ_DATABASE_URI", None)
+
+from sqlalchemy import func, select
+from models import db_engine, db_models
+import asyncio, migrations, time
+
+
+TICK = 0.001
+
+invoices = db_models.Invoices.__table__
+
+# the query of routes.payments.total_revenue without since
+REVENUE_QUERY = (
+    select(
+        func.extract("year", invoices.c.paid_at).label("year"),
+        func.extract("month", invoices.c.paid_at).label("month"),
+        func.sum(invoices.c.price).label("amount"),
+    )
+    .where(invoices.c.paid == True)
+    .group_by("year", "month")
+)
+
+
+def seed(count: int) -> None:
+    """inserts count paid invoices"""
+
+    now = datetime.datetime.utcnow()
+    rows = [
+        {
+            "inv_id": f"JPC-{index}",
+            "title": "benchmark",
+            "desc": "benchmark",
+            "price": 1,
+            "to_email": "user@example.com",
+            "created_at": now,
+            "created_by": "benchmark",
+            "due_date": now.date(),
+            "status": "paid",
+            "paid": True,
+            "paid_at": now - datetime.timedelta(days=index % 365),
+        }
+        for index in range(count)
+    ]
+
+    with db_engine.engine.begin() as connection:
+        connection.execute(invoices.insert(), rows)
+
+
+async def ticker(lags: list) -> None:
+    """records how late each sleep of TICK seconds wakes up"""
+
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(time.perf_counter() - start - TICK)
+
+
+async def sync_revenue() -> None:
+    """runs the aggregate on the sync Session, blocking the event loop"""
+
+    with db_engine.SessionLocal() as session:
+        session.execute(REVENUE_QUERY).all()
+
+
+async def async_revenue() -> None:
+    """runs the aggregate on the AsyncSession"""
+
+    async with db_engine.AsyncSessionLocal() as session:
+        (await session.execute(REVENUE_QUERY)).all()
+
+
+async def run(revenue, concurrency: int) -> dict:
+    """returns the time taken by the aggregates and the event loop lag"""
+
+    # opens the connections outside of the timings
+    await revenue()
+
+    lags = []
+    tick = asyncio.create_task(ticker(lags))
+    await asyncio.sleep(TICK * 10)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(revenue() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    await asyncio.sleep(TICK * 10)
+    tick.cancel()
+    await db_engine.async_engine.dispose()
+
+    return {
+        "session": revenue.__name__,
+        "concurrency": concurrency,
+        "total_s": round(elapsed, 2),
+        "max_lag_ms": round(max(lags) * 1000),
+    }
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 300000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+
+    migrations.upgrade()
+    seed(count)
+    for revenue in (sync_revenue, async_revenue):
+        print(asyncio.run(run(revenue, concurrency)))
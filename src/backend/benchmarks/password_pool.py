@@ -0,0 +1,67 @@
+# This benchmark measures how much password checks stall the event loop
+# it runs LOGINS concurrent bcrypt verifications, first inline in the
+# coroutines as the routes used to, then on the utils.password_hash pool,
+# while a ticker coroutine records how late each of its 5ms sleeps wakes.
+#
+# run `python -m benchmarks.password_pool [LOGINS]` from src/backend,
+# LOGINS defaults to 20. BCRYPT_ROUNDS and PWD_HASH_WORKERS apply as in
+# the app.
+
+from utils import password_hash
+import asyncio, sys, time
+
+
+TICK = 0.005
+
+
+async def ticker(lags: list) -> None:
+    """records how late each sleep of TICK seconds wakes up"""
+
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(time.perf_counter() - start - TICK)
+
+
+async def login(hashed_pwd: str, pooled: bool) -> None:
+    """the password check of a login"""
+
+    if pooled:
+        await password_hash.async_verify_and_update("secret", hashed_pwd)
+
+    else:
+        password_hash.verify_pwd("secret", hashed_pwd)
+
+
+async def run(logins: int, pooled: bool) -> dict:
+    """returns the time taken by the logins and the event loop lag in ms"""
+
+    hashed_pwd = password_hash.hash_pwd("secret")
+    lags = []
+    tick = asyncio.create_task(ticker(lags))
+    await asyncio.sleep(TICK * 4)
+
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(login(hashed_pwd, pooled) for _ in range(logins))
+    )
+    elapsed = time.perf_counter() - start
+
+    await asyncio.sleep(TICK * 4)
+    tick.cancel()
+    lags.sort()
+
+    return {
+        "mode": "pool" if pooled else "inline",
+        "logins": logins,
+        "rounds": password_hash.BCRYPT_ROUNDS,
+        "total_s": round(elapsed, 2),
+        "max_lag_ms": round(lags[-1] * 1000, 1),
+        "p50_lag_ms": round(lags[len(lags) // 2] * 1000, 1),
+    }
+
+
+if __name__ == "__main__":
+    logins = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    for pooled in (False, True):
+        print(asyncio.run(run(logins, pooled)))
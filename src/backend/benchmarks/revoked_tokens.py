@@ -0,0 +1,108 @@
+# This benchmark times the revoked token check of verify_token
+# it fills a fakeredis server with REVOKED_TOKENS revoked tokens, stored
+# both per token id as auth.token_store does and in the legacy
+# "revoked_tokens" list, then times the check of a token that isn't
+# revoked: decoding it and token_store.is_revoked, against the old LRANGE
+# of the whole list scanned in python.
+#
+# run `python -m benchmarks.revoked_tokens [REVOKED_TOKENS]` from
+# src/backend, REVOKED_TOKENS defaults to 100000.
+
+from models import redis_db
+import asyncio, datetime, fakeredis, jwt, os, sys, time, uuid
+
+
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("ALGORITHM", "HS256")
+
+# the app wide clients, shared by token_store
+server = fakeredis.FakeServer()
+redis_db.redis_client = fakeredis.FakeStrictRedis(
+    server=server, decode_responses=True
+)
+redis_db.async_redis_client = fakeredis.FakeAsyncRedis(
+    server=server, decode_responses=True
+)
+
+from auth import token_store
+
+
+def make_token(user_id: int) -> str:
+    """returns a token shaped like oauth2_users.create_token ones"""
+
+    now = datetime.datetime.utcnow()
+    payload = {
+        "sub": user_id,
+        "iat": now,
+        "exp": now + datetime.timedelta(minutes=30),
+        "jti": uuid.uuid4().hex,
+        "ver": 0,
+    }
+
+    return jwt.encode(
+        payload, os.getenv("SECRET_KEY"), os.getenv("ALGORITHM")
+    )
+
+
+def seed(count: int) -> None:
+    """revokes count tokens in the new store and the legacy list"""
+
+    redis = redis_db.redis_factory()
+    tokens = [make_token(user_id) for user_id in range(count)]
+    pipe = redis.pipeline(transaction=False)
+    for token in tokens:
+        payload = jwt.decode(
+            token, os.getenv("SECRET_KEY"), os.getenv("ALGORITHM")
+        )
+        pipe.set(
+            token_store.REVOKED_PREFIX + payload["jti"], 1, ex=1800
+        )
+
+    pipe.rpush(token_store.LEGACY_REVOKED_LIST, *tokens)
+    pipe.execute()
+
+
+async def check_token(token: str) -> bool:
+    """the revocation check of oauth2_users.verify_token"""
+
+    payload = jwt.decode(
+        token, os.getenv("SECRET_KEY"), os.getenv("ALGORITHM")
+    )
+    return await token_store.is_revoked(token, payload)
+
+
+def check_legacy(token: str) -> bool:
+    """the revocation check before token_store"""
+
+    redis = redis_db.redis_factory()
+    return token in redis.lrange(token_store.LEGACY_REVOKED_LIST, 0, -1)
+
+
+async def run(count: int) -> dict:
+    """returns the average time of both checks in ms"""
+
+    seed(count)
+    token = make_token(count)
+
+    start = time.perf_counter()
+    for _ in range(200):
+        assert not await check_token(token)
+
+    store_ms = (time.perf_counter() - start) / 200 * 1000
+
+    start = time.perf_counter()
+    for _ in range(20):
+        assert not check_legacy(token)
+
+    legacy_ms = (time.perf_counter() - start) / 20 * 1000
+
+    return {
+        "revoked_tokens": count,
+        "token_store_ms": round(store_ms, 3),
+        "legacy_list_ms": round(legacy_ms, 3),
+    }
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    print(asyncio.run(run(count)))
@@ -1,17 +1,68 @@
 # the application entry point
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from models.db_engine import Base, engine
+from models import archive, db_engine, db_metrics, db_pool, deadlines, expiry
+from models import redis_db, replica
 from models import db_models
 from auth import user_login
-from routes import documents, drafts, invoices, users, payments
+from routes import documents, drafts, export, invoices, metrics, users
+from routes import payments
 from online_payments import rave_checkout
 from docs import app_doc, all_tags
+from utils import ids, login_tracker
+import asyncio
+import migrations
 
 
-Base.metadata.create_all(bind=engine)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """opens the shared clients and starts the background jobs of the app"""
+
+    # the schema is managed by `python -m migrations`, not on startup
+    pending = await run_in_threadpool(migrations.pending_migrations)
+    if pending:
+        print(f"pending migrations, run python -m migrations => {pending}")
+
+    await redis_db.open_redis()
+    await run_in_threadpool(ids.claim_node)
+    node_keeper = asyncio.create_task(ids.keep_node_periodically())
+    login_flusher = asyncio.create_task(login_tracker.flush_periodically())
+    pool_monitor = asyncio.create_task(db_pool.monitor())
+    lag_monitor = None
+    if db_engine.read_engine is not None:
+        lag_monitor = asyncio.create_task(replica.monitor_lag())
+
+    archiver = None
+    if archive.ARCHIVE_INTERVAL > 0:
+        archiver = asyncio.create_task(archive.archive_periodically())
+
+    expirer = None
+    if expiry.EXPIRY_INTERVAL > 0:
+        expirer = asyncio.create_task(expiry.expire_periodically())
+
+    yield
+
+    node_keeper.cancel()
+    login_flusher.cancel()
+    pool_monitor.cancel()
+    if lag_monitor is not None:
+        lag_monitor.cancel()
+
+    if archiver is not None:
+        archiver.cancel()
+
+    if expirer is not None:
+        expirer.cancel()
+
+    await run_in_threadpool(login_tracker.flush)
+    await run_in_threadpool(ids.release_node)
+    await redis_db.close_redis()
+
 
 app = FastAPI(
+        lifespan=lifespan,
         title="Japaconsults User Portal",
         summary=app_doc.summary,
         description=app_doc.description,
@@ -36,8 +87,12 @@ app.add_middleware(
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["Server-Timing"],
     )
 
+app.add_middleware(db_metrics.QueryMetricsMiddleware)
+app.add_middleware(deadlines.DeadlineMiddleware)
+
 # register routes
 app.include_router(user_login.router)
 app.include_router(documents.router)
@@ -46,6 +101,8 @@ app.include_router(invoices.router)
 app.include_router(users.router)
 app.include_router(rave_checkout.router)
 app.include_router(payments.router)
+app.include_router(metrics.router)
+app.include_router(export.router)
 
 
 @app.get("/", tags=["status"])
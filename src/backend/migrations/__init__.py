@@ -0,0 +1,74 @@
+# This package holds the versioned schema migrations of the app
+# every module in migrations/versions is a migration named
+# "<version>_<description>.py" with an upgrade(connection) function, and
+# the migrations run in version order, each in its own transaction.
+# applied versions are recorded in the schema_migrations table so every
+# migration runs once per database.
+#
+# the baseline migration creates the tables from the current models, so
+# later migrations should skip changes that already exist (see
+# migrations.operations).
+#
+# run `python -m migrations` from src/backend before starting the app and
+# `python -m migrations status` to see the pending migrations.
+
+from models.db_engine import engine
+from sqlalchemy import Column, DateTime, MetaData, String, Table, select
+from . import versions
+import datetime, importlib, pkgutil
+
+
+metadata = MetaData()
+
+schema_migrations = Table(
+    "schema_migrations",
+    metadata,
+    Column("version", String(100), primary_key=True),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+def all_migrations() -> list[str]:
+    """returns the name of every migration in version order"""
+
+    return sorted(
+        module.name for module in pkgutil.iter_modules(versions.__path__)
+    )
+
+
+def applied_migrations() -> set[str]:
+    """returns the migrations already applied to the database"""
+
+    metadata.create_all(engine)
+    with engine.connect() as connection:
+        return set(
+            connection.scalars(select(schema_migrations.c.version)).all()
+        )
+
+
+def pending_migrations() -> list[str]:
+    """returns the migrations not applied yet in version order"""
+
+    applied = applied_migrations()
+    return [name for name in all_migrations() if name not in applied]
+
+
+def upgrade() -> list[str]:
+    """applies the pending migrations and returns their names"""
+
+    applied = []
+    for name in pending_migrations():
+        migration = importlib.import_module(f"{versions.__name__}.{name}")
+        with engine.begin() as connection:
+            migration.upgrade(connection)
+            connection.execute(
+                schema_migrations.insert().values(
+                    version=name,
+                    applied_at=datetime.datetime.utcnow(),
+                )
+            )
+
+        print(f"applied migration => {name}")
+        applied.append(name)
+
+    return applied
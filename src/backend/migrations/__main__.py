@@ -0,0 +1,12 @@
+from . import pending_migrations, upgrade
+import sys
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["status"]:
+        pending = pending_migrations()
+        print(f"pending migrations => {pending or 'none'}")
+
+    else:
+        applied = upgrade()
+        print(f"{len(applied)} migration(s) applied")
@@ -0,0 +1,71 @@
+# This module holds the schema changes shared by the migrations
+# the helpers skip changes that are already in the database, so a
+# migration can run on a database created by the baseline from newer
+# models as well as on an old one.
+
+from sqlalchemy import inspect, text
+
+
+def has_index(connection, table: str, name: str) -> bool:
+    """checks if the index exists on the table"""
+
+    indexes = inspect(connection).get_indexes(table)
+    return any(index["name"] == name for index in indexes)
+
+
+def create_index(connection, table: str, name: str, *columns) -> None:
+    """creates the index on the table columns if missing"""
+
+    if has_index(connection, table, name):
+        return
+
+    connection.execute(
+        text(f"CREATE INDEX {name} ON {table} ({', '.join(columns)})")
+    )
+
+
+def has_column(connection, table: str, name: str) -> bool:
+    """checks if the column exists on the table"""
+
+    columns = inspect(connection).get_columns(table)
+    return any(column["name"] == name for column in columns)
+
+
+def drop_index(connection, table: str, name: str) -> None:
+    """drops the index of the table if it exists"""
+
+    if not has_index(connection, table, name):
+        return
+
+    if connection.dialect.name == "mysql":
+        connection.execute(text(f"DROP INDEX {name} ON {table}"))
+
+    else:
+        connection.execute(text(f"DROP INDEX {name}"))
+
+
+def add_column(
+    connection, table: str, name: str, definition: str, references=None
+) -> None:
+    """adds the column to the table if missing
+
+    definition: the column type and options, e.g "INTEGER NULL"
+    references: optional "table(column)" the column is a foreign key of,
+        rows referencing a deleted row are set to NULL
+    """
+
+    if has_column(connection, table, name):
+        return
+
+    statement = f"ALTER TABLE {table} ADD COLUMN {name} {definition}"
+    if references and connection.dialect.name == "mysql":
+        # mysql ignores inline REFERENCES, the constraint is added apart
+        statement += (
+            f", ADD CONSTRAINT fk_{table}_{name} FOREIGN KEY ({name}) "
+            f"REFERENCES {references} ON DELETE SET NULL"
+        )
+
+    elif references:
+        statement += f" REFERENCES {references} ON DELETE SET NULL"
+
+    connection.execute(text(statement))
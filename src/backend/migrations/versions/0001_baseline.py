@@ -0,0 +1,8 @@
+"""creates the tables of the app, replaces the create_all call in main"""
+
+from models.db_engine import Base
+from models import db_models
+
+
+def upgrade(connection) -> None:
+    Base.metadata.create_all(connection)
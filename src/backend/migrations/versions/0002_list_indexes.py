@@ -0,0 +1,69 @@
+"""adds the composite indexes used by the filters and sort columns of the
+list endpoints
+"""
+
+from migrations.operations import create_index
+
+
+INDEXES = [
+    (
+        "users",
+        "ix_users_role_is_verified_date_joined",
+        "role",
+        "is_verified",
+        "date_joined",
+    ),
+    (
+        "users",
+        "ix_users_is_verified_date_joined",
+        "is_verified",
+        "date_joined",
+    ),
+    ("drafts", "ix_drafts_user_id_last_updated", "user_id", "last_updated"),
+    (
+        "files",
+        "ix_files_owner_id_folder_date_uploaded",
+        "owner_id",
+        "folder",
+        "date_uploaded",
+    ),
+    (
+        "received_notes",
+        "ix_received_notes_to_id_sent_time",
+        "to_id",
+        "sent_time",
+    ),
+    (
+        "invoices",
+        "ix_invoices_to_email_status_paid_created_at",
+        "to_email",
+        "status",
+        "paid",
+        "created_at",
+    ),
+    (
+        "invoices",
+        "ix_invoices_status_paid_created_at",
+        "status",
+        "paid",
+        "created_at",
+    ),
+    ("invoices", "ix_invoices_paid_paid_at", "paid", "paid_at"),
+    ("invoices", "ix_invoices_created_at", "created_at"),
+    (
+        "payments",
+        "ix_payments_payer_email_status_paid_at",
+        "payer_email",
+        "status",
+        "paid_at",
+    ),
+    ("payments", "ix_payments_inv_id_status", "inv_id", "status"),
+    ("payments", "ix_payments_status_paid_at", "status", "paid_at"),
+    ("payments", "ix_payments_paid_paid_at", "paid", "paid_at"),
+    ("payments", "ix_payments_paid_at", "paid_at"),
+]
+
+
+def upgrade(connection) -> None:
+    for table, name, *columns in INDEXES:
+        create_index(connection, table, name, *columns)
@@ -0,0 +1,7 @@
+"""creates the replica_heartbeat table used to measure the replica lag"""
+
+from models import db_models
+
+
+def upgrade(connection) -> None:
+    db_models.ReplicaHeartbeat.__table__.create(connection, checkfirst=True)
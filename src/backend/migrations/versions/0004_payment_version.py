@@ -0,0 +1,16 @@
+"""adds the version column compared and set by the payment transitions"""
+
+from migrations.operations import has_column
+from sqlalchemy import text
+
+
+def upgrade(connection) -> None:
+    if has_column(connection, "payments", "version"):
+        return
+
+    connection.execute(
+        text(
+            "ALTER TABLE payments ADD COLUMN version INTEGER NOT NULL "
+            "DEFAULT 0"
+        )
+    )
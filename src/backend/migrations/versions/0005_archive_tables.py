@@ -0,0 +1,10 @@
+"""creates the invoices_archive and payments_archive tables filled by
+models.archive
+"""
+
+from models import db_models
+
+
+def upgrade(connection) -> None:
+    db_models.invoices_archive.create(connection, checkfirst=True)
+    db_models.payments_archive.create(connection, checkfirst=True)
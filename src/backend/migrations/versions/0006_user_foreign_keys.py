@@ -0,0 +1,73 @@
+"""adds the to_user_id and payer_id user foreign keys to the invoices and
+payments, filled from the to_email and payer_email of the rows, and moves
+the user scoped indexes from the emails to them
+"""
+
+from migrations.operations import add_column, create_index, drop_index
+from sqlalchemy import text
+
+
+# table, user id column, email column, references
+COLUMNS = [
+    ("invoices", "to_user_id", "to_email", "users(user_id)"),
+    ("payments", "payer_id", "payer_email", "users(user_id)"),
+    ("invoices_archive", "to_user_id", "to_email", None),
+    ("payments_archive", "payer_id", "payer_email", None),
+]
+
+INDEXES = [
+    (
+        "invoices",
+        "ix_invoices_to_user_id_status_paid_created_at",
+        "to_user_id",
+        "status",
+        "paid",
+        "created_at",
+    ),
+    (
+        "payments",
+        "ix_payments_payer_id_status_paid_at",
+        "payer_id",
+        "status",
+        "paid_at",
+    ),
+    (
+        "invoices_archive",
+        "ix_invoices_archive_to_user_id_created_at",
+        "to_user_id",
+        "created_at",
+    ),
+    (
+        "payments_archive",
+        "ix_payments_archive_payer_id_paid_at",
+        "payer_id",
+        "paid_at",
+    ),
+]
+
+OLD_INDEXES = [
+    ("invoices", "ix_invoices_to_email_status_paid_created_at"),
+    ("payments", "ix_payments_payer_email_status_paid_at"),
+    ("invoices_archive", "ix_invoices_archive_to_email_created_at"),
+    ("payments_archive", "ix_payments_archive_payer_email_paid_at"),
+]
+
+
+def upgrade(connection) -> None:
+    for table, column, email_column, references in COLUMNS:
+        add_column(connection, table, column, "INTEGER NULL", references)
+
+        # rows whose email matches no user keep a NULL user id
+        connection.execute(
+            text(
+                f"UPDATE {table} SET {column} = (SELECT users.user_id "
+                f"FROM users WHERE users.email = {table}.{email_column}) "
+                f"WHERE {column} IS NULL"
+            )
+        )
+
+    for table, name, *columns in INDEXES:
+        create_index(connection, table, name, *columns)
+
+    for table, name in OLD_INDEXES:
+        drop_index(connection, table, name)
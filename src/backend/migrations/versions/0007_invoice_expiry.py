@@ -0,0 +1,23 @@
+"""adds the (status, due_date) index of models.expiry and marks the unpaid
+invoices without a status as pending, the status the listings filter on
+"""
+
+from migrations.operations import create_index
+from sqlalchemy import text
+
+
+def upgrade(connection) -> None:
+    connection.execute(
+        text(
+            "UPDATE invoices SET status = 'pending' "
+            "WHERE status IS NULL AND paid = 0"
+        )
+    )
+
+    create_index(
+        connection,
+        "invoices",
+        "ix_invoices_status_due_date",
+        "status",
+        "due_date",
+    )
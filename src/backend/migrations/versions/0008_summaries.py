@@ -0,0 +1,10 @@
+"""creates the summaries table kept by models.summary and fills it from
+the invoices and payments
+"""
+
+from models import db_models, summary
+
+
+def upgrade(connection) -> None:
+    db_models.Summaries.__table__.create(connection, checkfirst=True)
+    summary.recompute(connection)
@@ -0,0 +1,11 @@
+"""adds the date_uploaded index the file exports of routes.export filter
+and sort on
+"""
+
+from migrations.operations import create_index
+
+
+def upgrade(connection) -> None:
+    create_index(
+        connection, "files", "ix_files_date_uploaded", "date_uploaded"
+    )
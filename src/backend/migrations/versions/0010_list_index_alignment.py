@@ -0,0 +1,62 @@
+"""realigns the list indexes with the filters and keyset order of the list
+endpoints, every list reads its page from an index in sort order instead
+of sorting the matching rows
+"""
+
+from migrations.operations import create_index, drop_index
+
+
+INDEXES = [
+    ("users", "ix_users_role_date_joined", "role", "date_joined"),
+    (
+        "files",
+        "ix_files_owner_id_date_uploaded",
+        "owner_id",
+        "date_uploaded",
+    ),
+    (
+        "invoices",
+        "ix_invoices_to_user_id_created_at",
+        "to_user_id",
+        "created_at",
+    ),
+    (
+        "invoices",
+        "ix_invoices_to_user_id_paid_paid_at",
+        "to_user_id",
+        "paid",
+        "paid_at",
+    ),
+    (
+        "payments",
+        "ix_payments_payer_id_status_ref_id",
+        "payer_id",
+        "status",
+        "ref_id",
+    ),
+    ("payments", "ix_payments_payer_id_paid_at", "payer_id", "paid_at"),
+    (
+        "payments",
+        "ix_payments_payer_id_paid_paid_at",
+        "payer_id",
+        "paid",
+        "paid_at",
+    ),
+    ("payments", "ix_payments_status_ref_id", "status", "ref_id"),
+    ("payments", "ix_payments_paid_ref_id", "paid", "ref_id"),
+]
+
+# replaced by the indexes above, no query reads them anymore
+OLD_INDEXES = [
+    ("users", "ix_users_role_is_verified_date_joined"),
+    ("payments", "ix_payments_payer_id_status_paid_at"),
+    ("payments", "ix_payments_status_paid_at"),
+]
+
+
+def upgrade(connection) -> None:
+    for table, name, *columns in INDEXES:
+        create_index(connection, table, name, *columns)
+
+    for table, name in OLD_INDEXES:
+        drop_index(connection, table, name)
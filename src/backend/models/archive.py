@@ -0,0 +1,241 @@
+# This module moves the settled invoices and payments to archive tables
+# the dashboards only scan the recent rows of the invoices and payments
+# tables, run() moves the invoices settled more than ARCHIVE_AFTER_DAYS
+# ago, with their payments, to invoices_archive and payments_archive:
+#   - paid invoices, by paid_at
+#   - unpaid invoices, by due_date, they're expired
+# invoices with a pending or checking payment are left alone.
+#
+# the listings taking a since date read the archive too when since is on
+# or before the day of the horizon, see reaches(), the totals and the
+# exports read it unless since is after it. Other reads only see the hot
+# rows except the lookups by id which fall back to the archive.
+#
+# run it with `python -m models.archive` from src/backend, e.g daily from
+# cron, or set ARCHIVE_INTERVAL to run it in the app. Both print a report
+# of the table sizes and dashboard query latencies before and after.
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import (
+    DateTime,
+    and_,
+    delete,
+    exists,
+    func,
+    insert,
+    literal,
+    or_,
+    select,
+    union_all,
+)
+from . import db_engine, db_models
+from dotenv import load_dotenv
+import asyncio, datetime, json, logging, os, time
+
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", 365))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", 500))
+# seconds, 0 leaves the archiving to `python -m models.archive`
+ARCHIVE_INTERVAL = float(os.getenv("ARCHIVE_INTERVAL", 0))
+
+invoices = db_models.Invoices.__table__
+payments = db_models.Payments.__table__
+
+# table name => its archive table
+archives = {
+    "invoices": db_models.invoices_archive,
+    "payments": db_models.payments_archive,
+}
+
+# the dashboard queries timed by report()
+REPORT_QUERIES = {
+    "revenue by month": select(
+        func.extract("year", invoices.c.paid_at),
+        func.extract("month", invoices.c.paid_at),
+        func.sum(invoices.c.price),
+    )
+    .where(invoices.c.paid == True)
+    .group_by(
+        func.extract("year", invoices.c.paid_at),
+        func.extract("month", invoices.c.paid_at),
+    ),
+    "paid invoices page": select(invoices)
+    .where(invoices.c.paid == True)
+    .order_by(invoices.c.paid_at.desc(), invoices.c.inv_id.desc())
+    .limit(20),
+    "cancelled payments page": select(payments)
+    .where(payments.c.status == "cancelled")
+    .order_by(payments.c.ref_id.desc())
+    .limit(20),
+}
+
+
+def horizon() -> datetime.datetime:
+    """returns the time before which settled rows are archived"""
+
+    return datetime.datetime.utcnow() - datetime.timedelta(
+        days=ARCHIVE_AFTER_DAYS
+    )
+
+
+def reaches(since, all_time: bool = False) -> bool:
+    """checks if a range starting at since can include archived rows
+
+    all_time: whether a range without since covers all the rows, as the
+        totals do, instead of the recent ones like the listings
+    """
+
+    if since is None:
+        return all_time
+
+    # the rows archived on the day of the horizon are from since too
+    return since <= horizon().date()
+
+
+def with_archive(table, since, build, all_time: bool = False):
+    """returns the query built by build for the table, unioned with the
+    same query on its archive when since reaches archived rows
+
+    build: function taking a table and returning a select of its columns
+    all_time: see reaches()
+    """
+
+    query = build(table)
+    if reaches(since, all_time):
+        query = union_all(query, build(archives[table.name]))
+
+    return query
+
+
+def settled_invoices(cutoff: datetime.datetime):
+    """selects a batch of invoices settled before cutoff"""
+
+    active_payment = exists().where(
+        payments.c.inv_id == invoices.c.inv_id,
+        payments.c.status.in_(("pending", "checking")),
+    )
+
+    return (
+        select(invoices.c.inv_id)
+        .where(
+            or_(
+                and_(invoices.c.paid == True, invoices.c.paid_at < cutoff),
+                and_(
+                    invoices.c.paid == False,
+                    invoices.c.due_date < cutoff.date(),
+                ),
+            ),
+            ~active_payment,
+        )
+        .limit(ARCHIVE_BATCH_SIZE)
+    )
+
+
+def move(connection, table, column, values, archived_at) -> None:
+    """moves the rows of table with column in values to its archive"""
+
+    archive = archives[table.name]
+    connection.execute(
+        insert(archive).from_select(
+            [*table.c.keys(), "archived_at"],
+            select(*table.c, literal(archived_at, DateTime)).where(
+                column.in_(values)
+            ),
+        )
+    )
+
+    connection.execute(delete(table).where(column.in_(values)))
+
+
+def archive_batch(connection, cutoff: datetime.datetime) -> int:
+    """archives a batch of settled invoices with their payments and
+    returns the number of invoices archived
+    """
+
+    inv_ids = connection.scalars(settled_invoices(cutoff)).all()
+    if not inv_ids:
+        return 0
+
+    archived_at = datetime.datetime.utcnow()
+
+    # the payments go first, they reference the invoices
+    move(connection, payments, payments.c.inv_id, inv_ids, archived_at)
+    move(connection, invoices, invoices.c.inv_id, inv_ids, archived_at)
+    return len(inv_ids)
+
+
+def report(connection) -> dict:
+    """returns the row counts of the hot and archive tables and the best
+    of three timings of the dashboard queries in ms
+    """
+
+    rows = {}
+    for table in (invoices, payments, *archives.values()):
+        rows[table.name] = connection.scalar(
+            select(func.count()).select_from(table)
+        )
+
+    latency = {}
+    for name, query in REPORT_QUERIES.items():
+        timings = []
+        for _ in range(3):
+            start = time.perf_counter()
+            connection.execute(query).all()
+            timings.append((time.perf_counter() - start) * 1000)
+
+        latency[name] = round(min(timings), 3)
+
+    return {"rows": rows, "latency_ms": latency}
+
+
+def run(engine=None) -> dict:
+    """archives every invoice settled before the horizon, in batches of
+    ARCHIVE_BATCH_SIZE, and returns the report of the run
+    """
+
+    engine = engine or db_engine.engine
+    cutoff = horizon()
+
+    with engine.connect() as connection:
+        before = report(connection)
+
+    archived = 0
+    while True:
+        with engine.begin() as connection:
+            count = archive_batch(connection, cutoff)
+
+        archived += count
+        if count < ARCHIVE_BATCH_SIZE:
+            break
+
+    with engine.connect() as connection:
+        after = report(connection)
+
+    result = {
+        "cutoff": cutoff.isoformat(),
+        "archived_invoices": archived,
+        "before": before,
+        "after": after,
+    }
+
+    logger.info(f"archive run => {json.dumps(result)}")
+    return result
+
+
+async def archive_periodically() -> None:
+    """archives the settled rows every ARCHIVE_INTERVAL seconds"""
+
+    while True:
+        await asyncio.sleep(ARCHIVE_INTERVAL)
+        try:
+            await run_in_threadpool(run)
+
+        except Exception as err:
+            logger.error(f"err at archive run => {err}")
+
+
+if __name__ == "__main__":
+    print(json.dumps(run(), indent=4))
@@ -0,0 +1,359 @@
+"""This modules contains the async counterparts of the CRUD actions in
+    db_crud, to be used with the AsyncSession from db_engine.get_async_db
+"""
+
+from fastapi import HTTPException, status
+from sqlalchemy import and_, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from .db_crud import DB_EXCEPTION, QUERY_EXCEPTION
+from . import archive
+import base64, datetime, json, logging
+
+
+logger = logging.getLogger(__name__)
+
+CURSOR_EXCEPTION = HTTPException(
+    status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+)
+
+
+async def get_all(session: AsyncSession, table):
+    """Get all data from a table in database
+
+    @session: the request session object
+    @table: the db table to query
+    """
+
+    try:
+        data = (await session.scalars(select(table))).all()
+
+    except Exception as err:
+        logger.error(f"err at get_all => {err}")
+        raise DB_EXCEPTION
+
+    return data
+
+
+async def get_by(session: AsyncSession, table, **kwargs):
+    """Get specific data from a table in db based on **kwargs specified
+
+    @session: the request session object
+    @table: the table to query
+    @**kwargs: the filter based criteria
+    """
+
+    try:
+        data = (
+            await session.scalars(select(table).filter_by(**kwargs))
+        ).all()
+
+    except Exception as err:
+        logger.error(f"err at get_by => {err}")
+        raise DB_EXCEPTION
+
+    return data
+
+
+async def get_specific_record(session: AsyncSession, table, **kwargs):
+    """gets a specific record from the table
+
+    parameters:
+        @session: The db session
+        @table: the database table to query
+        @column: the specific column
+    """
+
+    try:
+        record = (
+            await session.scalars(select(table).filter_by(**kwargs).limit(1))
+        ).first()
+
+    except Exception as err:
+        logger.error(f"err at get_spec => {err}")
+        raise DB_EXCEPTION
+
+    return record
+
+
+async def get_archived_record(session: AsyncSession, table, **kwargs):
+    """gets a specific record from the archive of the table, see
+    models.archive. The record is a row, not an entity
+
+    parameters:
+        @session: The db session
+        @table: the table whose archive is queried
+        @kwargs: the filter
+    """
+
+    archive_table = archive.archives[table.__tablename__]
+    try:
+        record = (
+            await session.execute(
+                select(archive_table).where(
+                    *(
+                        archive_table.c[key] == value
+                        for key, value in kwargs.items()
+                    )
+                )
+            )
+        ).first()
+
+    except Exception as err:
+        logger.error(f"err at get_archived_record => {err}")
+        raise DB_EXCEPTION
+
+    return record
+
+
+async def save(session: AsyncSession, db_table, record):
+    """saves a record to a db table
+
+    @session: the request session object
+    @table: the table to query
+    @record: the data to save to table
+    """
+
+    data = db_table(**record)
+    try:
+        session.add(data)
+        await session.commit()
+        await session.refresh(data)
+
+    except Exception as err:
+        logger.error(f"error in save => {err}")
+        # send yourself a mail here
+        raise DB_EXCEPTION
+
+    return data
+
+
+async def record_in_lifo(session: AsyncSession, db_table, column, **kwargs):
+    """returns all record using last in first out
+
+    @session: the request session object
+    @db_table: the table to query
+    @column: The db column to sort
+    @kwargs: the argument filter
+    """
+
+    try:
+        record = (
+            await session.scalars(
+                select(db_table).filter_by(**kwargs).order_by(column.desc())
+            )
+        ).all()
+
+    except Exception as err:
+        logger.error(f"err at record_in_lifo => {err}")
+        raise DB_EXCEPTION
+
+    return record
+
+
+async def all_record_in_lifo(session: AsyncSession, db_table, column):
+    """returnss all records in lifo"""
+
+    try:
+        records = (
+            await session.scalars(select(db_table).order_by(column.desc()))
+        ).all()
+
+    except Exception as err:
+        logger.error(f"err at all_record_in_lifo => {err}")
+        raise DB_EXCEPTION
+
+    return records
+
+
+async def filter_record_in_lifo(
+    session: AsyncSession, db_table, column, **kwargs
+):
+    """filter record in lifo"""
+
+    try:
+        records = (
+            await session.scalars(
+                select(db_table).filter_by(**kwargs).order_by(column.desc())
+            )
+        ).all()
+
+    except Exception as err:
+        logger.error(f"err at filter_record_in_lifo => {err}")
+        raise DB_EXCEPTION
+
+    return records
+
+
+async def delete(session: AsyncSession, db_table, **kwargs):
+    """Deletes a record from the db table that matches the column id
+
+    @col_id: the column ID in the table to delete, must be unique
+    @session: the request session object
+    @db_table: the database table to query
+    """
+
+    try:
+        resp = (
+            await session.scalars(select(db_table).filter_by(**kwargs).limit(1))
+        ).first()
+
+    except Exception as err:
+        # send a mail with the exception message
+        logger.error(f"err at delete => {err}")
+        raise DB_EXCEPTION
+
+    if not resp:
+        raise QUERY_EXCEPTION
+
+    try:
+        await session.delete(resp)
+        await session.commit()
+
+    except Exception as err:
+        raise DB_EXCEPTION
+
+
+def encode_cursor(value, key) -> str:
+    """builds the opaque cursor pointing after the record with the sort
+    column value and primary key specified
+    """
+
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        value = value.isoformat()
+
+    data = json.dumps([value, key]).encode()
+    return base64.urlsafe_b64encode(data).decode()
+
+
+def decode_cursor(cursor: str, column) -> tuple:
+    """returns the sort column value and primary key in the cursor"""
+
+    try:
+        value, key = json.loads(base64.urlsafe_b64decode(cursor))
+        python_type = column.type.python_type
+        if value is not None and python_type is datetime.datetime:
+            value = datetime.datetime.fromisoformat(value)
+
+        elif value is not None and python_type is datetime.date:
+            value = datetime.date.fromisoformat(value)
+
+    except Exception as err:
+        raise CURSOR_EXCEPTION
+
+    return value, key
+
+
+def after_cursor(column, primary_key, value, key):
+    """filters the records sorted after the cursor position
+
+    records are sorted by column then primary key in descending order,
+    with null column values last
+    """
+
+    if value is None:
+        return and_(column.is_(None), primary_key < key)
+
+    return or_(
+        column < value,
+        and_(column == value, primary_key < key),
+        column.is_(None),
+    )
+
+
+async def paginate(
+    session: AsyncSession,
+    db_table,
+    column,
+    cursor: str | None = None,
+    limit: int = 20,
+    columns: tuple | None = None,
+    since=None,
+    **kwargs,
+):
+    """returns a page of records in lifo and the cursor of the next page
+
+    @session: the request session object
+    @db_table: the table to query
+    @column: The db column to sort
+    @cursor: the next_cursor returned with the previous page
+    @limit: the number of records on the page
+    @columns: the columns to load, the records are rows instead of
+        entities when specified
+    @since: only the records with column on or after since, the archive
+        of the table is read too when since is older than its horizon.
+        requires columns
+    @kwargs: the argument filter
+    """
+
+    primary_key = db_table.__mapper__.primary_key[0]
+    position = decode_cursor(cursor, column) if cursor else None
+
+    if columns:
+        # the cursor is built from the sort column and the primary key
+        keys = {col.key for col in columns}
+        for col in (column, primary_key):
+            if col.key not in keys:
+                columns = (*columns, col)
+                keys.add(col.key)
+
+    def page_query(table):
+        """selects the page rows of the table or of its archive"""
+
+        if table is not db_table.__table__:
+            query = select(*(table.c[col.key] for col in columns))
+
+        elif columns:
+            query = select(*columns)
+
+        else:
+            query = select(db_table)
+
+        query = query.where(
+            *(table.c[key] == value for key, value in kwargs.items())
+        )
+
+        sort_column = table.c[column.key]
+        if since is not None:
+            query = query.where(sort_column >= since)
+
+        if position:
+            query = query.where(
+                after_cursor(
+                    sort_column, table.c[primary_key.key], *position
+                )
+            )
+
+        return query
+
+    query = archive.with_archive(db_table.__table__, since, page_query)
+    if since is not None and archive.reaches(since):
+        rows = query.subquery()
+        query = select(rows).order_by(
+            rows.c[column.key].desc(), rows.c[primary_key.key].desc()
+        )
+
+    else:
+        query = query.order_by(column.desc(), primary_key.desc())
+
+    query = query.limit(limit + 1)
+
+    try:
+        if columns:
+            records = (await session.execute(query)).all()
+
+        else:
+            records = (await session.scalars(query)).all()
+
+    except Exception as err:
+        logger.error(f"err at paginate => {err}")
+        raise DB_EXCEPTION
+
+    next_cursor = None
+    if len(records) > limit:
+        records = records[:limit]
+        next_cursor = encode_cursor(
+            getattr(records[-1], column.key),
+            getattr(records[-1], primary_key.key),
+        )
+
+    return records, next_cursor
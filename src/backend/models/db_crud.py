@@ -5,8 +5,11 @@
 from fastapi import HTTPException, status
 from typing import Dict, List
 from sqlalchemy.orm import Session
+import logging
 
 
+logger = logging.getLogger(__name__)
+
 QUERY_EXCEPTION = HTTPException(
     status_code=status.HTTP_404_NOT_FOUND, detail="No results found"
 )
@@ -28,7 +31,7 @@ def get_all(session: Session, table):
         data = session.query(table).all()
 
     except Exception as err:
-        print(f"err at get_all => {err}")
+        logger.error(f"err at get_all => {err}")
         raise DB_EXCEPTION
 
     return data
@@ -46,7 +49,7 @@ def get_by(session: Session, table, **kwargs):
         data = session.query(table).filter_by(**kwargs).all()
 
     except Exception as err:
-        print(f"err at get_by => {err}")
+        logger.error(f"err at get_by => {err}")
         raise DB_EXCEPTION
 
     return data
@@ -64,7 +67,7 @@ def get_specific_record(session: Session, table, **kwargs):
         record = session.query(table).filter_by(**kwargs).first()
 
     except Exception as err:
-        print(f"err at get_spec => {err}")
+        logger.error(f"err at get_spec => {err}")
         raise DB_EXCEPTION
 
     return record
@@ -85,7 +88,7 @@ def save(session: Session, db_table, record):
         session.refresh(data)
 
     except Exception as err:
-        print(f"error in save => {err}")
+        logger.error(f"error in save => {err}")
         # send yourself a mail here
         raise DB_EXCEPTION
 
@@ -157,7 +160,7 @@ def delete(session: Session, db_table, **kwargs):
 
     except Exception as err:
         # send a mail with the exception message
-        print(f"err at delete => {err}")
+        logger.error(f"err at delete => {err}")
         raise DB_EXCEPTION
 
     if not resp:
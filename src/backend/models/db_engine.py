@@ -1,27 +1,142 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import (
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
+from . import db_pool, db_sqlite
 from dotenv import load_dotenv
-import os
+import contextlib, inspect, os
+
+
+# async drivers used for the sync drivers in DATABASE_URI
+ASYNC_DRIVERS = {
+    "mysql": "mysql+aiomysql",
+    "mysql+mysqlconnector": "mysql+aiomysql",
+    "mysql+pymysql": "mysql+aiomysql",
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+}
+
+
+def async_database_uri(uri: str) -> str:
+    """returns the database uri with its driver swapped for an async one"""
+
+    url = make_url(uri)
+    drivername = ASYNC_DRIVERS.get(url.drivername, url.drivername)
+    return url.set(drivername=drivername).render_as_string(
+        hide_password=False
+    )
 
 
 load_dotenv()
+
+
+def sync_pool_options(uri: str) -> dict:
+    """returns the pool options of the sync engine of the uri"""
+
+    if db_sqlite.is_sqlite(uri):
+        return db_sqlite.pool_options(
+            uri,
+            db_pool.TimedQueuePool,
+            max(db_sqlite.SQLITE_POOL_SIZE // 4, 1),
+        )
+
+    return {
+        "poolclass": db_pool.TimedQueuePool,
+        **db_pool.pool_options(db_pool.SYNC_BUDGET),
+    }
+
+
+# used by background jobs, db_pool sizes the pools and checks their health
 engine = create_engine(
     os.getenv("DATABASE_URI"),
-    pool_size=50,
-    max_overflow=30,
-    pool_pre_ping=True,
-    pool_recycle=1800,
-    pool_timeout=60,
     echo=False,
+    **sync_pool_options(os.getenv("DATABASE_URI")),
 )
 
 SessionLocal = sessionmaker(
     autocommit=False, autoflush=False, bind=engine
 )
 
+# used by the routes, ASYNC_DATABASE_URI overrides the derived uri
+ASYNC_DATABASE_URI = os.getenv("ASYNC_DATABASE_URI") or async_database_uri(
+    os.getenv("DATABASE_URI")
+)
+
+
+
+def async_pool_options(uri: str) -> dict:
+    """returns the pool options of the async engine of the uri"""
+
+    if db_sqlite.is_sqlite(uri):
+        return db_sqlite.pool_options(
+            uri, db_pool.TimedAsyncQueuePool, db_sqlite.SQLITE_POOL_SIZE
+        )
+
+    return {
+        "poolclass": db_pool.TimedAsyncQueuePool,
+        **db_pool.pool_options(db_pool.ASYNC_BUDGET),
+    }
+
+
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URI, echo=False, **async_pool_options(ASYNC_DATABASE_URI)
+)
+
+# records can't lazy load with async sessions, so keep them loaded
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, autoflush=False, expire_on_commit=False
+)
+
+# optional read replica used by models.replica.get_read_db
+READ_DATABASE_URI = os.getenv("READ_DATABASE_URI")
+read_engine = None
+ReadSessionLocal = None
+if READ_DATABASE_URI:
+    read_uri = async_database_uri(READ_DATABASE_URI)
+    read_engine = create_async_engine(
+        read_uri, echo=False, **async_pool_options(read_uri)
+    )
+
+    ReadSessionLocal = async_sessionmaker(
+        read_engine, autoflush=False, expire_on_commit=False
+    )
+
+# the sqlite profile, see db_sqlite
+for sqlite_engine in (engine, async_engine, read_engine):
+    if sqlite_engine is not None and sqlite_engine.dialect.name == "sqlite":
+        db_sqlite.configure(sqlite_engine)
+
+db_pool.track("sync", engine)
+db_pool.track("async", async_engine)
+if read_engine is not None:
+    db_pool.track("replica", read_engine)
+
 Base = declarative_base()
 
+# coroutine functions taking the AsyncSession, awaited by commit once it
+# succeeds e.g replica.flush_writes
+after_commit_hooks = []
+
+
+async def commit(session) -> None:
+    """commits the session then awaits the after_commit_hooks
+
+    the sessions opened outside of the requests, e.g by background jobs,
+    commit with it or unit_of_work for the hooks to run
+    """
+
+    if isinstance(session, LazySession):
+        session = await session.open()
+
+    await session.commit()
+    for hook in after_commit_hooks:
+        await hook(session)
+
 
 def get_db():
     db = SessionLocal()
@@ -29,3 +144,83 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+class LazySession:
+    """an AsyncSession created on its first use
+
+    requests rejected before their first query, e.g by a role check, never
+    build a session or check out a connection.
+
+    pick_factory: optional coroutine function returning the session
+        factory, awaited on the first query. Sync calls like add() made
+        before any query use AsyncSessionLocal
+    """
+
+    def __init__(self, pick_factory=None):
+        self._pick_factory = pick_factory
+        self._session = None
+
+    async def open(self) -> AsyncSession:
+        """returns the session, creating it on the first call"""
+
+        if self._session is None:
+            factory = AsyncSessionLocal
+            if self._pick_factory is not None:
+                factory = await self._pick_factory()
+
+            # another query may have opened it while picking the factory
+            if self._session is None:
+                self._session = factory()
+
+        return self._session
+
+    async def commit(self) -> None:
+        """commits the session then awaits the after_commit_hooks"""
+
+        await commit(self)
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+
+    def __getattr__(self, name):
+        if self._session is not None:
+            return getattr(self._session, name)
+
+        if inspect.iscoroutinefunction(getattr(AsyncSession, name, None)):
+
+            async def call(*args, **kwargs):
+                session = await self.open()
+                return await getattr(session, name)(*args, **kwargs)
+
+            return call
+
+        self._session = AsyncSessionLocal()
+        return getattr(self._session, name)
+
+
+async def get_async_db():
+    db = LazySession()
+    try:
+        yield db
+    finally:
+        await db.close()
+
+
+@contextlib.asynccontextmanager
+async def unit_of_work(session):
+    """commits the changes made in the block once, rolls them back on errors
+
+    helpers only change the records, the route decides when to commit e.g
+        async with db_engine.unit_of_work(db):
+            payments_utils.update_invoice_status(invoice_record, "paid")
+    """
+
+    try:
+        yield session
+        await commit(session)
+
+    except BaseException:
+        await session.rollback()
+        raise
@@ -0,0 +1,252 @@
+# This module instruments the SQL statements run by the app
+# engine event hooks count and time every statement and add them to the
+# stats of the current request. QueryMetricsMiddleware sends the stats in
+# the Server-Timing header and aggregates them per route for /metrics/db.
+#
+# statements slower than SLOW_QUERY_MS are logged with their EXPLAIN plan,
+# and a request running the same statement N_PLUS_ONE_THRESHOLD times or
+# more is logged as a possible N+1.
+#
+# count_queries() and max_queries() give the same numbers to scripts and
+# tests, whatever thread or event loop runs the queries e.g
+#     with db_metrics.max_queries(4):
+#         client.get("/rave/checkout", ...)
+
+from sqlalchemy import event
+from starlette.datastructures import MutableHeaders
+from . import db_engine
+from collections import Counter
+from dotenv import load_dotenv
+import contextlib, contextvars, logging, os, threading, time
+
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", 200))
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", 5))
+
+
+class QueryStats:
+    """the statements run during a request or a count_queries block"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def add(self, statement: str, duration: float) -> None:
+        self.count += 1
+        self.duration += duration
+        self.statements[statement] += 1
+
+    def server_timing(self) -> str:
+        return f'db;dur={self.duration:.2f};desc="{self.count} queries"'
+
+
+# the stats of the request being handled
+request_stats = contextvars.ContextVar("request_stats", default=None)
+
+# the stats of the open count_queries blocks
+collectors = []
+collectors_lock = threading.Lock()
+
+# route => aggregated stats, see record_route
+routes = {}
+route_paths = {}
+
+
+def explain(connection, statement: str, parameters) -> str:
+    """returns the query plan of the statement"""
+
+    if connection.dialect.name == "sqlite":
+        prefix = "EXPLAIN QUERY PLAN "
+
+    else:
+        prefix = "EXPLAIN "
+
+    cursor = connection.connection.cursor()
+    try:
+        cursor.execute(prefix + statement, parameters)
+        rows = cursor.fetchall()
+
+    finally:
+        cursor.close()
+
+    return "\n".join(str(tuple(row)) for row in rows)
+
+
+def before_cursor_execute(
+    connection, cursor, statement, parameters, context, executemany
+):
+    context.query_start = time.perf_counter()
+
+
+def after_cursor_execute(
+    connection, cursor, statement, parameters, context, executemany
+):
+    duration = (time.perf_counter() - context.query_start) * 1000
+
+    stats = request_stats.get()
+    if stats is not None:
+        stats.add(statement, duration)
+
+    if collectors:
+        with collectors_lock:
+            for collector in collectors:
+                collector.add(statement, duration)
+
+    if duration < SLOW_QUERY_MS:
+        return
+
+    plan = None
+    if not executemany and statement.lstrip().upper().startswith("SELECT"):
+        try:
+            plan = explain(connection, statement, parameters)
+
+        except Exception as err:
+            plan = f"unavailable => {err}"
+
+    logger.warning(
+        f"slow query {duration:.1f}ms => {statement}\n"
+        f"parameters => {parameters}\nplan => {plan}"
+    )
+
+
+def instrument(engine) -> None:
+    """adds the statement hooks to the sync engine specified"""
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+
+
+instrument(db_engine.engine)
+instrument(db_engine.async_engine.sync_engine)
+if db_engine.read_engine is not None:
+    instrument(db_engine.read_engine.sync_engine)
+
+
+def route_path(scope) -> str:
+    """returns the path template of the route that handled the request"""
+
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return "unmatched"
+
+    if endpoint not in route_paths:
+        route_paths[endpoint] = endpoint.__name__
+        for route in scope["app"].routes:
+            if getattr(route, "endpoint", None) is endpoint:
+                route_paths[endpoint] = route.path
+                break
+
+    return route_paths[endpoint]
+
+
+def record_route(scope, stats: QueryStats, duration: float) -> None:
+    """adds the stats of a request to the stats of its route"""
+
+    route = f"{scope['method']} {route_path(scope)}"
+    if route not in routes:
+        routes[route] = {
+            "requests": 0,
+            "queries": 0,
+            "max_queries": 0,
+            "db_ms": 0.0,
+            "total_ms": 0.0,
+        }
+
+    totals = routes[route]
+    totals["requests"] += 1
+    totals["queries"] += stats.count
+    totals["max_queries"] = max(totals["max_queries"], stats.count)
+    totals["db_ms"] += stats.duration
+    totals["total_ms"] += duration
+
+    if stats.statements:
+        statement, repeats = stats.statements.most_common(1)[0]
+        if repeats >= N_PLUS_ONE_THRESHOLD:
+            logger.warning(
+                f"possible N+1 at {route}, {repeats} runs of => {statement}"
+            )
+
+
+def route_stats() -> dict:
+    """returns the aggregated query stats of every route"""
+
+    report = {}
+    for route, totals in routes.items():
+        requests = totals["requests"]
+        report[route] = {
+            "requests": requests,
+            "avg_queries": round(totals["queries"] / requests, 2),
+            "max_queries": totals["max_queries"],
+            "avg_db_ms": round(totals["db_ms"] / requests, 2),
+            "avg_total_ms": round(totals["total_ms"] / requests, 2),
+        }
+
+    return report
+
+
+class QueryMetricsMiddleware:
+    """collects the query stats of every request"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+        token = request_stats.set(stats)
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", stats.server_timing())
+
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+
+        finally:
+            request_stats.reset(token)
+            duration = (time.perf_counter() - start) * 1000
+            record_route(scope, stats, duration)
+
+
+@contextlib.contextmanager
+def count_queries():
+    """collects the statements run inside the block"""
+
+    stats = QueryStats()
+    with collectors_lock:
+        collectors.append(stats)
+
+    try:
+        yield stats
+
+    finally:
+        with collectors_lock:
+            collectors.remove(stats)
+
+
+@contextlib.contextmanager
+def max_queries(limit: int):
+    """fails when the block runs more than limit statements"""
+
+    with count_queries() as stats:
+        yield stats
+
+    if stats.count > limit:
+        statements = "\n".join(
+            f"{repeats} x {statement}"
+            for statement, repeats in stats.statements.most_common()
+        )
+        raise AssertionError(
+            f"{stats.count} queries, expected at most {limit}\n{statements}"
+        )
@@ -1,4 +1,5 @@
 from .db_engine import Base
+from sqlalchemy.orm import relationship
 from sqlalchemy import (
     Column,
     Integer,
@@ -10,11 +11,19 @@ from sqlalchemy import (
     ForeignKey,
     Date,
     Numeric,
+    Index,
+    Table,
 )
 
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        Index("ix_users_role_date_joined", "role", "date_joined"),
+        Index(
+            "ix_users_is_verified_date_joined", "is_verified", "date_joined"
+        ),
+    )
 
     user_id = Column(
         Integer,
@@ -56,6 +65,9 @@ class User(Base):
 
 class Drafts(Base):
     __tablename__ = "drafts"
+    __table_args__ = (
+        Index("ix_drafts_user_id_last_updated", "user_id", "last_updated"),
+    )
 
     draft_id = Column(
         Integer, primary_key=True, index=True, autoincrement=True
@@ -85,6 +97,19 @@ class Drafts(Base):
 
 class Files(Base):
     __tablename__ = "files"
+    __table_args__ = (
+        Index(
+            "ix_files_owner_id_folder_date_uploaded",
+            "owner_id",
+            "folder",
+            "date_uploaded",
+        ),
+        Index(
+            "ix_files_owner_id_date_uploaded", "owner_id", "date_uploaded"
+        ),
+        # used by routes.export
+        Index("ix_files_date_uploaded", "date_uploaded"),
+    )
 
     file_id = Column(
         String(50), primary_key=True, index=True, nullable=False
@@ -114,6 +139,9 @@ class Files(Base):
 
 class RecievedNotes(Base):
     __tablename__ = "received_notes"
+    __table_args__ = (
+        Index("ix_received_notes_to_id_sent_time", "to_id", "sent_time"),
+    )
 
     ref_id = Column(Integer, primary_key=True, autoincrement=True)
     title = Column(String(250), nullable=False)
@@ -128,6 +156,8 @@ class RecievedNotes(Base):
 
     sent_time = Column(DateTime)
 
+    recipient = relationship("User", lazy="raise")
+
     def __repr__(self):
         return "RecievedNotes({}, {}, {}, {})".format(
             self.title, self.content, self.from_id, self.from_name
@@ -145,12 +175,55 @@ class RecievedNotes(Base):
 
 class Invoices(Base):
     __tablename__ = "invoices"
+    __table_args__ = (
+        Index(
+            "ix_invoices_to_user_id_status_paid_created_at",
+            "to_user_id",
+            "status",
+            "paid",
+            "created_at",
+        ),
+        Index(
+            "ix_invoices_status_paid_created_at",
+            "status",
+            "paid",
+            "created_at",
+        ),
+        Index(
+            "ix_invoices_to_user_id_created_at", "to_user_id", "created_at"
+        ),
+        Index(
+            "ix_invoices_to_user_id_paid_paid_at",
+            "to_user_id",
+            "paid",
+            "paid_at",
+        ),
+        Index("ix_invoices_paid_paid_at", "paid", "paid_at"),
+        Index("ix_invoices_created_at", "created_at"),
+        # used by models.expiry
+        Index("ix_invoices_status_due_date", "status", "due_date"),
+    )
 
     inv_id = Column(String(16), primary_key=True, index=True)
     title = Column(String(50), nullable=False)
     desc = Column(String(100), nullable=False)
     price = Column(Numeric(precision=15, scale=2), nullable=False)
     to_email = Column(String(30), nullable=False)
+    to_user_id = Column(
+        Integer, ForeignKey("users.user_id", ondelete="SET NULL")
+    )
+
+    # the relationships are never lazy loaded, async sessions can't do it,
+    # load them with the selectinload or joinedload options
+    payments = relationship(
+        "Payments",
+        back_populates="invoice",
+        lazy="raise",
+        order_by="Payments.ref_id.desc()",
+        passive_deletes=True,
+    )
+
+    to_user = relationship("User", lazy="raise")
     created_at = Column(DateTime, nullable=False)
     created_by = Column(String(50), nullable=False)
     due_date = Column(Date, nullable=False)
@@ -178,6 +251,26 @@ class Invoices(Base):
 
 class Payments(Base):
     __tablename__ = "payments"
+    __table_args__ = (
+        Index(
+            "ix_payments_payer_id_status_ref_id",
+            "payer_id",
+            "status",
+            "ref_id",
+        ),
+        Index("ix_payments_payer_id_paid_at", "payer_id", "paid_at"),
+        Index(
+            "ix_payments_payer_id_paid_paid_at",
+            "payer_id",
+            "paid",
+            "paid_at",
+        ),
+        Index("ix_payments_inv_id_status", "inv_id", "status"),
+        Index("ix_payments_status_ref_id", "status", "ref_id"),
+        Index("ix_payments_paid_ref_id", "paid", "ref_id"),
+        Index("ix_payments_paid_paid_at", "paid", "paid_at"),
+        Index("ix_payments_paid_at", "paid_at"),
+    )
 
     ref_id = Column(
         String(15), primary_key=True, nullable=False, index=True
@@ -197,11 +290,23 @@ class Payments(Base):
     status = Column(String(15))
     paid_by = Column(String(30))
     payer_email = Column(String(30))
+    payer_id = Column(
+        Integer, ForeignKey("users.user_id", ondelete="SET NULL")
+    )
     paid_at = Column(DateTime)
     paid_amount = Column(Numeric(precision=15, scale=2))
     checkout_type = Column(String(30))
     payment_type = Column(String(15))
 
+    # bumped by every status change, see payments_utils.transition
+    version = Column(Integer, nullable=False, default=0, server_default="0")
+
+    invoice = relationship(
+        "Invoices", back_populates="payments", lazy="raise"
+    )
+
+    payer = relationship("User", lazy="raise")
+
     def __str__(self):
         return "(refID: {}, invoiceID: {}, amount: {}, paid: {}, status: {}, client: {}, checkout_type: {}, payment_type: {}".format(
             self.ref_id,
@@ -213,3 +318,71 @@ class Payments(Base):
             self.checkout_type,
             self.payment_type,
         )
+
+
+class Summaries(Base):
+    """the invoice and payment counters kept by models.summary"""
+
+    __tablename__ = "summaries"
+
+    # 0 holds the counters of all the users
+    user_id = Column(Integer, primary_key=True, autoincrement=False)
+    kind = Column(String(10), primary_key=True)
+    status = Column(String(15), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    total = Column(
+        Numeric(precision=18, scale=2), nullable=False, default=0
+    )
+
+
+class ReplicaHeartbeat(Base):
+    __tablename__ = "replica_heartbeat"
+
+    beat_id = Column(Integer, primary_key=True)
+    beat_at = Column(DateTime, nullable=False)
+
+
+def archive_table(table, name: str, *indexes) -> Table:
+    """builds the table holding the rows of table moved by models.archive,
+    with the same columns and the time they were archived
+    """
+
+    columns = [
+        Column(
+            column.name,
+            column.type,
+            primary_key=column.primary_key,
+            nullable=column.nullable,
+        )
+        for column in table.columns
+    ]
+
+    return Table(
+        name,
+        Base.metadata,
+        *columns,
+        Column("archived_at", DateTime, nullable=False),
+        *indexes,
+    )
+
+
+invoices_archive = archive_table(
+    Invoices.__table__,
+    "invoices_archive",
+    Index(
+        "ix_invoices_archive_to_user_id_created_at",
+        "to_user_id",
+        "created_at",
+    ),
+    Index("ix_invoices_archive_paid_paid_at", "paid", "paid_at"),
+    Index("ix_invoices_archive_created_at", "created_at"),
+)
+
+payments_archive = archive_table(
+    Payments.__table__,
+    "payments_archive",
+    Index("ix_payments_archive_payer_id_paid_at", "payer_id", "paid_at"),
+    Index("ix_payments_archive_paid_paid_at", "paid", "paid_at"),
+    Index("ix_payments_archive_paid_at", "paid_at"),
+    Index("ix_payments_archive_inv_id", "inv_id"),
+)
@@ -0,0 +1,223 @@
+# This module sizes and watches the database connection pools
+# DB_POOL_BUDGET is the number of connections all the workers of the app
+# may open to the database server, it's shared between the WEB_CONCURRENCY
+# workers and, inside a worker, between the async engine used by the routes
+# and the sync engine used by background jobs. Keep it below the server
+# max_connections minus the connections of other clients.
+#
+# every checkout is tracked with the stack that acquired it, monitor() logs
+# the connections held longer than DB_LEAK_SECONDS with that stack, only
+# read into a traceback for those leaks. It also pings each engine every
+# DB_HEALTH_INTERVAL seconds instead of pre_ping adding a round trip to
+# every checkout, a dead connection invalidates the whole pool so the next
+# checkouts reconnect.
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from dotenv import load_dotenv
+import asyncio, greenlet, logging, os, sys, time, traceback
+
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+DB_POOL_BUDGET = int(os.getenv("DB_POOL_BUDGET", 100))
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", 1))
+POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", 30))
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+LEAK_SECONDS = float(os.getenv("DB_LEAK_SECONDS", 30))
+HEALTH_INTERVAL = float(os.getenv("DB_HEALTH_INTERVAL", 15))
+
+# the connections one worker may open, the sync engine gets a fifth
+WORKER_BUDGET = max(DB_POOL_BUDGET // WEB_CONCURRENCY, 2)
+SYNC_BUDGET = max(WORKER_BUDGET // 5, 1)
+ASYNC_BUDGET = max(WORKER_BUDGET - SYNC_BUDGET, 1)
+
+# name => engine of the tracked pools
+engines = {}
+
+# id of the connection record => (pool name, checkout time, stack, reported)
+checkouts = {}
+
+
+def pool_options(budget: int) -> dict:
+    """returns the pool options keeping the connections within budget"""
+
+    pool_size = max(budget * 3 // 4, 1)
+    return {
+        "pool_size": pool_size,
+        "max_overflow": budget - pool_size,
+        "pool_timeout": POOL_TIMEOUT,
+        "pool_recycle": POOL_RECYCLE,
+    }
+
+
+class TimedPoolMixin:
+    """records how long checkouts wait for a free connection"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+
+        finally:
+            wait = (time.perf_counter() - start) * 1000
+            stats = self.__dict__.setdefault(
+                "wait_stats", {"checkouts": 0, "wait_ms": 0.0, "max_ms": 0.0}
+            )
+            stats["checkouts"] += 1
+            stats["wait_ms"] += wait
+            stats["max_ms"] = max(stats["max_ms"], wait)
+
+
+class TimedQueuePool(TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def acquiring_stack() -> list:
+    """returns the (code, line) of the frames checking out a connection
+
+    walking the frames is cheap, the stack is only formatted with its
+    source lines by format_stack when the checkout turns out to leak
+    """
+
+    frame = sys._getframe(2)
+    current = greenlet.getcurrent()
+    if current.parent is not None and current.parent.gr_frame is not None:
+        # async engines check out from a greenlet spawned by the coroutine
+        frame = current.parent.gr_frame
+
+    stack = []
+    while frame is not None:
+        stack.append((frame.f_code, frame.f_lineno))
+        frame = frame.f_back
+
+    return stack
+
+
+def format_stack(stack: list) -> str:
+    """formats a stack of acquiring_stack like a traceback"""
+
+    # the pool internals don't help finding the leak
+    return "".join(
+        traceback.format_list(
+            [
+                traceback.FrameSummary(code.co_filename, line, code.co_name)
+                for code, line in reversed(stack)
+                if f"{os.sep}sqlalchemy{os.sep}" not in code.co_filename
+            ]
+        )
+    )
+
+
+def track(name: str, engine) -> None:
+    """tracks the pool of the engine specified, sync or async"""
+
+    engines[name] = engine
+    if LEAK_SECONDS <= 0:
+        return
+
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        checkouts[id(connection_record)] = [
+            name,
+            time.monotonic(),
+            acquiring_stack(),
+            False,
+        ]
+
+    @event.listens_for(sync_engine, "checkin")
+    def on_checkin(dbapi_connection, connection_record):
+        checkouts.pop(id(connection_record), None)
+
+
+def find_leaks() -> int:
+    """logs the connections held longer than LEAK_SECONDS and returns
+    their number
+    """
+
+    now = time.monotonic()
+    leaks = 0
+    for checkout in list(checkouts.values()):
+        name, checked_out_at, stack, reported = checkout
+        held = now - checked_out_at
+        if held < LEAK_SECONDS:
+            continue
+
+        leaks += 1
+        if not reported:
+            checkout[3] = True
+            logger.warning(
+                f"{name} connection held for {held:.0f}s, acquired at\n"
+                + format_stack(stack)
+            )
+
+    return leaks
+
+
+def pool_stats() -> dict:
+    """returns the state of the tracked pools"""
+
+    now = time.monotonic()
+    report = {}
+    for name, engine in engines.items():
+        pool = getattr(engine, "sync_engine", engine).pool
+        waits = getattr(pool, "wait_stats", None) or {"checkouts": 0}
+        held = [
+            now - checked_out_at
+            for pool_name, checked_out_at, *_ in list(checkouts.values())
+            if pool_name == name
+        ]
+
+        report[name] = {
+            "pool": type(pool).__name__,
+            "size": getattr(pool, "size", lambda: None)(),
+            "checked_out": len(held),
+            "overflow": getattr(pool, "overflow", lambda: None)(),
+            "checkouts": waits["checkouts"],
+            "avg_wait_ms": round(
+                waits.get("wait_ms", 0) / (waits["checkouts"] or 1), 3
+            ),
+            "max_wait_ms": round(waits.get("max_ms", 0), 3),
+            "longest_held_s": round(max(held, default=0), 3),
+        }
+
+    return report
+
+
+def ping(engine) -> None:
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+
+
+async def check_liveness() -> None:
+    """pings every tracked engine, a disconnect invalidates its pool"""
+
+    for name, engine in engines.items():
+        try:
+            if isinstance(engine, AsyncEngine):
+                async with engine.connect() as connection:
+                    await connection.execute(text("SELECT 1"))
+
+            else:
+                await run_in_threadpool(ping, engine)
+
+        except Exception as err:
+            logger.error(f"err at {name} db liveness check => {err}")
+
+
+async def monitor() -> None:
+    """checks the pools every HEALTH_INTERVAL seconds"""
+
+    while True:
+        await asyncio.sleep(HEALTH_INTERVAL)
+        await check_liveness()
+        find_leaks()
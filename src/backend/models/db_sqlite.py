@@ -0,0 +1,83 @@
+# This module is the SQLite profile of the app, used when DATABASE_URI is
+# a sqlite uri e.g sqlite:///japa.sqlite, for single node deployments,
+# tests and benchmarks.
+#
+# the connections are pooled instead of opened per checkout, the pool is
+# SQLITE_POOL_SIZE connections as sqlite serves a single node. Each
+# connection sets
+#   - journal_mode=WAL, the readers and the writer don't block each other
+#   - synchronous=NORMAL, commits are only synced to disk at checkpoints
+#   - mmap_size, the reads go through memory mapped I/O
+#   - busy_timeout, a writer waits for the write lock instead of failing
+# in-memory databases keep the sqlalchemy pools, each connection would
+# get a database of its own otherwise.
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from . import db_pool
+from dotenv import load_dotenv
+import os
+
+
+load_dotenv()
+
+SQLITE_POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", 8))
+# bytes
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", 268435456))
+# milliseconds
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", 5000))
+
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": SQLITE_MMAP_SIZE,
+    "busy_timeout": SQLITE_BUSY_TIMEOUT,
+    "temp_store": "MEMORY",
+    # KiB when negative
+    "cache_size": -16000,
+}
+
+
+def is_sqlite(uri: str) -> bool:
+    return make_url(uri).get_backend_name() == "sqlite"
+
+
+def is_file_db(uri: str) -> bool:
+    url = make_url(uri)
+    return url.database not in (None, "", ":memory:") and (
+        url.query.get("mode") != "memory"
+    )
+
+
+def pool_options(uri: str, poolclass, pool_size: int) -> dict:
+    """returns the pool options of the engine of the sqlite uri"""
+
+    if not is_file_db(uri):
+        return {}
+
+    return {
+        "poolclass": poolclass,
+        "pool_size": pool_size,
+        "max_overflow": 0,
+        "pool_timeout": db_pool.POOL_TIMEOUT,
+    }
+
+
+def set_pragmas(dbapi_connection, connection_record):
+    """tunes the new connection"""
+
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+
+    finally:
+        cursor.close()
+
+
+def configure(engine) -> None:
+    """tunes the connections of the sync or async engine specified"""
+
+    event.listen(
+        getattr(engine, "sync_engine", engine), "connect", set_pragmas
+    )
@@ -0,0 +1,258 @@
+# This module gives every request a deadline and enforces it
+# ROUTE_BUDGETS declares the seconds an endpoint may take, the other
+# endpoints get REQUEST_BUDGET_SECONDS. DeadlineMiddleware:
+#   - cancels the handler and answers 504 once the budget is spent
+#   - cancels the handler when the client disconnects
+# background tasks run after the response aren't limited. The budget of
+# the STREAMED_ROUTES only runs until they start responding, a stream cut
+# at the deadline would still look like a complete 200 to the client.
+#
+# the statements of the request get the time left as a statement timeout,
+# a MAX_EXECUTION_TIME hint on mysql SELECTs and a progress handler on
+# sqlite, and remaining() gives the time left to the calls to external
+# services e.g
+#     requests.get(url, timeout=deadlines.remaining(8))
+
+from sqlalchemy import event
+from sqlalchemy.util import await_only
+from starlette.responses import JSONResponse
+from starlette.routing import Match
+from . import db_engine
+from dotenv import load_dotenv
+import asyncio, contextlib, contextvars, inspect, os, time
+
+
+load_dotenv()
+
+REQUEST_BUDGET = float(os.getenv("REQUEST_BUDGET_SECONDS", 30))
+
+# "<METHOD> <path>" => seconds the endpoint may take
+ROUTE_BUDGETS = {
+    "GET /payments/totalRevenue": 10,
+    "GET /payments/totalSpend": 5,
+    "POST /documents/upload": 60,
+    "GET /flutterwave/checkoutModal": 15,
+    "GET /flutterwave/bankTransfer": 15,
+    "GET /flutterwave/verifyPayments": 10,
+}
+
+# the endpoints streaming their response, only the client leaving stops
+# them once the response started
+STREAMED_ROUTES = {
+    "GET /export/invoices",
+    "GET /export/payments",
+    "GET /export/files",
+}
+
+# instructions sqlite runs between the deadline checks
+SQLITE_CHECK_INTERVAL = 1000
+
+# seconds the statements run past the deadline, so the 504 is sent before
+# the error of the statement stopped
+STATEMENT_GRACE = 0.05
+
+
+class Deadline:
+    """the end of the budget of a request, cleared once it's answered"""
+
+    def __init__(self, end: float):
+        self.end = end
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+# the deadline of the request being handled
+deadline = contextvars.ContextVar("deadline", default=None)
+
+
+def current_end() -> float | None:
+    """returns the monotonic time the request must be answered by"""
+
+    current = deadline.get()
+    return current.end if current is not None else None
+
+
+def remaining(limit: float | None = None) -> float | None:
+    """returns the seconds left to answer the request, at most limit, and
+    limit when there's no deadline
+    """
+
+    end = current_end()
+    if end is None:
+        return limit
+
+    left = max(end - time.monotonic(), 0.001)
+    return left if limit is None else min(left, limit)
+
+
+def limit_statement(
+    connection, cursor, statement, parameters, context, executemany
+):
+    """gives the statement the time left as its timeout"""
+
+    end = current_end()
+    if end is not None:
+        end += STATEMENT_GRACE
+
+    if connection.dialect.name == "sqlite":
+        # read by the progress handler set by limit_sqlite
+        connection.connection.info["deadline"] = end
+
+    if end is None:
+        return statement, parameters
+
+    left = end - time.monotonic()
+    if left <= 0:
+        raise DeadlineExceeded("request deadline exceeded")
+
+    if connection.dialect.name == "mysql":
+        stripped = statement.lstrip()
+        if stripped[:6].upper() == "SELECT":
+            statement = (
+                f"SELECT /*+ MAX_EXECUTION_TIME({int(left * 1000)}) */"
+                + stripped[6:]
+            )
+
+    return statement, parameters
+
+
+def limit_sqlite(dbapi_connection, connection_record):
+    """interrupts the statements of the connection past their deadline"""
+
+    state = connection_record.info
+
+    def past_deadline():
+        end = state.get("deadline")
+        return end is not None and time.monotonic() > end
+
+    driver_connection = connection_record.driver_connection
+    if inspect.iscoroutinefunction(driver_connection.set_progress_handler):
+        # aiosqlite runs the connection in its own thread
+        await_only(
+            driver_connection.set_progress_handler(
+                past_deadline, SQLITE_CHECK_INTERVAL
+            )
+        )
+
+    else:
+        driver_connection.set_progress_handler(
+            past_deadline, SQLITE_CHECK_INTERVAL
+        )
+
+
+def instrument(engine) -> None:
+    """adds the statement timeouts to the sync engine specified"""
+
+    event.listen(
+        engine, "before_cursor_execute", limit_statement, retval=True
+    )
+
+    if engine.dialect.name == "sqlite":
+        event.listen(engine, "connect", limit_sqlite)
+
+
+instrument(db_engine.engine)
+instrument(db_engine.async_engine.sync_engine)
+if db_engine.read_engine is not None:
+    instrument(db_engine.read_engine.sync_engine)
+
+
+def route_name(scope) -> str | None:
+    """returns the "<METHOD> <path>" of the endpoint the request is for"""
+
+    for route in scope["app"].routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return f"{scope['method']} {route.path}"
+
+    return None
+
+
+def route_budget(scope) -> float:
+    """returns the budget of the endpoint the request is for"""
+
+    return ROUTE_BUDGETS.get(route_name(scope), REQUEST_BUDGET)
+
+
+class DeadlineMiddleware:
+    """cancels the requests past their budget or whose client left"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        budget = route_budget(scope)
+        streamed = route_name(scope) in STREAMED_ROUTES
+        current = Deadline(time.monotonic() + budget)
+        token = deadline.set(current)
+
+        # only the pump reads the client messages, it passes them on to
+        # the app and notices the disconnects while the app is busy
+        messages = asyncio.Queue(maxsize=1)
+        response = {"started": False, "complete": False}
+
+        async def pump():
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    if not response["complete"]:
+                        app_task.cancel()
+
+                    await messages.put(message)
+                    return
+
+                await messages.put(message)
+
+        async def send_tracked(message):
+            if message["type"] == "http.response.start":
+                response["started"] = True
+                if streamed:
+                    # the statements of the stream aren't limited either
+                    current.end = None
+
+            elif message["type"] == "http.response.body" and not (
+                message.get("more_body", False)
+            ):
+                response["complete"] = True
+                # the background tasks run after this aren't limited
+                current.end = None
+
+            await send(message)
+
+        app_task = asyncio.create_task(
+            self.app(scope, messages.get, send_tracked)
+        )
+        deadline.reset(token)
+        pump_task = asyncio.create_task(pump())
+
+        try:
+            done, _ = await asyncio.wait({app_task}, timeout=budget)
+            if not done and not response["complete"] and not (
+                streamed and response["started"]
+            ):
+                app_task.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await app_task
+
+                if not response["started"]:
+                    timeout = JSONResponse(
+                        {"detail": "request took too long to process"},
+                        status_code=504,
+                    )
+                    await timeout(scope, receive, send)
+
+                return
+
+            # the client left, the background tasks or a stream are still
+            # running
+            with contextlib.suppress(asyncio.CancelledError):
+                await app_task
+
+        finally:
+            pump_task.cancel()
@@ -0,0 +1,81 @@
+# This module expires the unpaid invoices past their due date
+# run() marks every pending invoice whose due_date has passed as expired
+# in a single UPDATE on the (status, due_date) index, so the status of an
+# invoice is all the listings filter on and checkouts don't write it.
+#
+# the app runs it on startup and every EXPIRY_INTERVAL seconds, set it to
+# 0 and run `python -m models.expiry` from src/backend instead, e.g from
+# cron, when a separate worker should do it.
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func, select, update
+from . import db_engine, db_models, summary
+from dotenv import load_dotenv
+import asyncio, datetime, logging, os
+
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# seconds, 0 leaves the expiry to `python -m models.expiry`
+EXPIRY_INTERVAL = float(os.getenv("EXPIRY_INTERVAL", 3600))
+
+
+def run(engine=None, today: datetime.date | None = None) -> int:
+    """expires the pending invoices due before today, returns their count"""
+
+    engine = engine or db_engine.engine
+    today = today or datetime.date.today()
+    invoices = db_models.Invoices
+
+    due = (
+        invoices.status == "pending",
+        invoices.due_date < today,
+        invoices.paid == False,
+    )
+
+    with engine.begin() as connection:
+        # the summary counters move with the invoices, in the transaction
+        expiring = connection.execute(
+            select(
+                invoices.to_user_id,
+                func.count().label("count"),
+                func.sum(invoices.price).label("total"),
+            )
+            .where(*due)
+            .group_by(invoices.to_user_id)
+            .with_for_update()
+        ).all()
+
+        result = connection.execute(
+            update(invoices).where(*due).values(status="expired")
+        )
+
+        deltas = {}
+        for row in expiring:
+            user_id, count, total = row.to_user_id, row.count, row.total
+            summary.add(deltas, "invoices", user_id, "pending", -count, -total)
+            summary.add(deltas, "invoices", user_id, "expired", count, total)
+
+        if deltas:
+            connection.execute(summary.upsert(deltas))
+
+    logger.info(f"expired invoices => {result.rowcount}")
+    return result.rowcount
+
+
+async def expire_periodically() -> None:
+    """expires the invoices due every EXPIRY_INTERVAL seconds"""
+
+    while True:
+        try:
+            await run_in_threadpool(run)
+
+        except Exception as err:
+            logger.error(f"err at expiry run => {err}")
+
+        await asyncio.sleep(EXPIRY_INTERVAL)
+
+
+if __name__ == "__main__":
+    print(f"expired invoices => {run()}")
@@ -1,18 +1,94 @@
-import redis
+# This module holds the redis clients shared by the whole app
+# the sync and async clients are created once per process from REDIS_URL,
+# each with its own connection pool. main.lifespan checks the connection
+# on startup and closes both pools on shutdown.
+#
+# the async client is tied to the running event loop, so callers should
+# get it from async_redis_factory() when needed instead of keeping it.
+
+from dotenv import load_dotenv
+import os, redis
+import redis.asyncio as async_redis
+
+
+load_dotenv()
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 100))
+
+redis_client = None
+async_redis_client = None
 
 
 def redis_factory():
-    redis_client = redis.StrictRedis(
-        host="localhost",
-        port=6379,
-        db=0,
-        encoding="utf-8",
-        decode_responses=True,
-        max_connections=100,
-    )
-
-    # check if key revoke_tokens exist
-    if not redis_client.exists("revoked_tokens"):
-        redis_client.lpush("revoked_tokens", "all revoked tokens")
+    """returns the app wide redis client"""
+
+    global redis_client
+    if redis_client is None:
+        redis_client = redis.from_url(
+            REDIS_URL,
+            encoding="utf-8",
+            decode_responses=True,
+            max_connections=REDIS_MAX_CONNECTIONS,
+        )
 
     return redis_client
+
+
+def async_redis_factory():
+    """returns the app wide redis.asyncio client"""
+
+    global async_redis_client
+    if async_redis_client is None:
+        async_redis_client = async_redis.from_url(
+            REDIS_URL,
+            encoding="utf-8",
+            decode_responses=True,
+            max_connections=REDIS_MAX_CONNECTIONS,
+        )
+
+    return async_redis_client
+
+
+def pipeline(*commands) -> list:
+    """runs the commands in a single round trip and returns their results
+
+    each command is a tuple of the redis method and its arguments e.g
+    pipeline(("get", key), ("delete", key))
+    """
+
+    pipe = redis_factory().pipeline(transaction=False)
+    for name, *args in commands:
+        getattr(pipe, name)(*args)
+
+    return pipe.execute()
+
+
+async def async_pipeline(*commands) -> list:
+    """pipeline() on the async client, for the async handlers"""
+
+    async with async_redis_factory().pipeline(transaction=False) as pipe:
+        for name, *args in commands:
+            getattr(pipe, name)(*args)
+
+        return await pipe.execute()
+
+
+async def open_redis() -> None:
+    """checks both clients can reach the redis server"""
+
+    redis_factory().ping()
+    await async_redis_factory().ping()
+
+
+async def close_redis() -> None:
+    """closes the connection pools of both clients"""
+
+    global async_redis_client
+    if redis_client is not None:
+        # the sync client reconnects on its next command
+        redis_client.close()
+
+    if async_redis_client is not None:
+        await async_redis_client.aclose()
+        async_redis_client = None
@@ -0,0 +1,164 @@
+# This module routes the reads of the GET endpoints to the read replica
+# setting READ_DATABASE_URI enables the replica, get_read_db then hands out
+# replica sessions except when:
+#   - the client asks for the primary with the "X-Read-Consistency: primary"
+#     header, e.g when polling a payment status right after checkout
+#   - the active user committed a write in the last
+#     READ_YOUR_WRITES_SECONDS, so users always see their own changes
+#   - the replica lags more than REPLICA_MAX_LAG seconds or can't be reached
+#
+# monitor_lag measures the lag every REPLICA_LAG_INTERVAL seconds, it writes
+# a timestamp to the replica_heartbeat table of the primary and compares
+# the previous one with the timestamp the replica has.
+
+from fastapi import Request
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+from redis.exceptions import RedisError
+from . import db_engine, db_models, redis_db
+from dotenv import load_dotenv
+import asyncio, contextvars, datetime, logging, os
+
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG", 5))
+REPLICA_LAG_INTERVAL = float(os.getenv("REPLICA_LAG_INTERVAL", 5))
+READ_YOUR_WRITES_SECONDS = int(os.getenv("READ_YOUR_WRITES_SECONDS", 10))
+
+CONSISTENCY_HEADER = "X-Read-Consistency"
+RECENT_WRITE_PREFIX = "recent_write:"
+# session.info key of the users whose writes flush_writes records
+WRITTEN_BY = "written_by"
+
+# the user of the request, set by oauth2_users.verify_token
+current_user = contextvars.ContextVar("current_user", default=None)
+
+# seconds the replica is behind the primary, None when unknown
+replica_lag = None
+
+
+@event.listens_for(Session, "after_commit")
+def mark_write(session) -> None:
+    """notes the active user committed a write, see flush_writes"""
+
+    mark_user_write(session, current_user.get())
+
+
+def mark_user_write(session, user_id) -> None:
+    """notes the session writes the records of the user, for the jobs
+    writing without an active user e.g the payment confirmations
+    """
+
+    if db_engine.read_engine is None or user_id is None:
+        return
+
+    session.info.setdefault(WRITTEN_BY, set()).add(user_id)
+
+
+async def flush_writes(session) -> None:
+    """sends the reads of the users who wrote to the primary for a while
+
+    awaited by db_engine.commit after the commits of the request sessions,
+    before the route answers, and of the jobs, so the next request of the
+    user already reads the primary
+    """
+
+    written_by = session.info.pop(WRITTEN_BY, None)
+    if not written_by:
+        return
+
+    client = redis_db.async_redis_factory()
+    try:
+        for user_id in written_by:
+            await client.set(
+                RECENT_WRITE_PREFIX + str(user_id),
+                1,
+                ex=READ_YOUR_WRITES_SECONDS,
+            )
+
+    except RedisError as err:
+        # the write is committed, the user may read the replica a bit early
+        logger.error(f"err at marking write => {err}")
+
+
+db_engine.after_commit_hooks.append(flush_writes)
+
+
+async def use_replica(request: Request) -> bool:
+    """checks if the reads of the request can go to the replica"""
+
+    if db_engine.ReadSessionLocal is None:
+        return False
+
+    if request.headers.get(CONSISTENCY_HEADER, "").lower() == "primary":
+        return False
+
+    if replica_lag is None or replica_lag > REPLICA_MAX_LAG:
+        return False
+
+    user_id = current_user.get()
+    if user_id is not None and await redis_db.async_redis_factory().exists(
+        RECENT_WRITE_PREFIX + str(user_id)
+    ):
+        return False
+
+    return True
+
+
+async def get_read_db(request: Request):
+    """session for read only routes, bound to the replica when usable
+
+    the replica is picked on the first query, once the user is known
+    """
+
+    async def pick_factory():
+        if await use_replica(request):
+            return db_engine.ReadSessionLocal
+
+        return db_engine.AsyncSessionLocal
+
+    db = db_engine.LazySession(pick_factory)
+    try:
+        yield db
+    finally:
+        await db.close()
+
+
+async def measure_lag() -> float | None:
+    """writes a new heartbeat and returns the seconds the replica is
+    behind the previous one, None if the replica doesn't have it
+    """
+
+    table = db_models.ReplicaHeartbeat
+    query = select(table.beat_at).where(table.beat_id == 1)
+    async with db_engine.AsyncSessionLocal() as primary:
+        primary_beat = await primary.scalar(query)
+        await primary.merge(
+            table(beat_id=1, beat_at=datetime.datetime.utcnow())
+        )
+        await primary.commit()
+
+    async with db_engine.ReadSessionLocal() as replica:
+        replica_beat = await replica.scalar(query)
+
+    if primary_beat is None or replica_beat is None:
+        return None
+
+    return max((primary_beat - replica_beat).total_seconds(), 0.0)
+
+
+async def monitor_lag() -> None:
+    """updates replica_lag every REPLICA_LAG_INTERVAL seconds"""
+
+    global replica_lag
+    while True:
+        try:
+            replica_lag = await measure_lag()
+
+        except Exception as err:
+            replica_lag = None
+            logger.error(f"err at replica lag check => {err}")
+
+        await asyncio.sleep(REPLICA_LAG_INTERVAL)
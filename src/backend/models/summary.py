@@ -0,0 +1,188 @@
+# This module keeps the invoice and payment counters of the dashboards
+# the summaries table holds the count and total of the invoices and the
+# payments of every user in each status, and of all the users under
+# ALL_USERS. The code changing a status adjusts them in the same
+# transaction with a single upsert, e.g
+#     await summary.move(db, "invoices", user_id, "pending", "paid", price)
+# so /invoice/summary reads a few rows instead of the records.
+#
+# rebuild() recomputes the counters from the invoices and payments, the
+# archived ones included. Run it with `python -m models.summary` from
+# src/backend when they're off, e.g after editing records by hand.
+
+from sqlalchemy import case, delete, func, insert, literal, select
+from sqlalchemy.dialects import mysql, sqlite
+from . import db_engine, db_models
+from decimal import Decimal
+import json, logging
+
+
+logger = logging.getLogger(__name__)
+
+# the user_id of the counters of all the users
+ALL_USERS = 0
+
+summaries = db_models.Summaries.__table__
+
+
+def add(deltas: dict, kind: str, user_id, status, count, total) -> dict:
+    """adds a change to the counters of the user and of all the users
+
+    deltas: (user_id, kind, status) => [count, total], changes of
+        the same counter are merged
+    """
+
+    owners = (ALL_USERS,) if user_id is None else (user_id, ALL_USERS)
+    for owner in owners:
+        delta = deltas.setdefault((owner, kind, status), [0, Decimal(0)])
+        delta[0] += count
+        delta[1] += Decimal(str(total or 0))
+
+    return deltas
+
+
+def invoice_status(record) -> str:
+    """returns the status counting the invoice, see invoice_counters"""
+
+    return record.status or ("paid" if record.paid else "pending")
+
+
+def counter_rows(deltas: dict) -> list[dict]:
+    """returns the rows of the summaries table holding the deltas"""
+
+    return [
+        {
+            "user_id": user_id,
+            "kind": kind,
+            "status": status,
+            "count": count,
+            "total": total,
+        }
+        for (user_id, kind, status), (count, total) in deltas.items()
+    ]
+
+
+def upsert(deltas: dict):
+    """returns the statement adding the deltas to the counters"""
+
+    rows = counter_rows(deltas)
+    if db_engine.engine.dialect.name == "mysql":
+        statement = mysql.insert(summaries).values(rows)
+        return statement.on_duplicate_key_update(
+            count=summaries.c.count + statement.inserted.count,
+            total=summaries.c.total + statement.inserted.total,
+        )
+
+    statement = sqlite.insert(summaries).values(rows)
+    return statement.on_conflict_do_update(
+        index_elements=["user_id", "kind", "status"],
+        set_={
+            "count": summaries.c.count + statement.excluded.count,
+            "total": summaries.c.total + statement.excluded.total,
+        },
+    )
+
+
+async def adjust(db, kind: str, user_id, *changes) -> None:
+    """adds the (status, count, total) changes to the counters of the user
+
+    db: the session changing the records, the route commits both
+    """
+
+    deltas = {}
+    for status, count, total in changes:
+        add(deltas, kind, user_id, status, count, total)
+
+    await db.execute(upsert(deltas))
+
+
+async def move(
+    db, kind: str, user_id, old_status, new_status, total, new_total=None
+) -> None:
+    """moves a record from the old status counters to the new ones"""
+
+    total = Decimal(str(total))
+    new_total = total if new_total is None else Decimal(str(new_total))
+    if old_status == new_status and total == new_total:
+        return
+
+    await adjust(
+        db,
+        kind,
+        user_id,
+        (old_status, -1, -total),
+        (new_status, 1, new_total),
+    )
+
+
+def invoice_counters(table):
+    """selects the counters of the invoices of the table"""
+
+    status = func.coalesce(
+        table.c.status,
+        case((table.c.paid == True, "paid"), else_="pending"),
+    )
+    return select(
+        table.c.to_user_id.label("user_id"),
+        literal("invoices").label("kind"),
+        status.label("status"),
+        func.count().label("count"),
+        func.coalesce(func.sum(table.c.price), 0).label("total"),
+    ).group_by(table.c.to_user_id, status)
+
+
+def payment_counters(table):
+    """selects the counters of the payments of the table"""
+
+    return select(
+        table.c.payer_id.label("user_id"),
+        literal("payments").label("kind"),
+        table.c.status,
+        func.count().label("count"),
+        func.coalesce(func.sum(table.c.amount), 0).label("total"),
+    ).group_by(table.c.payer_id, table.c.status)
+
+
+def recompute(connection) -> int:
+    """replaces the counters with the ones of the records, returns the
+    number of counters
+    """
+
+    deltas = {}
+    for query in (
+        invoice_counters(db_models.Invoices.__table__),
+        invoice_counters(db_models.invoices_archive),
+        payment_counters(db_models.Payments.__table__),
+        payment_counters(db_models.payments_archive),
+    ):
+        for row in connection.execute(query):
+            add(
+                deltas,
+                row.kind,
+                row.user_id,
+                row.status,
+                row.count,
+                row.total,
+            )
+
+    connection.execute(delete(summaries))
+    if deltas:
+        connection.execute(insert(summaries), counter_rows(deltas))
+
+    return len(deltas)
+
+
+def rebuild(engine=None) -> dict:
+    """recomputes the counters in a single transaction"""
+
+    engine = engine or db_engine.engine
+    with engine.begin() as connection:
+        counters = recompute(connection)
+
+    result = {"counters": counters}
+    logger.info(f"summary rebuild => {json.dumps(result)}")
+    return result
+
+
+if __name__ == "__main__":
+    print(json.dumps(rebuild(), indent=4))
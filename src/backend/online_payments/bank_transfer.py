@@ -1,14 +1,17 @@
-from fastapi import Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
 from auth import oauth2_users
-from models import db_engine, db_crud, db_models, redis_db
+from models import db_engine, async_crud, db_models, deadlines, redis_db
+from models import summary
 from .flutterwave import HEADER
 from typing import Annotated
 from online_payments import payments_utils
+from utils import ids
 from .rave_checkout import router
 from dotenv import load_dotenv
 import online_payments.payment_schema as schemas
-import json, time, requests, os
+import json, requests, os
 
 
 redis = redis_db.redis_factory()
@@ -27,26 +30,33 @@ load_dotenv()
 async def start_bank_transfer(
     invoiceId: str,
     active_user: Annotated[dict, Depends(oauth2_users.verify_token)],
-    db: Annotated[Session, Depends(db_engine.get_db)],
+    db: Annotated[AsyncSession, Depends(db_engine.get_async_db)],
 ):
     """initiate bank transfer"""
 
-    record = payments_utils.validate_invoice(
-        db, active_user["email"], invoiceId
+    price = await payments_utils.checkout_price(
+        db, active_user["sub"], invoiceId
     )
 
-    ref_id = "REF-" + str(round(time.time()) * 2)
+    ref_id = ids.payment_ref()
     data = {
         "tx_ref": ref_id,
         "email": active_user["email"],
-        "amount": float(record.price),
+        "amount": float(price),
         "fullname": active_user["name"],
         "currency": "NGN",
     }
 
-    resp = get_virtual_account(data)
+    # the call blocks, it runs in the threadpool so the deadline and the
+    # client leaving can cancel the request
+    resp = await run_in_threadpool(get_virtual_account, data)
     data.update(resp["meta"]["authorization"])
 
+    # locks the active payments of the invoice until save commits
+    record = await payments_utils.validate_invoice(
+        db, active_user["sub"], invoiceId, price
+    )
+
     payment_record = payments_utils.payment_serializer(
         ref_id,
         record,
@@ -55,7 +65,11 @@ async def start_bank_transfer(
         resp["meta"]["authorization"]["transfer_reference"],
     )
 
-    db_crud.save(db, db_models.Payments, payment_record)
+    # committed with the payment by save
+    await summary.adjust(
+        db, "payments", active_user["sub"], ("pending", 1, record.price)
+    )
+    await async_crud.save(db, db_models.Payments, payment_record)
     redis.set(ref_id, json.dumps(data))
     temp_bank_acc = {
         "ref_id": ref_id,
@@ -83,11 +97,11 @@ def get_virtual_account(user_data) -> dict:
             os.getenv("BANK_TRANSFER_ENDPOINT"),
             headers=HEADER,
             data=user_data,
-            timeout=10,
+            timeout=deadlines.remaining(10),
         ).json()
 
     except requests.exceptions.ConnectionError:
-        raise HTTException(
+        raise HTTPException(
             status_code=status.HTTP_408_REQUEST_TIMEOUT,
             detail="ERROR: check internet connection",
         )
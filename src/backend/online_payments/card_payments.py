@@ -1,13 +1,15 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
 from auth import oauth2_users
-from models import db_engine, db_crud, db_models, redis_db
+from models import db_engine, async_crud, db_models, redis_db, summary
 from .flutterwave import rave_pay
 from rave_python import Misc, RaveExceptions
 from typing import Annotated
-import datetime, time
+import datetime
 import json
 from online_payments import payments_utils
+from utils import ids
 import online_payments.payment_schema as schemas
 from docs.online_payment_responses import card_response
 
@@ -35,13 +37,13 @@ async def card_payments(
     invoiceId: str,
     payload: schemas.CardPayments,
     active_user: Annotated[dict, Depends(oauth2_users.verify_token)],
-    db: Annotated[Session, Depends(db_engine.get_db)],
+    db: Annotated[AsyncSession, Depends(db_engine.get_async_db)],
 ):
     """collect card payments"""
 
     # gets and perform checks on the invoice ID
-    record = payments_utils.validate_invoice(
-        db, active_user["email"], invoiceId
+    record = await payments_utils.validate_invoice(
+        db, active_user["sub"], invoiceId
     )
 
     card_details = payload.model_dump().copy()
@@ -55,7 +57,7 @@ async def card_payments(
     )
 
     try:
-        res = rave_pay.Card.charge(card_details)
+        res = await run_in_threadpool(rave_pay.Card.charge, card_details)
         if res["suggestedAuth"]:
             if res["suggestedAuth"] != "PIN":
                 raise HTTPException(
@@ -64,7 +66,7 @@ async def card_payments(
                 )
 
             card_details.update(suggested_auth="PIN")
-            res = rave_pay.Card.charge(card_details)
+            res = await run_in_threadpool(rave_pay.Card.charge, card_details)
 
     except RaveExceptions.CardChargeError as err:
         raise HTTPException(
@@ -72,12 +74,16 @@ async def card_payments(
             detail=err.err["errMsg"],
         )
 
-    ref_id = "REF-" + str(round(time.time()) * 2)
+    ref_id = ids.payment_ref()
     payment_record = payments_utils.payment_serializer(
         ref_id, res, record, active_user, "card"
     )
 
-    db_crud.save(db, db_models.Payments, payment_record)
+    # committed with the payment by save
+    await summary.adjust(
+        db, "payments", active_user["sub"], ("pending", 1, record.price)
+    )
+    await async_crud.save(db, db_models.Payments, payment_record)
     redis.set(ref_id, json.dumps(res))
     return {
         "ref_id": ref_id,
@@ -98,27 +104,30 @@ async def card_payments(
 async def verify_card_payments(
     payload: schemas.VerifyCardPayments,
     active_user: Annotated[dict, Depends(oauth2_users.verify_token)],
-    db: Annotated[Session, Depends(db_engine.get_db)],
+    db: Annotated[AsyncSession, Depends(db_engine.get_async_db)],
 ):
     """veriy's card payments"""
 
     # check if the ref_id exist on redis
-    if not redis.exists(payload.ref_id):
+    data = redis.get(payload.ref_id)
+    if not data:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid reference id to continue verification process",
         )
 
-    data = json.loads(redis.get(payload.ref_id))
+    data = json.loads(data)
     rave_flwRef = data["flwRef"]
     rave_txRef = data["txRef"]
 
     try:
-        res = rave_pay.Card.validate(rave_flwRef, payload.otp)
-        res = rave_pay.Card.verify(rave_txRef)
+        res = await run_in_threadpool(
+            rave_pay.Card.validate, rave_flwRef, payload.otp
+        )
+        res = await run_in_threadpool(rave_pay.Card.verify, rave_txRef)
 
     except RaveExceptions.TransactionValidationError as err:
-        payments_utils.cancell_transaction(db, payload.ref_id)
+        await payments_utils.cancell_transaction(db, payload.ref_id)
         redis.delete(payload.ref_id)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -126,7 +135,7 @@ async def verify_card_payments(
         )
 
     except RaveExceptions.TransactionVerificationError as err:
-        payments_utils.cancell_transaction(db, payload.ref_id)
+        await payments_utils.cancell_transaction(db, payload.ref_id)
         redis.delete(payload.ref_id)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -136,7 +145,7 @@ async def verify_card_payments(
     # get successfull payment timestamp
     # payment_timestamp = datetime.datetime.utcnow()
 
-    invoice_record = payments_utils.successfull_transaction(
+    invoice_record = await payments_utils.successfull_transaction(
         db, payload.ref_id
     )
 
@@ -1,8 +1,13 @@
 # This module contains all helper function needed in processing online payments
 # The db variable used as parameter signifies the request db session
+# helpers only change the records, callers commit them all at once with
+# db_engine.unit_of_work
 
 from fastapi import HTTPException, status
-from models import db_engine, db_models, db_crud, redis_db
+from fastapi.concurrency import run_in_threadpool
+from models import db_engine, db_models, async_crud, deadlines, redis_db
+from models import replica, summary
+from sqlalchemy import select, update
 from dotenv import load_dotenv
 import datetime, json, requests, os
 
@@ -10,39 +15,97 @@ import datetime, json, requests, os
 redis = redis_db.redis_factory()
 
 
-def validate_invoice(db, email, invoiceId):
-    """validates invoice record"""
+async def checkout_price(db, user_id, invoiceId):
+    """validates the invoice without locking anything, returns its price
 
-    invoice_record = get_invoice(db, invoiceId)
+    the read transaction is ended so no connection or lock is held while
+    the payment processor is called, validate_invoice then checks the
+    invoice again before the payment is saved
+    """
+
+    invoice_record = await get_invoice(db, invoiceId)
+    is_empty(invoice_record)
+    is_paid(invoice_record)
+    check_assignee(user_id, invoice_record)
+    is_expired(invoice_record)
+    price = invoice_record.price
+    await db.rollback()
+    return price
+
+
+async def validate_invoice(db, user_id, invoiceId, price=None):
+    """validates invoice record
+
+    price: the price the payment was started with, see checkout_price
+    """
+
+    invoice_record = await get_invoice(db, invoiceId)
     is_empty(invoice_record)
     is_paid(invoice_record)
-    check_assignee(email, invoice_record)
-    is_expired(db, invoice_record)
-    has_active_payment(db, invoiceId)
+    check_assignee(user_id, invoice_record)
+    is_expired(invoice_record)
+    if price is not None and invoice_record.price != price:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Invoice changed while processing payment, try again",
+        )
+
+    await has_active_payment(db, invoiceId)
     return invoice_record
 
 
-def has_active_payment(db, invoiceId):
-    """checks if the user has an active payment process"""
+async def has_active_payment(db, invoiceId):
+    """checks if the user has an active payment process
 
-    payment_records = db_crud.get_by(
-        db, db_models.Payments, inv_id=invoiceId
-    )
+    pending payments of the invoice are cancelled in a single update,
+    committed with the new payment record
+    """
 
-    if not payment_records:
-        return False
+    payments = db_models.Payments
+    active_records = (
+        await db.execute(
+            select(
+                payments.ref_id,
+                payments.status,
+                payments.payer_id,
+                payments.amount,
+            )
+            .where(
+                payments.inv_id == invoiceId,
+                payments.status.in_(("pending", "checking")),
+            )
+            .with_for_update()
+        )
+    ).all()
 
-    for record in payment_records:
-        if record.status == "pending":
-            update_payment_status(db, record, "cancelled")
+    if not active_records:
+        return False
 
-        elif record.status == "checking":
+    for record in active_records:
+        if record.status == "checking":
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="we're still verifying transaction with refId "
                 f"{record.ref_id}",
             )
 
+    await db.execute(
+        update(payments)
+        .where(payments.inv_id == invoiceId, payments.status == "pending")
+        .values(status="cancelled", version=payments.version + 1)
+    )
+
+    deltas = {}
+    for record in active_records:
+        summary.add(
+            deltas, "payments", record.payer_id, "pending", -1, -record.amount
+        )
+        summary.add(
+            deltas, "payments", record.payer_id, "cancelled", 1, record.amount
+        )
+
+    await db.execute(summary.upsert(deltas))
+
 
 def is_paid(record):
     """checks if the invoice is already paid"""
@@ -54,21 +117,27 @@ def is_paid(record):
         )
 
 
-def check_assignee(email, record):
+def check_assignee(user_id, record):
     """checks if the invoice is assigned to active_user"""
 
-    if record.to_email != email:
+    if record.to_user_id != user_id:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invoice not assigned to active user",
         )
 
 
-def is_expired(db, db_record):
-    """checks if the invoice has expired"""
+def is_expired(db_record):
+    """checks if the invoice has expired
+
+    the status is set by models.expiry, the due date covers the invoices
+    it hasn't swept yet
+    """
 
-    if datetime.date.today() > db_record.due_date:
-        update_invoice_status(db, db_record, "expired")
+    if (
+        db_record.status == "expired"
+        or datetime.date.today() > db_record.due_date
+    ):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invoice has expired, can't process payment",
@@ -85,126 +154,146 @@ def is_empty(db_record):
         )
 
 
-def get_invoice(db, invoiceId):
+async def get_invoice(db, invoiceId):
     """returns the invoice record"""
 
-    record = db_crud.get_specific_record(
+    record = await async_crud.get_specific_record(
         db, db_models.Invoices, inv_id=invoiceId
     )
 
     return record
 
 
-def get_payments_record(db, refId):
+async def get_payments_record(db, refId):
     """gets the payment record
 
     db: the request db session
     refId: the payment reference id
     """
 
-    record = db_crud.get_specific_record(
+    record = await async_crud.get_specific_record(
         db, db_models.Payments, ref_id=refId
     )
 
     return record
 
 
-def update_invoice_record(
-    invoice_record, payment_record, payment_timestamp, tx_status
-):
-    """updates invoices record"""
+# the statuses a payment may move to from each status. Every change is a
+# single UPDATE conditioned on the allowed previous statuses, so a request
+# losing a race to another callback or poll changes nothing
+TRANSITIONS = {
+    "pending": (
+        "checking",
+        "cancelled",
+        "failed",
+        "paid",
+        "incomplete",
+        "error",
+    ),
+    "checking": ("paid", "incomplete", "error"),
+    # a completed callback after a failed verification checks it again
+    "error": ("checking", "paid", "incomplete"),
+}
+
+
+def previous_statuses(tx_status) -> tuple:
+    """returns the statuses a payment can move to tx_status from"""
+
+    return tuple(
+        status
+        for status, next_statuses in TRANSITIONS.items()
+        if tx_status in next_statuses
+    )
 
-    invoice_record.paid = True
-    invoice_record.ref_id = payment_record.ref_id
-    invoice_record.flw_txref = payment_record.flw_txRef
-    invoice_record.paid_at = payment_timestamp
-    invoice_record.status = tx_status
 
+async def transition(db, refId, tx_status, version=None, **values) -> bool:
+    """moves the payment to tx_status if allowed from its current status
 
-def update_payments_record(
-    payment_record,
-    payment_timestamp,
-    payment_type,
-    amount,
-    tx_status,
-    flw_ref=None,
-):
-    """updates the payment record to paid"""
+    version: when specified, the payment must not have changed since it
+        was read at that version
+    values: the other columns to set with the status
 
-    if flw_ref:
-        payment_record.flw_ref = flw_ref
+    the update is conditioned on the version read with the status, so the
+    payment summary counters move from that status. Returns False when
+    the payment can't move to tx_status
+    """
 
-    payment_record.paid = True
-    payment_record.paid_at = payment_timestamp
-    payment_record.paid_amount = amount
-    payment_record.status = tx_status
-    payment_record.payment_type = payment_type
+    payments = db_models.Payments
+    record = (
+        await db.execute(
+            select(
+                payments.status,
+                payments.version,
+                payments.payer_id,
+                payments.amount,
+            ).where(payments.ref_id == refId)
+        )
+    ).one_or_none()
 
+    if record is None or record.status not in previous_statuses(tx_status):
+        return False
 
-def complete_transaction(
-    db, refId, payment_type, amount, tx_status, flw_ref
-):
-    """updates the payments and invoice table upon successfull payments"""
+    if version is not None and record.version != version:
+        return False
 
-    payment_timestamp = datetime.datetime.utcnow()
+    result = await db.execute(
+        update(payments)
+        .where(payments.ref_id == refId, payments.version == record.version)
+        .values(status=tx_status, version=payments.version + 1, **values)
+    )
 
-    # get records
-    payment_record = get_payments_record(db, refId)
-    invoice_record = get_invoice(db, payment_record.inv_id)
+    if result.rowcount != 1:
+        return False
 
-    # update records
-    update_payments_record(
-        payment_record,
-        payment_timestamp,
-        payment_type,
-        amount,
+    await summary.move(
+        db,
+        "payments",
+        record.payer_id,
+        record.status,
         tx_status,
-        flw_ref,
+        record.amount,
     )
+    return True
 
-    update_invoice_record(
-        invoice_record, payment_record, payment_timestamp, tx_status
-    )
 
-    db.commit()
+async def get_payment_status(db, refId):
+    """returns the payment status, None if there's no such payment"""
 
-    db.refresh(payment_record)
-    db.refresh(invoice_record)
-
-    return invoice_record
-
-
-def change_to_checking(db, payment_record, transaction_id, tx_status):
-    """changes the payment transaction status to checking"""
+    payments = db_models.Payments
+    return await db.scalar(
+        select(payments.status).where(payments.ref_id == refId)
+    )
 
-    #    payment_record = get_payments_record(db, refId)
-    payment_record.flw_txRef = transaction_id
-    payment_record.status = tx_status
 
-    db.commit()
-    db.refresh(payment_record)
+async def apply_callback(db, refId, tx_status, transaction_id) -> bool:
+    """moves the payment to the status reported by the payment processor
 
-    return payment_record
+    completed payments move to checking awaiting the verification,
+    returns False when the payment already moved past it
+    """
 
+    if tx_status in ("cancelled", "failed"):
+        moved = await transition(db, refId, tx_status)
 
-def update_payment_status(db, payment_record, tx_status):
-    """updates the payment status"""
+    else:
+        moved = await transition(
+            db, refId, "checking", flw_txRef=transaction_id
+        )
 
-    #    payment_record = get_payments_record(db, refId)
-    payment_record.status = tx_status
+    if not moved and await get_payment_status(db, refId) is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid tx_ref value, check and try again",
+        )
 
-    db.commit()
-    db.refresh(payment_record)
+    return moved
 
 
-def update_invoice_status(db, invoice_record, tx_status):
+def update_invoice_status(invoice_record, tx_status):
     """updates the invoice status"""
 
     invoice_record.status = tx_status
 
-    db.commit()
-    db.refresh(invoice_record)
-
 
 def add_transaction_id_to_redis_key(refId, transaction_id):
     """adds the transaction id gotte from payment processor to
@@ -214,7 +303,11 @@ def add_transaction_id_to_redis_key(refId, transaction_id):
     @transaction_id: the payment processor id
     """
 
-    data = json.loads(redis.get(refId))
+    data = redis.get(refId)
+    if data is None:
+        return
+
+    data = json.loads(data)
     data.update({"transaction_id": transaction_id})
     redis.set(refId, json.dumps(data))
 
@@ -238,7 +331,7 @@ def verv_api_call(refId, header):
             os.getenv("VERIFY_BY_REF"),
             headers=header,
             params=param,
-            timeout=5,
+            timeout=deadlines.remaining(5),
         ).json()
 
     except requests.exceptions.ConnectionError:
@@ -258,36 +351,105 @@ def verv_api_call(refId, header):
     return response
 
 
-def confirm_user_payments(refId, header):
+async def confirm_user_payments(refId, header):
     """confirm users payments with rave"""
 
-    db_session = next(db_engine.get_db())
-
-    payment_record = get_payments_record(db_session, refId)
-
-    resp = verv_api_call(refId, header)
-    if resp["status"] != "success":
-        update_payment_status(db_session, payment_record, resp["status"])
+    payments = db_models.Payments
+    async with db_engine.AsyncSessionLocal() as db_session:
+        record = (
+            await db_session.execute(
+                select(
+                    payments.status,
+                    payments.version,
+                    payments.amount,
+                    payments.inv_id,
+                    payments.flw_txRef,
+                    payments.payer_id,
+                ).where(payments.ref_id == refId)
+            )
+        ).one_or_none()
 
+    # verified by another request or terminated, rave isn't asked again
+    if record is None or record.status not in previous_statuses("paid"):
+        redis.delete(refId)
         return {
-            "status": resp["status"],
-            "msg": "check back later",
+            "status": "completed",
+            "msg": "payment verification complete",
         }
 
-    if is_amount_complete(payment_record, resp["data"]):
-        tx_status = "paid"
-
-    else:
-        tx_status = "incomplete"
+    # no connection is held while waiting for rave
+    resp = await run_in_threadpool(verv_api_call, refId, header)
+
+    db_session = db_engine.AsyncSessionLocal()
+    async with db_session, db_engine.unit_of_work(db_session):
+        if resp["status"] != "success":
+            if await transition(
+                db_session, refId, resp["status"], version=record.version
+            ):
+                # no user is active here, the payer reads the primary
+                replica.mark_user_write(db_session, record.payer_id)
+
+            return {
+                "status": resp["status"],
+                "msg": "check back later",
+            }
+
+        if is_amount_complete(record, resp["data"]):
+            tx_status = "paid"
+
+        else:
+            tx_status = "incomplete"
+
+        payment_timestamp = datetime.datetime.utcnow()
+        moved = await transition(
+            db_session,
+            refId,
+            tx_status,
+            version=record.version,
+            flw_ref=resp["data"]["flw_ref"],
+            paid=True,
+            paid_at=payment_timestamp,
+            paid_amount=resp["data"]["charged_amount"],
+            payment_type=resp["data"]["payment_type"],
+        )
 
-    complete_transaction(
-        db_session,
-        refId,
-        resp["data"]["payment_type"],
-        resp["data"]["charged_amount"],
-        tx_status,
-        resp["data"]["flw_ref"],
-    )
+        if moved:
+            replica.mark_user_write(db_session, record.payer_id)
+            invoices = db_models.Invoices
+            invoice = (
+                await db_session.execute(
+                    select(
+                        invoices.to_user_id,
+                        invoices.status,
+                        invoices.paid,
+                        invoices.price,
+                    )
+                    .where(invoices.inv_id == record.inv_id)
+                    .with_for_update()
+                )
+            ).one_or_none()
+
+            if invoice is not None:
+                await summary.move(
+                    db_session,
+                    "invoices",
+                    invoice.to_user_id,
+                    summary.invoice_status(invoice),
+                    tx_status,
+                    invoice.price,
+                )
+
+            await db_session.execute(
+                update(invoices)
+                .where(invoices.inv_id == record.inv_id)
+                .values(
+                    paid=True,
+                    ref_id=refId,
+                    flw_txref=record.flw_txRef,
+                    paid_at=payment_timestamp,
+                    status=tx_status,
+                )
+            )
 
     redis.delete(refId)
 
@@ -308,6 +470,7 @@ def payment_serializer(
         "title": record.title,
         "amount": float(record.price),
         "payer_email": active_user["email"],
+        "payer_id": active_user["sub"],
         "paid_by": active_user["name"],
         "checkout_type": checkout_type,
         "status": "pending",
@@ -6,14 +6,17 @@ from fastapi import (
     Request,
     status,
 )
-from sqlalchemy.orm import Session
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
 from auth import oauth2_users
-from models import db_engine, db_crud, db_models, redis_db
+from models import db_engine, async_crud, db_models, deadlines, redis_db
+from models import summary
 from online_payments import flutterwave, payments_utils, payment_schema
+from utils import ids
 from dotenv import load_dotenv
 from typing import Annotated
 import requests as req
-import json, os, time
+import json, os
 
 
 router = APIRouter(
@@ -48,12 +51,12 @@ HEADER = flutterwave.HEADER
 async def rave_checkout(
     invoiceId: str,
     active_user: Annotated[dict, Depends(oauth2_users.verify_token)],
-    db: Annotated[Session, Depends(db_engine.get_db)],
+    db: Annotated[AsyncSession, Depends(db_engine.get_async_db)],
 ):
     """exchange invoice ID for payment url"""
 
-    record = payments_utils.validate_invoice(
-        db, active_user["email"], invoiceId
+    price = await payments_utils.checkout_price(
+        db, active_user["sub"], invoiceId
     )
 
     customer = {
@@ -61,19 +64,28 @@ async def rave_checkout(
         "email": active_user["email"],
     }
 
-    ref_id = "REF-" + str(round(time.time()) * 2)
-    user_payload = build_payment_payload(
-        ref_id, float(record.price), customer
-    )
+    ref_id = ids.payment_ref()
+    user_payload = build_payment_payload(ref_id, float(price), customer)
 
-    response = get_rave_link(user_payload)
+    # the call blocks, it runs in the threadpool so the deadline and the
+    # client leaving can cancel the request
+    response = await run_in_threadpool(get_rave_link, user_payload)
     pay_link = response["data"]["link"]
 
+    # locks the active payments of the invoice until save commits
+    record = await payments_utils.validate_invoice(
+        db, active_user["sub"], invoiceId, price
+    )
+
     serialized_data = payments_utils.payment_serializer(
         ref_id, record, active_user, "rave_modal"
     )
 
-    db_crud.save(db, db_models.Payments, serialized_data)
+    # committed with the payment by save
+    await summary.adjust(
+        db, "payments", active_user["sub"], ("pending", 1, record.price)
+    )
+    await async_crud.save(db, db_models.Payments, serialized_data)
     redis.set(ref_id, json.dumps(serialized_data))
 
     return {
@@ -95,7 +107,7 @@ async def rave_checkout(
 async def rave_checkout_callback(
     req_url: Request,
     bg_task: BackgroundTasks,
-    db: Annotated[Session, Depends(db_engine.get_db)],
+    db: Annotated[AsyncSession, Depends(db_engine.get_async_db)],
 ):
     """Verify's user payments"""
 
@@ -104,38 +116,29 @@ async def rave_checkout_callback(
 
     # print(params)
 
-    payment_record = payments_utils.get_payments_record(
-        db, params.get("tx_ref")
-    )
-
     # status can be cancelled, failed, completed.
-    if params.get("status") == "cancelled":
-        payments_utils.update_payment_status(
-            db, payment_record, "cancelled"
+    async with db_engine.unit_of_work(db):
+        moved = await payments_utils.apply_callback(
+            db,
+            params.get("tx_ref"),
+            params.get("status"),
+            params.get("transaction_id"),
         )
 
+    if params.get("status") in ("cancelled", "failed"):
         redis.delete(params.get("tx_ref"))
         return {
             "status": params.get("status"),
             "ref_id": params.get("tx_ref"),
         }
 
-    elif params.get("status") == "failed":
-        payments_utils.update_payment_status(
-            db, payment_record, "failed"
-        )
-
-        redis.delete(params.get("tx_ref"))
+    # the payment is already verified or being verified
+    if not moved:
         return {
             "status": params.get("status"),
             "ref_id": params.get("tx_ref"),
         }
 
-    # change transaction to checking awaiting call to verification endpoint
-    payments_utils.change_to_checking(
-        db, payment_record, params.get("transaction_id"), "checking"
-    )
-
     # update redis key to add transaction_id
     payments_utils.add_transaction_id_to_redis_key(
         params.get("tx_ref"), params.get("transaction_id")
@@ -170,7 +173,7 @@ async def payment_callback(
     tx_ref: str,
     tx_status: str,
     bg_task: BackgroundTasks,
-    db: Annotated[Session, Depends(db_engine.get_db)],
+    db: Annotated[AsyncSession, Depends(db_engine.get_async_db)],
     transaction_id: int | None = None,
 ):
     """payment callback to verify payment
@@ -180,32 +183,23 @@ async def payment_callback(
     @transaction_id: only present when status param is completed
     """
 
-    check_parameter_integrity(tx_ref, tx_status, transaction_id)
+    check_parameter_integrity(tx_status, transaction_id)
 
-    payment_record = payments_utils.get_payments_record(db, tx_ref)
-
-    if tx_status == "cancelled":
-        payments_utils.update_payment_status(
-            db, payment_record, "cancelled"
+    async with db_engine.unit_of_work(db):
+        moved = await payments_utils.apply_callback(
+            db, tx_ref, tx_status, transaction_id
         )
 
+    if tx_status in ("cancelled", "failed"):
         redis.delete(tx_ref)
+
+    # cancelled, failed, or already verified or being verified
+    if tx_status in ("cancelled", "failed") or not moved:
         return {
             "status": tx_status,
             "ref_id": tx_ref,
         }
 
-    elif tx_status == "failed":
-        payments_utils.update_payment_status(
-            db, payment_record, "failed"
-        )
-
-        redis.delete(tx_ref)
-
-    payments_utils.change_to_checking(
-        db, payment_record, transaction_id, "checking"
-    )
-
     payments_utils.add_transaction_id_to_redis_key(
         tx_ref, transaction_id
     )
@@ -232,14 +226,8 @@ async def payment_callback(
 async def verify_user_payments(refId: str) -> dict:
     """verifies the users payments with rave"""
 
-    if not redis.exists(refId):
-        return {
-            "status": "completed",
-            "msg": "payment verification complete",
-        }
-
-    response = payments_utils.confirm_user_payments(refId, HEADER)
-    redis.delete(refId)
+    # payments already verified or terminated aren't sent to rave again
+    response = await payments_utils.confirm_user_payments(refId, HEADER)
 
     return response
 
@@ -252,11 +240,11 @@ def get_rave_link(user_payload) -> dict:
             os.getenv("CHECKOUT_ENDPOINT"),
             headers=HEADER,
             json=user_payload,
-            timeout=8,
+            timeout=deadlines.remaining(8),
         ).json()
 
     except req.exceptions.ConnectionError:
-        raise HTTException(
+        raise HTTPException(
             status_code=status.HTTP_408_REQUEST_TIMEOUT,
             detail="ERROR: check internet connection",
         )
@@ -291,15 +279,9 @@ def build_payment_payload(
     return payload
 
 
-def check_parameter_integrity(tx_ref, tx_status, transaction_id):
+def check_parameter_integrity(tx_status, transaction_id):
     """checks integrity of query params"""
 
-    if not redis.exists(tx_ref):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Invalid tx_ref value, check and try again",
-        )
-
     if tx_status not in ("cancelled", "completed", "failed"):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
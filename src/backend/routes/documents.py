@@ -6,13 +6,15 @@ from fastapi import (
     status,
     UploadFile,
 )
-from sqlalchemy.orm import Session
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
 from auth import oauth2_users
-from models import db_engine, db_models, db_crud
+from models import db_engine, db_models, async_crud, deadlines, replica
 from utils import google_drive as cloud
 from typing import Annotated, List
 from pydantic import BaseModel
 from docs.routes import documents
+from routes_schema.page_schema import Page, page_params
 import datetime
 
 
@@ -51,6 +53,16 @@ router = APIRouter(
     },
 )
 
+# the columns read by file_serializer, the listings load them as rows
+FILE_COLUMNS = (
+    db_models.Files.file_id,
+    db_models.Files.name,
+    db_models.Files.folder,
+    db_models.Files.file_url,
+    db_models.Files.size,
+    db_models.Files.date_uploaded,
+)
+
 # temp
 class UploadDocuments(BaseModel):
     folder_name: str
@@ -78,13 +90,14 @@ def file_serializer(record) -> dict:
     }
 
 
-def get_user_files(
-    db: Session,
+async def get_user_files(
+    db: AsyncSession,
     table: db_models.Files,
     user: int,
     folderName: str | None,
-) -> list[dict]:
-    """serialize user files"""
+    page: dict,
+) -> dict:
+    """returns a page of serialized user files"""
 
     if folderName:
         if folderName not in FOLDERS:
@@ -93,17 +106,28 @@ def get_user_files(
                 detail="Invalid folder specified",
             )
 
-        records = db_crud.get_by(
-            db, table, owner_id=user, folder=folderName
+        records, next_cursor = await async_crud.paginate(
+            db,
+            table,
+            table.date_uploaded,
+            owner_id=user,
+            folder=folderName,
+            columns=FILE_COLUMNS,
+            **page,
         )
 
     else:
-        records = db_crud.get_by(db, table, owner_id=user)
-
-    if not records:
-        return []
+        records, next_cursor = await async_crud.paginate(
+            db,
+            table,
+            table.date_uploaded,
+            owner_id=user,
+            columns=FILE_COLUMNS,
+            **page,
+        )
 
-    return [file_serializer(record) for record in records]
+    data = [file_serializer(record) for record in records]
+    return {"items": data, "next_cursor": next_cursor}
 
 
 @router.post(
@@ -119,7 +143,7 @@ async def upload_documents(
     folder_name: str,
     file: UploadFile,
     token: Annotated[dict, Depends(oauth2_users.verify_token)],
-    db: Annotated[Session, Depends(db_engine.get_db)],
+    db: Annotated[AsyncSession, Depends(db_engine.get_async_db)],
 ):
     """Uploads document to google cloud storage"""
 
@@ -149,11 +173,15 @@ async def upload_documents(
             detail=f"File '{file.filename}' too large",
         )
 
-    resp = cloud.upload_file(
+    # the upload blocks, it runs in the threadpool so the other requests
+    # aren't held up and stops waiting on drive when the budget is spent
+    resp = await run_in_threadpool(
+        cloud.upload_file,
         "1D8rZ7oNDzwBlrOTEiqyrLDRpfb0unzhQ",
         file.filename,
         data,
         file.content_type,
+        timeout=deadlines.remaining(),
     )
 
     date_uploaded = datetime.datetime.utcnow()
@@ -169,7 +197,7 @@ async def upload_documents(
         "date_uploaded": date_uploaded,
     }
 
-    data = db_crud.save(db, db_models.Files, db_record)
+    data = await async_crud.save(db, db_models.Files, db_record)
 
     file_resp = {
         "file_name": file.filename,
@@ -196,17 +224,18 @@ class MyFiles(BaseModel):
     "/myfiles",
     summary="Get all files uploaded by the active user",
     description="returns all files owned by currently logged in user",
-    response_model=list[MyFiles],
+    response_model=Page[MyFiles],
 )
 async def my_files(
     token: Annotated[dict, Depends(oauth2_users.verify_token)],
-    db: Annotated[Session, Depends(db_engine.get_db)],
+    db: Annotated[AsyncSession, Depends(replica.get_read_db)],
+    page: Annotated[dict, Depends(page_params)],
     folderName: str | None = None,
 ):
     """returns all files uploaded by the user"""
 
-    user_files = get_user_files(
-        db, db_models.Files, token["sub"], folderName
+    user_files = await get_user_files(
+        db, db_models.Files, token["sub"], folderName, page
     )
 
     return user_files
@@ -216,12 +245,13 @@ async def my_files(
     "/userfiles",
     summary="gets all the files for a specific user",
     description="should be used by admin or managers only",
-    response_model=list[MyFiles],
+    response_model=Page[MyFiles],
 )
 async def files_for(
     user_id: int,
     token: Annotated[dict, Depends(oauth2_users.verify_token)],
-    db: Annotated[Session, Depends(db_engine.get_db)],
+    db: Annotated[AsyncSession, Depends(replica.get_read_db)],
+    page: Annotated[dict, Depends(page_params)],
     folderName: str | None = None,
 ):
     """returns all files uploaded by the user id"""
@@ -232,7 +262,9 @@ async def files_for(
             detail="Unauthtorized access to resource",
         )
 
-    user_files = get_user_files(db, db_models.Files, user_id, folderName)
+    user_files = await get_user_files(
+        db, db_models.Files, user_id, folderName, page
+    )
     return user_files
 
 
@@ -242,11 +274,12 @@ async def files_for(
     description="This endpoints allows the active user to see all "
     "his/her recent files uploaded. To see recent files "
     "based on folder, pass the folder name as query param",
-    response_model=list[MyFiles],
+    response_model=Page[MyFiles],
 )
 async def user_recent_files(
     token: Annotated[dict, Depends(oauth2_users.verify_token)],
-    db: Annotated[Session, Depends(db_engine.get_db)],
+    db: Annotated[AsyncSession, Depends(replica.get_read_db)],
+    page: Annotated[dict, Depends(page_params)],
     folderName: str | None = None,
 ):
     """see recent files"""
@@ -258,20 +291,24 @@ async def user_recent_files(
                 detail="Invalid destination folder",
             )
 
-        records = db_crud.record_in_lifo(
+        records, next_cursor = await async_crud.paginate(
             db,
             db_models.Files,
             db_models.Files.date_uploaded,
             owner_id=token["sub"],
             folder=folderName,
+            columns=FILE_COLUMNS,
+            **page,
         )
 
     else:
-        records = db_crud.record_in_lifo(
+        records, next_cursor = await async_crud.paginate(
             db,
             db_models.Files,
             db_models.Files.date_uploaded,
             owner_id=token["sub"],
+            columns=FILE_COLUMNS,
+            **page,
         )
 
     #if not records:
@@ -280,7 +317,8 @@ async def user_recent_files(
     #        detail="No files found for user",
     #    )
 
-    return [file_serializer(record) for record in records if record.size]
+    data = [file_serializer(record) for record in records if record.size]
+    return {"items": data, "next_cursor": next_cursor}
 
 
 class fileByFolder(BaseModel):
@@ -300,7 +338,7 @@ class fileByFolder(BaseModel):
 )
 async def all_files(
     active_user: Annotated[dict, Depends(oauth2_users.verify_token)],
-    db: Annotated[Session, Depends(db_engine.get_db)],
+    db: Annotated[AsyncSession, Depends(replica.get_read_db)],
 ):
     """returns all files"""
 
@@ -310,7 +348,7 @@ async def all_files(
             detail="Unauthorized access to resource",
         )
 
-    records = db_crud.get_all(db, db_models.Files)
+    records = await async_crud.get_all(db, db_models.Files)
 
     if not records:
         raise HTTPException(
@@ -358,11 +396,11 @@ class DeleteFile(BaseModel):
 async def remove_file(
     fileId: str,
     token: Annotated[dict, Depends(oauth2_users.verify_token)],
-    db: Annotated[Session, Depends(db_engine.get_db)],
+    db: Annotated[AsyncSession, Depends(db_engine.get_async_db)],
 ):
     """Deletes a file owned by the active user from cloud storage"""
 
-    record = db_crud.get_specific_record(
+    record = await async_crud.get_specific_record(
         db, db_models.Files, file_id=fileId
     )
 
@@ -378,7 +416,7 @@ async def remove_file(
             detail="file not owned by active user",
         )
 
-    db_crud.delete(db, db_models.Files, file_id=fileId)
+    await async_crud.delete(db, db_models.Files, file_id=fileId)
     cloud.delete_files(fileId)
     return {
         "msg": "Deleted",
@@ -397,7 +435,7 @@ async def remove_file(
 async def remove_user_files(
     fileId: str,
     token: Annotated[dict, Depends(oauth2_users.verify_token)],
-    db: Annotated[Session, Depends(db_engine.get_db)],
+    db: Annotated[AsyncSession, Depends(db_engine.get_async_db)],
 ):
     """deletes file for a user, to be used by managers or admin"""
 
@@ -407,7 +445,7 @@ async def remove_user_files(
             detail="Unauthorized access to resource",
         )
 
-    record = db_crud.get_specific_record(
+    record = await async_crud.get_specific_record(
         db, db_models.Files, file_id=fileId
     )
 
@@ -423,7 +461,7 @@ async def remove_user_files(
     #        detail="Unauthorized user",
     #    )
 
-    db_crud.delete(db, db_models.Files, file_id=fileId)
+    await async_crud.delete(db, db_models.Files, file_id=fileId)
     cloud.delete_files(fileId)
     return {
         "file_id": fileId,
@@ -1,6 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException, Request, status
-from sqlalchemy.orm import Session
-from models import db_crud, db_engine, db_models, schema
+from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import async_crud, db_engine, db_models, replica, schema
+from routes_schema.page_schema import Page, page_params
 from auth import oauth2_users
 from typing import Annotated
 from pydantic import BaseModel
@@ -24,6 +26,30 @@ NOT_UPDATED_EXCEPTION = HTTPException(
     status_code=status.HTTP_204_NO_CONTENT, detail="no data provided"
 )
 
+# the listings carry an excerpt, the full content is on the detail routes
+NOTE_EXCERPT_LENGTH = 200
+
+DRAFT_LIST_COLUMNS = (
+    db_models.Drafts.draft_id,
+    db_models.Drafts.user_id,
+    db_models.Drafts.title,
+    func.substr(db_models.Drafts.content, 1, NOTE_EXCERPT_LENGTH).label(
+        "excerpt"
+    ),
+    db_models.Drafts.date_created,
+    db_models.Drafts.last_updated,
+)
+
+NOTE_LIST_COLUMNS = (
+    db_models.RecievedNotes.ref_id,
+    db_models.RecievedNotes.title,
+    func.substr(
+        db_models.RecievedNotes.content, 1, NOTE_EXCERPT_LENGTH
+    ).label("excerpt"),
+    db_models.RecievedNotes.from_name,
+    db_models.RecievedNotes.sent_time,
+)
+
 
 def build_drafts(record: db_models.Drafts) -> dict:
     """builds a dictionary object"""
@@ -40,8 +66,22 @@ def build_drafts(record: db_models.Drafts) -> dict:
     return draft
 
 
+def build_draft_summary(record) -> dict:
+    """builds the listing object of a draft row"""
+
+    return {
+        "draft_id": record.draft_id,
+        "user_id": record.user_id,
+        "title": record.title,
+        "excerpt": record.excerpt,
+        "date_created": record.date_created,
+        "last_updated": record.last_updated,
+    }
+
+
 def build_received_notes(record: db_models.RecievedNotes) -> dict:
     return {
+        "ref_id": record.ref_id,
         "title": record.title,
         "content": record.content,
         "sent_by": record.from_name,
@@ -49,6 +89,18 @@ def build_received_notes(record: db_models.RecievedNotes) -> dict:
     }
 
 
+def build_notes_summary(record) -> dict:
+    """builds the listing object of a received note row"""
+
+    return {
+        "ref_id": record.ref_id,
+        "title": record.title,
+        "excerpt": record.excerpt,
+        "sent_by": record.from_name,
+        "sent_time": record.sent_time,
+    }
+
+
 @router.get(
     "/",
     summary="Gets all Notes created by the active user",
@@ -57,15 +109,18 @@ def build_received_notes(record: db_models.RecievedNotes) -> dict:
 )
 async def get_all_drafts(
     token: Annotated[dict, Depends(oauth2_users.verify_token)],
-    db: Annotated[Session, Depends(db_engine.get_db)],
+    db: Annotated[AsyncSession, Depends(replica.get_read_db)],
+    page: Annotated[dict, Depends(page_params)],
 ):
     """Gets all notes by a user from the database"""
 
-    resp = db_crud.record_in_lifo(
+    resp, next_cursor = await async_crud.paginate(
         db,
         db_models.Drafts,
         db_models.Drafts.last_updated,
         user_id=token["sub"],
+        columns=DRAFT_LIST_COLUMNS,
+        **page,
     )
 
     if not resp:
@@ -74,13 +129,23 @@ async def get_all_drafts(
             detail="no notes found for user",
         )
 
-    draft = [build_drafts(draft) for draft in resp]
+    draft = [build_draft_summary(draft) for draft in resp]
 
-    return draft
+    return {"items": draft, "next_cursor": next_cursor}
+
+
+# temp
+class NotesSummary(BaseModel):
+    ref_id: int
+    title: str
+    excerpt: str
+    sent_by: str
+    sent_time: datetime
 
 
 # temp
 class NotesResponse(BaseModel):
+    ref_id: int
     title: str
     content: str
     sent_by: str
@@ -90,16 +155,22 @@ class NotesResponse(BaseModel):
 @router.get(
     "/receivedNotes",
     summary="Returns all notes sent to the active user",
-    response_model=list[NotesResponse],
+    response_model=Page[NotesSummary],
 )
 async def receive_notes(
     user: Annotated[dict, Depends(oauth2_users.verify_token)],
-    db: Annotated[Session, Depends(db_engine.get_db)],
+    db: Annotated[AsyncSession, Depends(replica.get_read_db)],
+    page: Annotated[dict, Depends(page_params)],
 ):
     """Get's all notes sent to current logged-in user"""
 
-    records = db_crud.get_by(
-        db, db_models.RecievedNotes, to_id=user["sub"]
+    records, next_cursor = await async_crud.paginate(
+        db,
+        db_models.RecievedNotes,
+        db_models.RecievedNotes.sent_time,
+        to_id=user["sub"],
+        columns=NOTE_LIST_COLUMNS,
+        **page,
     )
     if not records:
         raise HTTPException(
@@ -107,7 +178,38 @@ async def receive_notes(
             detail="No notes sent to active user",
         )
 
-    return [build_received_notes(record) for record in records]
+    data = [build_notes_summary(record) for record in records]
+    return {"items": data, "next_cursor": next_cursor}
+
+
+@router.get(
+    "/receivedNotes/{ref_id}",
+    summary="Returns a note sent to the active user with its content",
+    response_model=NotesResponse,
+)
+async def received_note_detail(
+    ref_id: int,
+    user: Annotated[dict, Depends(oauth2_users.verify_token)],
+    db: Annotated[AsyncSession, Depends(replica.get_read_db)],
+):
+    """Gets a note sent to the current logged-in user"""
+
+    record = await async_crud.get_specific_record(
+        db, db_models.RecievedNotes, ref_id=ref_id
+    )
+    if not record:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No notes found",
+        )
+
+    if record.to_id != user["sub"]:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="note not sent to active user",
+        )
+
+    return build_received_notes(record)
 
 
 # temp
@@ -120,7 +222,7 @@ class SendNotes(BaseModel):
 async def send_notes(
     payload: SendNotes,
     user: Annotated[dict, Depends(oauth2_users.verify_token)],
-    db: Annotated[Session, Depends(db_engine.get_db)],
+    db: Annotated[AsyncSession, Depends(db_engine.get_async_db)],
 ):
     """sends notes from one user to another user"""
 
@@ -129,7 +231,7 @@ async def send_notes(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid request, owner_id == receiver_id",
         )
-    draft = db_crud.get_specific_record(
+    draft = await async_crud.get_specific_record(
         db, db_models.Drafts, draft_id=payload.draftId
     )
 
@@ -138,7 +240,7 @@ async def send_notes(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="No notes found",
         )
-    to_user = db_crud.get_specific_record(
+    to_user = await async_crud.get_specific_record(
         db, db_models.User, user_id=payload.toId
     )
 
@@ -155,7 +257,7 @@ async def send_notes(
         "to_id": payload.toId,
         "sent_time": datetime.utcnow(),
     }
-    db_crud.save(db, db_models.RecievedNotes, data)
+    await async_crud.save(db, db_models.RecievedNotes, data)
     # send a notification to user on the new event
     return {"msg": "Note sent successfully"}
 
@@ -168,7 +270,7 @@ async def send_notes(
 async def save_drafts(
     payload: schema.CreateDrafts,
     user: Annotated[dict, Depends(oauth2_users.verify_token)],
-    db: Annotated[Session, Depends(db_engine.get_db)],
+    db: Annotated[AsyncSession, Depends(db_engine.get_async_db)],
 ):
     """creates a drafts in database\n
     The Request Body parameters.\n
@@ -191,7 +293,7 @@ async def save_drafts(
         "last_updated": time_stamp,
     }
     draft.update(dup_data)
-    saved_draft = db_crud.save(db, db_models.Drafts, draft)
+    saved_draft = await async_crud.save(db, db_models.Drafts, draft)
     return {"msg": "note created", "draft_id": saved_draft.draft_id}
 
 
@@ -199,12 +301,12 @@ async def save_drafts(
 async def update_draft(
     payload: schema.UpdateDrafts,
     user: Annotated[dict, Depends(oauth2_users.verify_token)],
-    db: Annotated[Session, Depends(db_engine.get_db)],
+    db: Annotated[AsyncSession, Depends(db_engine.get_async_db)],
 ):
     """Updates the drafts record for a particular user_id"""
 
     temp = payload.dict().copy()
-    note = db_crud.get_specific_record(
+    note = await async_crud.get_specific_record(
         db, db_models.Drafts, draft_id=temp["draft_id"]
     )
     if not note:
@@ -220,8 +322,8 @@ async def update_draft(
     note.title = temp["title"]
     note.content = temp["content"]
     note.last_updated = datetime.utcnow()
-    db.commit()
-    db.refresh(note)
+    await db.commit()
+    await db.refresh(note)
 
     return {"details": "note updated"}
 
@@ -234,11 +336,11 @@ async def update_draft(
 async def delete_draft(
     d_id: int,
     user: Annotated[dict, Depends(oauth2_users.verify_token)],
-    db: Annotated[Session, Depends(db_engine.get_db)],
+    db: Annotated[AsyncSession, Depends(db_engine.get_async_db)],
 ):
     """deletes the drafts from the record"""
 
-    draft = db_crud.get_specific_record(
+    draft = await async_crud.get_specific_record(
         db, db_models.Drafts, draft_id=d_id
     )
     if not draft:
@@ -251,5 +353,34 @@ async def delete_draft(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="note not owned by active user",
         )
-    db_crud.delete(db, db_models.Drafts, draft_id=d_id)
+    await async_crud.delete(db, db_models.Drafts, draft_id=d_id)
     return {"msg": "Deleted"}
+
+
+@router.get(
+    "/{draft_id}",
+    summary="Gets a note created by the active user with its content",
+)
+async def get_draft(
+    draft_id: int,
+    token: Annotated[dict, Depends(oauth2_users.verify_token)],
+    db: Annotated[AsyncSession, Depends(replica.get_read_db)],
+):
+    """Gets a note by its id"""
+
+    draft = await async_crud.get_specific_record(
+        db, db_models.Drafts, draft_id=draft_id
+    )
+    if not draft:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="no notes found for user",
+        )
+
+    if draft.user_id != token["sub"]:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="note not owned by active user",
+        )
+
+    return build_drafts(draft)
@@ -0,0 +1,220 @@
+# This module streams the invoices, payments and files as CSV or NDJSON
+# the rows are read from a server side cursor EXPORT_BATCH_SIZE at a time
+# and sent as they come, so memory stays flat whatever the number of rows
+# and the first bytes go out right after the query starts. Each export
+# holds its own connection, to the replica when usable, until the last
+# row is sent. The request deadline stops once the response starts, see
+# deadlines.STREAMED_ROUTES, only the client leaving ends the stream.
+#
+# since and until filter on the date column of the table, both included.
+# The archived invoices and payments are included, sent before the others,
+# unless since is more recent than the archive horizon.
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from auth import oauth2_users
+from models import archive, db_engine, db_models, replica
+from dotenv import load_dotenv
+from typing import Annotated, Literal
+import csv, datetime, decimal, io, json, os
+
+
+router = APIRouter(
+    prefix="/export",
+    tags=["Export"],
+    responses={
+        200: {"description": "Successful response"},
+        401: {"description": "Unauthorized access to resource"},
+    },
+)
+
+load_dotenv()
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 1000))
+
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+# table => the date column filtered and sorted on
+DATE_COLUMNS = {
+    "invoices": "created_at",
+    "payments": "paid_at",
+    "files": "date_uploaded",
+}
+
+# internal columns left out of the exports
+HIDDEN_COLUMNS = {"version"}
+
+
+def export_params(
+    format: Literal["csv", "ndjson"] = "csv",
+    since: Annotated[
+        datetime.date | None,
+        Query(description="only the records on or after this date"),
+    ] = None,
+    until: Annotated[
+        datetime.date | None,
+        Query(description="only the records on or before this date"),
+    ] = None,
+) -> dict:
+    """the query parameters of the exports"""
+
+    return {"format": format, "since": since, "until": until}
+
+
+def export_query(table, names: list[str], date_column: str, since, until):
+    """selects the rows of the table to export in date order"""
+
+    column = table.c[date_column]
+    query = select(*(table.c[name] for name in names))
+    if since is not None:
+        query = query.where(column >= since)
+
+    if until is not None:
+        query = query.where(column < until + datetime.timedelta(days=1))
+
+    return query.order_by(column, *table.primary_key.columns)
+
+
+def json_value(value):
+    """converts the values json can't encode"""
+
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+
+    return str(value)
+
+
+def encode_rows(rows, names: list[str], format: str) -> bytes:
+    """encodes a batch of rows"""
+
+    if format == "ndjson":
+        return "".join(
+            json.dumps(dict(zip(names, row)), default=json_value) + "\n"
+            for row in rows
+        ).encode()
+
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue().encode()
+
+
+async def stream_rows(engine, queries: list, names: list[str], format: str):
+    """yields the encoded rows of the queries, a batch at a time"""
+
+    if format == "csv":
+        yield encode_rows([names], names, format)
+
+    async with engine.connect() as connection:
+        for query in queries:
+            result = await connection.stream(
+                query.execution_options(yield_per=EXPORT_BATCH_SIZE)
+            )
+            async for rows in result.partitions():
+                yield encode_rows(rows, names, format)
+
+
+async def export_table(request: Request, db_table, params: dict):
+    """returns the streaming response exporting the table"""
+
+    table = db_table.__table__
+    names = [
+        column.name
+        for column in table.columns
+        if column.name not in HIDDEN_COLUMNS
+    ]
+
+    date_column = DATE_COLUMNS[table.name]
+    since, until = params["since"], params["until"]
+    queries = [export_query(table, names, date_column, since, until)]
+    if table.name in archive.archives and archive.reaches(
+        since, all_time=True
+    ):
+        queries.insert(
+            0,
+            export_query(
+                archive.archives[table.name], names, date_column, since, until
+            ),
+        )
+
+    engine = db_engine.async_engine
+    if await replica.use_replica(request):
+        engine = db_engine.read_engine
+
+    filename = f"{table.name}-{datetime.date.today().isoformat()}"
+    return StreamingResponse(
+        stream_rows(engine, queries, names, params["format"]),
+        media_type=MEDIA_TYPES[params["format"]],
+        headers={
+            "Content-Disposition": "attachment; filename="
+            f"{filename}.{params['format']}"
+        },
+    )
+
+
+def check_role(active_user: dict) -> None:
+    """the users can only see their own records, not export them"""
+
+    if active_user["role"] == "user":
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Unauthorized access to resource",
+        )
+
+
+@router.get(
+    "/invoices",
+    summary="Streams the invoices as CSV or NDJSON",
+    description="Streams the invoices created between since and until. "
+    "Can't be used by the user role.",
+)
+async def export_invoices(
+    request: Request,
+    active_user: Annotated[dict, Depends(oauth2_users.verify_token)],
+    params: Annotated[dict, Depends(export_params)],
+):
+    """exports the invoices"""
+
+    check_role(active_user)
+    return await export_table(request, db_models.Invoices, params)
+
+
+@router.get(
+    "/payments",
+    summary="Streams the payments as CSV or NDJSON",
+    description="Streams the payments made between since and until, the "
+    "unpaid ones are only included without since. Can't be used by the "
+    "user role.",
+)
+async def export_payments(
+    request: Request,
+    active_user: Annotated[dict, Depends(oauth2_users.verify_token)],
+    params: Annotated[dict, Depends(export_params)],
+):
+    """exports the payments"""
+
+    check_role(active_user)
+    return await export_table(request, db_models.Payments, params)
+
+
+@router.get(
+    "/files",
+    summary="Streams the uploaded files records as CSV or NDJSON",
+    description="Streams the records of the files uploaded between since "
+    "and until. Can't be used by the user role.",
+)
+async def export_files(
+    request: Request,
+    active_user: Annotated[dict, Depends(oauth2_users.verify_token)],
+    params: Annotated[dict, Depends(export_params)],
+):
+    """exports the files records"""
+
+    check_role(active_user)
+    return await export_table(request, db_models.Files, params)
@@ -1,13 +1,17 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import exists, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, selectinload
 from auth import oauth2_users
-from models import db_engine, db_crud, db_models, schema
+from models import db_engine, async_crud, db_models, replica, schema, summary
 from routes_schema import invoice_schema
+from routes_schema.page_schema import Page, page_params, range_params
 from online_payments import payments_utils
+from routes.payments import payments_serializer
+from utils import ids
 from datetime import date, datetime
 from typing import Annotated
 from pydantic import BaseModel, EmailStr
-import time
 
 router = APIRouter(
     prefix="/invoice",
@@ -23,110 +27,150 @@ router = APIRouter(
     },
 )
 
+# the columns read by invoice_serializer, the listings load them as rows
+INVOICE_COLUMNS = (
+    db_models.Invoices.inv_id,
+    db_models.Invoices.title,
+    db_models.Invoices.status,
+    db_models.Invoices.desc,
+    db_models.Invoices.price,
+    db_models.Invoices.to_email,
+    db_models.Invoices.created_at,
+    db_models.Invoices.created_by,
+    db_models.Invoices.updated_at,
+    db_models.Invoices.updated_by,
+    db_models.Invoices.due_date,
+    db_models.Invoices.paid,
+    db_models.Invoices.paid_at,
+    db_models.Invoices.flw_txref,
+    db_models.Invoices.ref_id,
+)
+
 
 @router.get(
     "/all",
     summary="Returns all created invoices",
     description="This endpoints can be used by previledged and normal users",
-    response_model=list[invoice_schema.InvoiceResponse],
+    response_model=Page[invoice_schema.InvoiceResponse],
 )
 async def get_all_invoice(
     active_user: Annotated[dict, Depends(oauth2_users.verify_token)],
-    db: Annotated[Session, Depends(db_engine.get_db)],
+    db: Annotated[AsyncSession, Depends(replica.get_read_db)],
+    page: Annotated[dict, Depends(page_params)],
+    dates: Annotated[dict, Depends(range_params)],
 ):
     """get all invoices created"""
 
     if active_user["role"] == "user":
-        records = db_crud.filter_record_in_lifo(
+        records, next_cursor = await async_crud.paginate(
             db,
             db_models.Invoices,
             db_models.Invoices.created_at,
-            to_email=active_user["email"],
+            to_user_id=active_user["sub"],
+            columns=INVOICE_COLUMNS,
+            **page,
+            **dates,
         )
 
     else:
-        records = db_crud.all_record_in_lifo(
+        records, next_cursor = await async_crud.paginate(
             db,
             db_models.Invoices,
             db_models.Invoices.created_at,
+            columns=INVOICE_COLUMNS,
+            **page,
+            **dates,
         )
 
     is_empty(records)
 
     data = [invoice_serializer(record) for record in records]
-    return data
+    return {"items": data, "next_cursor": next_cursor}
 
 
 @router.get(
     "/pending",
     summary="Returns all unpaid invoices",
     description="This endpoint can be used by all users, no restrictions",
-    response_model=list[invoice_schema.InvoiceResponse],
+    response_model=Page[invoice_schema.InvoiceResponse],
 )
 async def get_pending_invoices(
     active_user: Annotated[dict, Depends(oauth2_users.verify_token)],
-    db: Annotated[Session, Depends(db_engine.get_db)],
+    db: Annotated[AsyncSession, Depends(replica.get_read_db)],
+    page: Annotated[dict, Depends(page_params)],
 ):
     """returns all unpaid invoices"""
 
     if active_user["role"] == "user":
-        records = db_crud.filter_record_in_lifo(
+        records, next_cursor = await async_crud.paginate(
             db,
             db_models.Invoices,
             db_models.Invoices.created_at,
             paid=False,
-            status=None,
-            to_email=active_user["email"],
+            status="pending",
+            to_user_id=active_user["sub"],
+            columns=INVOICE_COLUMNS,
+            **page,
         )
 
     else:
-        records = db_crud.filter_record_in_lifo(
+        records, next_cursor = await async_crud.paginate(
             db,
             db_models.Invoices,
             db_models.Invoices.created_at,
             paid=False,
-            status=None,
+            status="pending",
+            columns=INVOICE_COLUMNS,
+            **page,
         )
 
     is_empty(records)
 
     data = [invoice_serializer(record) for record in records]
-    return data
+    return {"items": data, "next_cursor": next_cursor}
 
 
 @router.get(
     "/expired",
     summary="Returns all expiredd invoices",
     description="This endpoint can be used by all users, no restrictions",
-    response_model=list[invoice_schema.InvoiceResponse],
+    response_model=Page[invoice_schema.InvoiceResponse],
 )
 async def get_pending_invoices(
     active_user: Annotated[dict, Depends(oauth2_users.verify_token)],
-    db: Annotated[Session, Depends(db_engine.get_db)],
+    db: Annotated[AsyncSession, Depends(replica.get_read_db)],
+    page: Annotated[dict, Depends(page_params)],
 ):
     """returns all expired invoices"""
 
     if active_user["role"] == "user":
-        records = db_crud.filter_record_in_lifo(
+        records, next_cursor = await async_crud.paginate(
             db,
             db_models.Invoices,
             db_models.Invoices.created_at,
+            # expired invoices are unpaid, paid matches the list indexes
+            paid=False,
             status="expired",
-            to_email=active_user["email"],
+            to_user_id=active_user["sub"],
+            columns=INVOICE_COLUMNS,
+            **page,
         )
 
     else:
-        records = db_crud.filter_record_in_lifo(
+        records, next_cursor = await async_crud.paginate(
             db,
             db_models.Invoices,
             db_models.Invoices.created_at,
+            paid=False,
             status="expired",
+            columns=INVOICE_COLUMNS,
+            **page,
         )
 
     is_empty(records)
 
     data = [invoice_serializer(record) for record in records]
-    return data
+    return {"items": data, "next_cursor": next_cursor}
 
 
 @router.get(
@@ -135,34 +179,83 @@ async def get_pending_invoices(
     description="Use this endpoint to get all paid invoices both for users "
     "and previledged users. To get all paid invoices by the "
     "active user, pass the email of user as query parameter.",
-    response_model=list[invoice_schema.InvoiceResponse],
+    response_model=Page[invoice_schema.InvoiceResponse],
 )
 async def get_paid_invoice(
     active_user: Annotated[dict, Depends(oauth2_users.verify_token)],
-    db: Annotated[Session, Depends(db_engine.get_db)],
+    db: Annotated[AsyncSession, Depends(replica.get_read_db)],
+    page: Annotated[dict, Depends(page_params)],
+    dates: Annotated[dict, Depends(range_params)],
 ):
     """returns all paid invoices"""
 
     if active_user["role"] == "user":
-        records = db_crud.filter_record_in_lifo(
+        records, next_cursor = await async_crud.paginate(
             db,
             db_models.Invoices,
             db_models.Invoices.paid_at,
-            to_email=active_user["email"],
+            to_user_id=active_user["sub"],
             paid=True,
+            columns=INVOICE_COLUMNS,
+            **page,
+            **dates,
         )
 
     else:
-        records = db_crud.filter_record_in_lifo(
+        records, next_cursor = await async_crud.paginate(
             db,
             db_models.Invoices,
             db_models.Invoices.paid_at,
             paid=True,
+            columns=INVOICE_COLUMNS,
+            **page,
+            **dates,
         )
 
     is_empty(records)
 
     data = [invoice_serializer(record) for record in records]
+    return {"items": data, "next_cursor": next_cursor}
+
+
+@router.get(
+    "/summary",
+    summary="Returns the invoice and payment counts and totals by status",
+    description="Users get the counters of their own invoices and payments,"
+    " the other roles get the counters of all the users",
+    response_model=invoice_schema.SummaryResponse,
+)
+async def get_summary(
+    active_user: Annotated[dict, Depends(oauth2_users.verify_token)],
+    db: Annotated[AsyncSession, Depends(replica.get_read_db)],
+):
+    """returns the counters kept by models.summary"""
+
+    if active_user["role"] == "user":
+        user_id = active_user["sub"]
+
+    else:
+        user_id = summary.ALL_USERS
+
+    summaries = db_models.Summaries
+    records = (
+        await db.execute(
+            select(
+                summaries.kind,
+                summaries.status,
+                summaries.count,
+                summaries.total,
+            ).where(summaries.user_id == user_id)
+        )
+    ).all()
+
+    data = {"invoices": {}, "payments": {}}
+    for record in records:
+        data[record.kind][record.status] = {
+            "count": record.count,
+            "total": float(record.total),
+        }
+
     return data
 
 
@@ -175,16 +268,74 @@ async def get_paid_invoice(
 async def get_invoice_by_id(
     invoiceId: str,
     active_user: Annotated[dict, Depends(oauth2_users.verify_token)],
-    db: Annotated[Session, Depends(db_engine.get_db)],
+    db: Annotated[AsyncSession, Depends(replica.get_read_db)],
 ):
     """gets an invoice by its id"""
 
-    record = db_crud.get_specific_record(
+    record = await async_crud.get_specific_record(
         db, db_models.Invoices, inv_id=invoiceId
     )
 
+    if not record:
+        record = await async_crud.get_archived_record(
+            db, db_models.Invoices, inv_id=invoiceId
+        )
+
+    is_empty(record)
+    data = invoice_serializer(record)
+    return data
+
+
+@router.get(
+    "/{invoiceId}/detail",
+    summary="Returns an invoice with its payment attempts and payer",
+    description="Returns the invoice, all the payment attempts made on it "
+    "and the profile of the user it's assigned to. Users with role 'user' "
+    "can only see their own invoices",
+    response_model=invoice_schema.InvoiceDetailResponse,
+)
+async def get_invoice_detail(
+    invoiceId: str,
+    active_user: Annotated[dict, Depends(oauth2_users.verify_token)],
+    db: Annotated[AsyncSession, Depends(replica.get_read_db)],
+):
+    """gets an invoice with its payments and payer in two queries"""
+
+    record = await db.scalar(
+        select(db_models.Invoices)
+        .options(
+            joinedload(db_models.Invoices.to_user),
+            selectinload(db_models.Invoices.payments),
+        )
+        .where(db_models.Invoices.inv_id == invoiceId)
+    )
+
     is_empty(record)
+
+    if (
+        active_user["role"] == "user"
+        and record.to_user_id != active_user["sub"]
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Unauthorized access to resource",
+        )
+
     data = invoice_serializer(record)
+    data["payments"] = [
+        payments_serializer(payment) for payment in record.payments
+    ]
+
+    data["payer"] = None
+    if record.to_user:
+        data["payer"] = {
+            "user_id": record.to_user.user_id,
+            "name": f"{record.to_user.first_name} {record.to_user.last_name}",
+            "email": record.to_user.email,
+            "phone_num": record.to_user.phone_num,
+            "profile_pic": record.to_user.profile_pic,
+        }
+
     return data
 
 
@@ -197,7 +348,7 @@ async def get_invoice_by_id(
 async def create_invoice(
     payload: schema.CreateInvoice,
     active_user: Annotated[dict, Depends(oauth2_users.verify_token)],
-    db: Annotated[Session, Depends(db_engine.get_db)],
+    db: Annotated[AsyncSession, Depends(db_engine.get_async_db)],
 ):
     """creates invoice"""
 
@@ -208,7 +359,7 @@ async def create_invoice(
         )
 
     check_payload(payload)
-    record = db_crud.get_specific_record(
+    record = await async_crud.get_specific_record(
         db, db_models.User, email=payload.to_email
     )
     if not record:
@@ -224,13 +375,18 @@ async def create_invoice(
     data = payload.model_dump().copy()
     data.update(
         {
-            "inv_id": "JPC-" + str(round(time.time())),
+            "inv_id": ids.invoice_id(),
             "created_at": datetime.utcnow(),
             "created_by": active_user["name"],
             "status": "pending",
+            "to_user_id": record.user_id,
         }
     )
-    db_crud.save(db, db_models.Invoices, data)
+    # committed with the invoice by save
+    await summary.adjust(
+        db, "invoices", record.user_id, ("pending", 1, payload.price)
+    )
+    await async_crud.save(db, db_models.Invoices, data)
     if data.get("to_email", None):
         # send user an email for new invoice
         print("sending a mail here")
@@ -246,7 +402,7 @@ async def create_invoice(
 async def update_invoice(
     payload: invoice_schema.UpdateInvoice,
     active_user: Annotated[dict, Depends(oauth2_users.verify_token)],
-    db: Annotated[Session, Depends(db_engine.get_db)],
+    db: Annotated[AsyncSession, Depends(db_engine.get_async_db)],
 ):
     """updates the invoice with the payload data"""
 
@@ -257,7 +413,7 @@ async def update_invoice(
         )
 
     check_payload(payload)
-    record = db_crud.get_specific_record(
+    record = await async_crud.get_specific_record(
         db, db_models.Invoices, inv_id=payload.inv_id
     )
 
@@ -270,15 +426,30 @@ async def update_invoice(
             detail="Can't Update an already paid invoice",
         )
 
+    old_status, old_price = summary.invoice_status(record), record.price
     record.title = payload.title
     record.desc = payload.desc
     record.price = payload.price
     record.due_date = payload.due_date
+    # check_payload only lets due dates from today through, so an expired
+    # invoice reopens, models.expiry expires it again once it's past due
+    record.status = "pending"
+
+    await summary.move(
+        db,
+        "invoices",
+        record.to_user_id,
+        old_status,
+        record.status,
+        old_price,
+        payload.price,
+    )
+
     record.updated_at = datetime.utcnow()
     record.updated_by = active_user["name"]
 
-    db.commit()
-    db.refresh(record)
+    await db.commit()
+    await db.refresh(record)
 
     # send to_email  email on updated invoice
     return {"msg": "Invoice Updated"}
@@ -292,7 +463,7 @@ async def update_invoice(
 async def manual_invoice_status_update(
     invoiceId: str,
     active_user: Annotated[dict, Depends(oauth2_users.verify_token)],
-    db: Annotated[Session, Depends(db_engine.get_db)],
+    db: Annotated[AsyncSession, Depends(db_engine.get_async_db)],
 ):
     """updates the payment status of an invoice to paid"""
 
@@ -302,17 +473,17 @@ async def manual_invoice_status_update(
             detail="Unauthorized access to resource",
         )
 
-    invoice_record = db_crud.get_specific_record(
+    invoice_record = await async_crud.get_specific_record(
         db, db_models.Invoices, inv_id=invoiceId
     )
 
     is_empty(invoice_record)
 
-    payment_record = db_crud.get_specific_record(
-        db, db_models.Payments, inv_id=invoiceId
+    # only checks a payment exists, without loading them
+    has_payment = await db.scalar(
+        select(exists().where(db_models.Payments.inv_id == invoiceId))
     )
-
-    if not payment_record:
+    if not has_payment:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="No existing transaction ref for invoice",
@@ -324,14 +495,19 @@ async def manual_invoice_status_update(
     #    payment_record, payment_timestamp
     # )
 
-    payments_utils.update_invoice_status(
-        db,    
-        invoice_record,
-        "paid",
-    )
+    async with db_engine.unit_of_work(db):
+        await summary.move(
+            db,
+            "invoices",
+            invoice_record.to_user_id,
+            summary.invoice_status(invoice_record),
+            "paid",
+            invoice_record.price,
+        )
+        payments_utils.update_invoice_status(invoice_record, "paid")
 
-    # db.refresh(invoice_record)
-    # db.refresh(payment_record)
+    # await db.refresh(invoice_record)
+    # await db.refresh(payment_record)
 
     return {"msg": "Invoice status updated manaually"}
 
@@ -344,7 +520,7 @@ async def manual_invoice_status_update(
 async def delete_invoice(
     invoiceId: str,
     active_user: Annotated[dict, Depends(oauth2_users.verify_token)],
-    db: Annotated[Session, Depends(db_engine.get_db)],
+    db: Annotated[AsyncSession, Depends(db_engine.get_async_db)],
 ):
     """removes an invoice by id"""
 
@@ -353,7 +529,21 @@ async def delete_invoice(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Unauthorized access to resource",
         )
-    db_crud.delete(db, db_models.Invoices, inv_id=invoiceId)
+
+    record = await async_crud.get_specific_record(
+        db, db_models.Invoices, inv_id=invoiceId
+    )
+
+    # committed with the deletion, delete() raises when there's no record
+    if record:
+        await summary.adjust(
+            db,
+            "invoices",
+            record.to_user_id,
+            (summary.invoice_status(record), -1, -record.price),
+        )
+
+    await async_crud.delete(db, db_models.Invoices, inv_id=invoiceId)
     return {"msg": "Deleted successfully"}
 
 
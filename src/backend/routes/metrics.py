@@ -0,0 +1,56 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from auth import oauth2_users
+from models import db_metrics, db_pool
+from typing import Annotated
+
+
+router = APIRouter(
+    prefix="/metrics",
+    tags=["Metrics"],
+    responses={
+        200: {"description": "Successful response"},
+        401: {"description": "Unauthorized access to resource"},
+    },
+)
+
+
+@router.get(
+    "/db",
+    summary="Returns the query stats of every route",
+    description="Returns the number of requests, the average and max "
+    "number of queries and the average db and total time in ms of every "
+    "route since the worker started. Should only be used by admins.",
+)
+async def db_stats(
+    active_user: Annotated[dict, Depends(oauth2_users.verify_token)],
+):
+    """returns the aggregated query stats of every route"""
+
+    if active_user["role"] != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Unauthorized access to resource",
+        )
+
+    return db_metrics.route_stats()
+
+
+@router.get(
+    "/pool",
+    summary="Returns the state of the database connection pools",
+    description="Returns the size, checked out connections, overflow, "
+    "checkout wait times and longest held connection of every pool of the "
+    "worker. Should only be used by admins.",
+)
+async def pool_stats(
+    active_user: Annotated[dict, Depends(oauth2_users.verify_token)],
+):
+    """returns the state of the connection pools"""
+
+    if active_user["role"] != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Unauthorized access to resource",
+        )
+
+    return db_pool.pool_stats()
@@ -1,12 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy import extract, func
-from sqlalchemy.orm import Session
+from sqlalchemy import extract, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from auth import oauth2_users
-from models import db_engine, db_crud, db_models, redis_db, schema
+from models import archive, db_engine, async_crud, db_models, redis_db
+from models import replica, schema
 from rave_python import RaveExceptions
 # from online_payments.flutterwave import rave_pay
 from online_payments import payments_utils
 from routes_schema import payments_schemas
+from routes_schema.page_schema import Page, page_params, range_params
 from docs.routes import payments_response
 from datetime import date, datetime
 from typing import Annotated
@@ -26,6 +28,23 @@ router = APIRouter(
     },
 )
 
+# the columns read by payments_serializer, the listings load them as rows
+PAYMENT_COLUMNS = (
+    db_models.Payments.ref_id,
+    db_models.Payments.flw_txRef,
+    db_models.Payments.inv_id,
+    db_models.Payments.title,
+    db_models.Payments.paid_by,
+    db_models.Payments.amount,
+    db_models.Payments.paid,
+    db_models.Payments.status,
+    db_models.Payments.paid_at,
+    db_models.Payments.paid_amount,
+    db_models.Payments.payer_email,
+    db_models.Payments.payment_type,
+    db_models.Payments.checkout_type,
+)
+
 redis = redis_db.redis_factory()
 
 
@@ -35,30 +54,41 @@ redis = redis_db.redis_factory()
     description="Returns all payment records on the platform. Can be used by "
     "all users irrespective of their roles, the results is been filtered "
     "internally based on the role type of the active user",
-    response_model=list[payments_schemas.PaymentResponse],
+    response_model=Page[payments_schemas.PaymentResponse],
 )
 async def all_payments(
     active_user: Annotated[dict, Depends(oauth2_users.verify_token)],
-    db: Annotated[Session, Depends(db_engine.get_db)],
+    db: Annotated[AsyncSession, Depends(replica.get_read_db)],
+    page: Annotated[dict, Depends(page_params)],
+    dates: Annotated[dict, Depends(range_params)],
 ):
     """get all payments records"""
 
     if active_user["role"] == "user":
-        records = db_crud.filter_record_in_lifo(
+        records, next_cursor = await async_crud.paginate(
             db,
             db_models.Payments,
             db_models.Payments.paid_at,
-            payer_email=active_user["email"],
+            payer_id=active_user["sub"],
+            columns=PAYMENT_COLUMNS,
+            **page,
+            **dates,
         )
 
     else:
-        records = db_crud.all_record_in_lifo(
-            db, db_models.Payments, db_models.Payments.paid_at
+        records, next_cursor = await async_crud.paginate(
+            db,
+            db_models.Payments,
+            db_models.Payments.paid_at,
+            columns=PAYMENT_COLUMNS,
+            **page,
+            **dates,
         )
 
     check_record(records)
 
-    return [payments_serializer(record) for record in records]
+    data = [payments_serializer(record) for record in records]
+    return {"items": data, "next_cursor": next_cursor}
 
 
 @router.get(
@@ -66,31 +96,40 @@ async def all_payments(
     summary="To see all pending payments on the system",
     description="Use this endpoints to see all pending payments on the "
     "system, can be used by all user roles.",
-    response_model=list[payments_schemas.PendingPayments],
+    response_model=Page[payments_schemas.PendingPayments],
 )
 async def pending_payments(
     active_user: Annotated[dict, Depends(oauth2_users.verify_token)],
-    db: Annotated[Session, Depends(db_engine.get_db)],
+    db: Annotated[AsyncSession, Depends(replica.get_read_db)],
+    page: Annotated[dict, Depends(page_params)],
 ):
     """return all pending payments"""
 
     if active_user["role"] == "user":
-        records = db_crud.filter_record_in_lifo(
+        records, next_cursor = await async_crud.paginate(
             db,
             db_models.Payments,
             db_models.Payments.ref_id,
             # paid=False,
             status="pending",
-            payer_email=active_user["email"],
+            payer_id=active_user["sub"],
+            columns=PAYMENT_COLUMNS,
+            **page,
         )
 
     else:
-        records = db_crud.filter_record_in_lifo(
-            db, db_models.Payments, db_models.Payments.ref_id, paid=False
+        records, next_cursor = await async_crud.paginate(
+            db,
+            db_models.Payments,
+            db_models.Payments.ref_id,
+            paid=False,
+            columns=PAYMENT_COLUMNS,
+            **page,
         )
 
     check_record(records)
-    return [payments_serializer(record) for record in records]
+    data = [payments_serializer(record) for record in records]
+    return {"items": data, "next_cursor": next_cursor}
 
 
 @router.get(
@@ -98,30 +137,42 @@ async def pending_payments(
     summary="To see all succesful payments on the system",
     description="Use this endpoints to see all paid payments on the "
     "system, can be used by all user roles.",
-    response_model=list[payments_schemas.PaymentResponse],
+    response_model=Page[payments_schemas.PaymentResponse],
 )
 async def all_paid_payments(
     active_user: Annotated[dict, Depends(oauth2_users.verify_token)],
-    db: Annotated[Session, Depends(db_engine.get_db)],
+    db: Annotated[AsyncSession, Depends(replica.get_read_db)],
+    page: Annotated[dict, Depends(page_params)],
+    dates: Annotated[dict, Depends(range_params)],
 ):
     """return all paid payments"""
 
     if active_user["role"] == "user":
-        records = db_crud.filter_record_in_lifo(
+        records, next_cursor = await async_crud.paginate(
             db,
             db_models.Payments,
             db_models.Payments.paid_at,
             paid=True,
-            payer_email=active_user["email"],
+            payer_id=active_user["sub"],
+            columns=PAYMENT_COLUMNS,
+            **page,
+            **dates,
         )
 
     else:
-        records = db_crud.filter_record_in_lifo(
-            db, db_models.Payments, db_models.Payments.paid_at, paid=True
+        records, next_cursor = await async_crud.paginate(
+            db,
+            db_models.Payments,
+            db_models.Payments.paid_at,
+            paid=True,
+            columns=PAYMENT_COLUMNS,
+            **page,
+            **dates,
         )
 
     check_record(records)
-    return [payments_serializer(record) for record in records]
+    data = [payments_serializer(record) for record in records]
+    return {"items": data, "next_cursor": next_cursor}
 
 
 @router.get(
@@ -129,33 +180,39 @@ async def all_paid_payments(
     summary="To see all cancelled payments on the system",
     description="Use this endpoints to see all cancelled payments on the "
     "system, can be used by all user roles.",
-    response_model=list[payments_schemas.PendingPayments],
+    response_model=Page[payments_schemas.PendingPayments],
 )
 async def all_cancelled_payments(
     active_user: Annotated[dict, Depends(oauth2_users.verify_token)],
-    db: Annotated[Session, Depends(db_engine.get_db)],
+    db: Annotated[AsyncSession, Depends(replica.get_read_db)],
+    page: Annotated[dict, Depends(page_params)],
 ):
     """return all cancelled payments"""
 
     if active_user["role"] == "user":
-        records = db_crud.filter_record_in_lifo(
+        records, next_cursor = await async_crud.paginate(
             db,
             db_models.Payments,
             db_models.Payments.ref_id,
             status="cancelled",
-            payer_email=active_user["email"],
+            payer_id=active_user["sub"],
+            columns=PAYMENT_COLUMNS,
+            **page,
         )
 
     else:
-        records = db_crud.filter_record_in_lifo(
+        records, next_cursor = await async_crud.paginate(
             db,
             db_models.Payments,
             db_models.Payments.ref_id,
             status="cancelled",
+            columns=PAYMENT_COLUMNS,
+            **page,
         )
 
     check_record(records)
-    return [payments_serializer(record) for record in records]
+    data = [payments_serializer(record) for record in records]
+    return {"items": data, "next_cursor": next_cursor}
 
 
 @router.get(
@@ -163,33 +220,39 @@ async def all_cancelled_payments(
     summary="To see all failed payments on the system",
     description="Use this endpoints to see all failled payments on the "
     "system, can be used by all user roles.",
-    response_model=list[payments_schemas.PendingPayments],
+    response_model=Page[payments_schemas.PendingPayments],
 )
 async def all_failed_payments(
     active_user: Annotated[dict, Depends(oauth2_users.verify_token)],
-    db: Annotated[Session, Depends(db_engine.get_db)],
+    db: Annotated[AsyncSession, Depends(replica.get_read_db)],
+    page: Annotated[dict, Depends(page_params)],
 ):
     """return all failed payments"""
 
     if active_user["role"] == "user":
-        records = db_crud.filter_record_in_lifo(
+        records, next_cursor = await async_crud.paginate(
             db,
             db_models.Payments,
             db_models.Payments.ref_id,
             status="failed",
-            payer_email=active_user["email"],
+            payer_id=active_user["sub"],
+            columns=PAYMENT_COLUMNS,
+            **page,
         )
 
     else:
-        records = db_crud.filter_record_in_lifo(
+        records, next_cursor = await async_crud.paginate(
             db,
             db_models.Payments,
             db_models.Payments.ref_id,
             status="failed",
+            columns=PAYMENT_COLUMNS,
+            **page,
         )
 
     check_record(records)
-    return [payments_serializer(record) for record in records]
+    data = [payments_serializer(record) for record in records]
+    return {"items": data, "next_cursor": next_cursor}
 
 
 @router.get(
@@ -197,33 +260,39 @@ async def all_failed_payments(
     summary="To see all payments with status 'error' on the system",
     description="Use this endpoints to see all payments with status "
     "'error' on the system, can be used by all user roles.",
-    response_model=list[payments_schemas.PendingPayments],
+    response_model=Page[payments_schemas.PendingPayments],
 )
 async def all_payments_errorss(
     active_user: Annotated[dict, Depends(oauth2_users.verify_token)],
-    db: Annotated[Session, Depends(db_engine.get_db)],
+    db: Annotated[AsyncSession, Depends(replica.get_read_db)],
+    page: Annotated[dict, Depends(page_params)],
 ):
     """return all payments error on the system"""
 
     if active_user["role"] == "user":
-        records = db_crud.filter_record_in_lifo(
+        records, next_cursor = await async_crud.paginate(
             db,
             db_models.Payments,
             db_models.Payments.ref_id,
             status="error",
-            payer_email=active_user["email"],
+            payer_id=active_user["sub"],
+            columns=PAYMENT_COLUMNS,
+            **page,
         )
 
     else:
-        records = db_crud.filter_record_in_lifo(
+        records, next_cursor = await async_crud.paginate(
             db,
             db_models.Payments,
             db_models.Payments.ref_id,
             status="error",
+            columns=PAYMENT_COLUMNS,
+            **page,
         )
 
     check_record(records)
-    return [payments_serializer(record) for record in records]
+    data = [payments_serializer(record) for record in records]
+    return {"items": data, "next_cursor": next_cursor}
 
 
 @router.get(
@@ -235,25 +304,20 @@ async def all_payments_errorss(
 async def cancell_transaction(
     refId: str,
     active_user: Annotated[dict, Depends(oauth2_users.verify_token)],
-    db: Annotated[Session, Depends(db_engine.get_db)],
+    db: Annotated[AsyncSession, Depends(db_engine.get_async_db)],
 ):
     """cancels a transaction"""
 
-    if not redis.exists(refId):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="transaction with 'ref_id' already completed or "
-            "terminated/cancelled.",
-        )
+    # only pending payments can move to cancelled
+    async with db_engine.unit_of_work(db):
+        if not await payments_utils.transition(db, refId, "cancelled"):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="can only cancell transaction when status is pending",
+            )
 
-    payment_record = payments_utils.get_payments_record(db, refId)
-    if payment_record.status != "pending":
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="can only cancell transaction when status is pending",
-        )
+        payment_record = await payments_utils.get_payments_record(db, refId)
 
-    payments_utils.update_payment_status(db, payment_record, "cancelled")
     redis.delete(refId)
     return payment_record
 
@@ -267,7 +331,8 @@ async def cancell_transaction(
 )
 async def total_revenue(
     active_user: Annotated[dict, Depends(oauth2_users.verify_token)],
-    db: Annotated[Session, Depends(db_engine.get_db)],
+    db: Annotated[AsyncSession, Depends(replica.get_read_db)],
+    dates: Annotated[dict, Depends(range_params)],
 ):
     """returns the total revenue"""
 
@@ -294,21 +359,33 @@ async def total_revenue(
     #            .all()
     #        )
 
+    since = dates["since"]
+
+    def paid_invoices(table):
+        query = select(table.c.paid_at, table.c.price).where(
+            table.c.paid == True
+        )
+
+        if since is not None:
+            query = query.where(table.c.paid_at >= since)
+
+        return query
+
+    # the archived invoices count in the revenue of all time
+    paid = archive.with_archive(
+        db_models.Invoices.__table__, since, paid_invoices, all_time=True
+    ).subquery()
+
     try:
         records = (
-            db.query(
-                func.extract("year", db_models.Invoices.paid_at).label(
-                    "year"
-                ),
-                func.extract("month", db_models.Invoices.paid_at).label(
-                    "month"
-                ),
-                func.sum(db_models.Invoices.price).label("amount"),
+            await db.execute(
+                select(
+                    func.extract("year", paid.c.paid_at).label("year"),
+                    func.extract("month", paid.c.paid_at).label("month"),
+                    func.sum(paid.c.price).label("amount"),
+                ).group_by("year", "month")
             )
-            .filter(db_models.Invoices.paid == True)
-            .group_by("year", "month")
-            .all()
-        )
+        ).all()
 
     except Exception as err:
         # send mail
@@ -332,7 +409,7 @@ async def total_revenue(
 )
 async def user_total_spend(
     active_user: Annotated[dict, Depends(oauth2_users.verify_token)],
-    db: Annotated[Session, Depends(db_engine.get_db)],
+    db: Annotated[AsyncSession, Depends(replica.get_read_db)],
 ):
     """Returns the total amount spent by a user"""
 
@@ -342,11 +419,20 @@ async def user_total_spend(
             detail="Unathorized access to resource",
         )
 
-    records = db_crud.get_by(
-        db, db_models.Invoices, to_email=active_user["email"], paid=True
-    )
+    def paid_invoices(table):
+        return select(table.c.price).where(
+            table.c.to_user_id == active_user["sub"],
+            table.c.paid == True,
+        )
 
-    spent_amount = sum(record.price for record in records if record.paid)
+    # the archived invoices were paid too
+    paid = archive.with_archive(
+        db_models.Invoices.__table__, None, paid_invoices, all_time=True
+    ).subquery()
+
+    spent_amount = await db.scalar(
+        select(func.coalesce(func.sum(paid.c.price), 0))
+    )
 
     return {
         "name": active_user["name"],
@@ -364,14 +450,19 @@ async def user_total_spend(
 async def payment_details_by_ref(
     refId: str,
     active_user: Annotated[dict, Depends(oauth2_users.verify_token)],
-    db: Annotated[Session, Depends(db_engine.get_db)],
+    db: Annotated[AsyncSession, Depends(replica.get_read_db)],
 ):
     """gets the transaction details"""
 
-    record = db_crud.get_specific_record(
+    record = await async_crud.get_specific_record(
         db, db_models.Payments, ref_id=refId
     )
 
+    if not record:
+        record = await async_crud.get_archived_record(
+            db, db_models.Payments, ref_id=refId
+        )
+
     check_record(record)
 
     return payments_serializer(record)
@@ -8,10 +8,16 @@ from fastapi import (
     UploadFile,
 )
 from fastapi.templating import Jinja2Templates
-from sqlalchemy.orm import Session
-from models import db_engine, db_crud, db_models, schema
-from auth import oauth2_users
-from utils import email_notification, password_hash, verify_number
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import db_engine, async_crud, db_models, replica, schema
+from auth import oauth2_users, token_store, user_cache
+from routes_schema.page_schema import Page, page_params
+from utils import (
+    email_notification,
+    login_tracker,
+    password_hash,
+    verify_number,
+)
 from utils import google_drive as cloud
 from typing import Annotated, Dict, List
 from pydantic import BaseModel, EmailStr
@@ -35,6 +41,20 @@ router = APIRouter(
     },
 )
 
+# the columns read by serialize_user, the listings load them as rows
+USER_COLUMNS = (
+    db_models.User.user_id,
+    db_models.User.first_name,
+    db_models.User.last_name,
+    db_models.User.email,
+    db_models.User.phone_num,
+    db_models.User.role,
+    db_models.User.is_verified,
+    db_models.User.profile_pic,
+    db_models.User.date_joined,
+    db_models.User.last_login,
+)
+
 
 USER_ROLES = ("admin", "user", "manager", "staff")
 
@@ -104,11 +124,12 @@ class AllUsersResponse(BaseModel):
     "/",
     summary="Gets all verified user accounts on the system",
     description="This endpoint should be used by users with role 'admin' only.",
-    response_model=list[AllUsersResponse],
+    response_model=Page[AllUsersResponse],
 )
 async def get_users(
     user: Annotated[dict, Depends(oauth2_users.verify_token)],
-    db: Annotated[Session, Depends(db_engine.get_db)],
+    db: Annotated[AsyncSession, Depends(replica.get_read_db)],
+    page: Annotated[dict, Depends(page_params)],
 ):
     """gets all user role account in the user table"""
 
@@ -118,17 +139,25 @@ async def get_users(
             detail="Unauthorized access to resource",
         )
 
-    users = db_crud.get_all(db, db_models.User)
+    users, next_cursor = await async_crud.paginate(
+        db,
+        db_models.User,
+        db_models.User.date_joined,
+        is_verified=True,
+        columns=USER_COLUMNS,
+        **page,
+    )
     if not users:
-        return HTTPException(
+        raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="No users on the system",
         )
 
-    all_users = [
-        serialize_user(user) for user in users if user.is_verified
-    ]
-    return all_users
+    all_users = [serialize_user(user) for user in users]
+    return {
+        "items": await login_tracker.merge_last_login(all_users),
+        "next_cursor": next_cursor,
+    }
 
 
 @router.get(
@@ -136,11 +165,12 @@ async def get_users(
     summary="Returns all account with role 'user'",
     description="Returns all 'user' role accounts. Should only be used by "
     "previledged users.",
-    response_model=list[AllUsersResponse],
+    response_model=Page[AllUsersResponse],
 )
 async def all_users(
     user: Annotated[dict, Depends(oauth2_users.verify_token)],
-    db: Annotated[Session, Depends(db_engine.get_db)],
+    db: Annotated[AsyncSession, Depends(replica.get_read_db)],
+    page: Annotated[dict, Depends(page_params)],
 ):
     """gets all accounts of role 'user'"""
 
@@ -150,14 +180,25 @@ async def all_users(
             detail="Unauthorized access to resource",
         )
 
-    records = db_crud.get_by(db, db_models.User, role="user")
+    records, next_cursor = await async_crud.paginate(
+        db,
+        db_models.User,
+        db_models.User.date_joined,
+        role="user",
+        columns=USER_COLUMNS,
+        **page,
+    )
     if not records:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="No user with role 'user' found",
         )
 
-    return [serialize_user(record) for record in records]
+    data = [serialize_user(record) for record in records]
+    return {
+        "items": await login_tracker.merge_last_login(data),
+        "next_cursor": next_cursor,
+    }
 
 
 @router.get(
@@ -165,11 +206,12 @@ async def all_users(
     summary="Returns all accounts of type 'staff'",
     description="This endpoint allows you to get all account with "
     "role 'staff'.",
-    response_model=list[AllUsersResponse],
+    response_model=Page[AllUsersResponse],
 )
 async def all_staffs(
     user: Annotated[dict, Depends(oauth2_users.verify_token)],
-    db: Annotated[Session, Depends(db_engine.get_db)],
+    db: Annotated[AsyncSession, Depends(replica.get_read_db)],
+    page: Annotated[dict, Depends(page_params)],
 ):
     """get all staffs"""
 
@@ -179,14 +221,25 @@ async def all_staffs(
     #        detail="Unauthorized access to resource",
     #    )
 
-    records = db_crud.get_by(db, db_models.User, role="staff")
+    records, next_cursor = await async_crud.paginate(
+        db,
+        db_models.User,
+        db_models.User.date_joined,
+        role="staff",
+        columns=USER_COLUMNS,
+        **page,
+    )
     if not records:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="No staff found on the system",
         )
 
-    return [serialize_user(record) for record in records]
+    data = [serialize_user(record) for record in records]
+    return {
+        "items": await login_tracker.merge_last_login(data),
+        "next_cursor": next_cursor,
+    }
 
 
 @router.get(
@@ -194,11 +247,12 @@ async def all_staffs(
     summary="Returns all user accounts of role type 'manager'",
     description="returns a list of objects containing all users "
     "with role type 'manager'.",
-    response_model=list[AllUsersResponse],
+    response_model=Page[AllUsersResponse],
 )
 async def all_managers(
     user: Annotated[dict, Depends(oauth2_users.verify_token)],
-    db: Annotated[Session, Depends(db_engine.get_db)],
+    db: Annotated[AsyncSession, Depends(replica.get_read_db)],
+    page: Annotated[dict, Depends(page_params)],
 ):
     """returns all managers"""
 
@@ -208,25 +262,37 @@ async def all_managers(
     #        detail="Unauthorized access to resource",
     #    )
 
-    records = db_crud.get_by(db, db_models.User, role="manager")
+    records, next_cursor = await async_crud.paginate(
+        db,
+        db_models.User,
+        db_models.User.date_joined,
+        role="manager",
+        columns=USER_COLUMNS,
+        **page,
+    )
     if not records:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="No managers found",
         )
 
-    return [serialize_user(record) for record in records]
+    data = [serialize_user(record) for record in records]
+    return {
+        "items": await login_tracker.merge_last_login(data),
+        "next_cursor": next_cursor,
+    }
 
 
 @router.get(
     "/allAdmin",
     summary="Returns all administrators",
     description="Returns all administrators on the system",
-    response_model=list[AllUsersResponse],
+    response_model=Page[AllUsersResponse],
 )
 async def all_admins(
     user: Annotated[dict, Depends(oauth2_users.verify_token)],
-    db: Annotated[Session, Depends(db_engine.get_db)],
+    db: Annotated[AsyncSession, Depends(replica.get_read_db)],
+    page: Annotated[dict, Depends(page_params)],
 ):
     """get all admins"""
 
@@ -236,14 +302,25 @@ async def all_admins(
     #        detail="Unauthorized access to resource",
     #    )
 
-    records = db_crud.get_by(db, db_models.User, role="admin")
+    records, next_cursor = await async_crud.paginate(
+        db,
+        db_models.User,
+        db_models.User.date_joined,
+        role="admin",
+        columns=USER_COLUMNS,
+        **page,
+    )
     if not records:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="No admin found",
         )
 
-    return [serialize_user(record) for record in records]
+    data = [serialize_user(record) for record in records]
+    return {
+        "items": await login_tracker.merge_last_login(data),
+        "next_cursor": next_cursor,
+    }
 
 
 # temp
@@ -264,16 +341,16 @@ class ProfileResponse(BaseModel):
 )
 async def user_profile(
     token: Annotated[dict, Depends(oauth2_users.verify_token)],
-    db: Annotated[Session, Depends(db_engine.get_db)],
+    db: Annotated[AsyncSession, Depends(replica.get_read_db)],
 ) -> dict:
     """return the users details"""
 
-    record = db_crud.get_specific_record(
+    record = await async_crud.get_specific_record(
         db, db_models.User, user_id=token["sub"]
     )
 
     profile = serialize_user(record)
-    return profile
+    return (await login_tracker.merge_last_login([profile]))[0]
 
 
 @router.get(
@@ -286,7 +363,7 @@ async def user_profile(
 async def user_details_by_id(
     userId: int,
     user: Annotated[dict, Depends(oauth2_users.verify_token)],
-    db: Annotated[Session, Depends(db_engine.get_db)],
+    db: Annotated[AsyncSession, Depends(replica.get_read_db)],
 ):
     """gets a user record by the id specified"""
 
@@ -296,7 +373,7 @@ async def user_details_by_id(
             detail="Unauthorized access to resource",
         )
 
-    record = db_crud.get_specific_record(
+    record = await async_crud.get_specific_record(
         db, db_models.User, user_id=userId
     )
 
@@ -307,7 +384,7 @@ async def user_details_by_id(
         )
 
     user = serialize_user(record)
-    return user
+    return (await login_tracker.merge_last_login([user]))[0]
 
 
 # temp
@@ -325,14 +402,14 @@ class UserRegistrationToken(BaseModel):
 )
 async def register_user(
     payload: schema.RegisterUser,
-    db: Annotated[Session, Depends(db_engine.get_db)],
+    db: Annotated[AsyncSession, Depends(db_engine.get_async_db)],
     bg_task: BackgroundTasks,
     req: Request,
 ):
     """Adds a user to the database"""
 
     check_user_payload(payload)
-    resp = db_crud.get_specific_record(
+    resp = await async_crud.get_specific_record(
         db, db_models.User, email=payload.email
     )
 
@@ -344,14 +421,16 @@ async def register_user(
 
     acc_status = "Unverified"
     temp_data = payload.model_dump().copy()
-    temp_data["password"] = password_hash.hash_pwd(temp_data["password"])
+    temp_data["password"] = await password_hash.async_hash_pwd(
+        temp_data["password"]
+    )
     temp_data.update(date_joined=datetime.datetime.utcnow())
 
     if temp_data["role"] == "admin":
         temp_data.update(is_verified=True)
         acc_status = "verified"
 
-    db_crud.save(db, db_models.User, temp_data)
+    await async_crud.save(db, db_models.User, temp_data)
 
     # email_token = oauth2_users.email_verification_token(payload.email)
     # message = templates.TemplateResponse(
@@ -384,7 +463,7 @@ async def register_user(
 async def change_user_role(
     payload: schema.ChangeUserRole,
     user: Annotated[dict, Depends(oauth2_users.verify_token)],
-    db: Annotated[Session, Depends(db_engine.get_db)],
+    db: Annotated[AsyncSession, Depends(db_engine.get_async_db)],
 ):
     """Updates the existing record of the user to the information
     provided on the payload
@@ -412,7 +491,7 @@ async def change_user_role(
     #        detail="can't update your own role",
     #    )
 
-    record = db_crud.get_specific_record(
+    record = await async_crud.get_specific_record(
         db, db_models.User, email=payload.user_email
     )
 
@@ -430,8 +509,10 @@ async def change_user_role(
 
     record.role = payload.role
 
-    db.commit()
-    db.refresh(record)
+    await db.commit()
+    await db.refresh(record)
+    user_cache.invalidate(record.email)
+    token_store.bump_token_version(record.user_id)
 
     user_data = {
         "user_id": record.user_id,
@@ -451,7 +532,7 @@ async def change_user_role(
 async def user_profile_pic(
     file: UploadFile,
     user: Annotated[dict, Depends(oauth2_users.verify_token)],
-    db: Annotated[Session, Depends(db_engine.get_db)],
+    db: Annotated[AsyncSession, Depends(db_engine.get_async_db)],
 ):
     """uploads profile picture"""
 
@@ -478,7 +559,7 @@ async def user_profile_pic(
         file.content_type,
     )
 
-    record = db_crud.get_specific_record(
+    record = await async_crud.get_specific_record(
         db, db_models.User, user_id=user["sub"]
     )
 
@@ -487,8 +568,8 @@ async def user_profile_pic(
     )
 
     try:
-        db.commit()
-        db.refresh(record)
+        await db.commit()
+        await db.refresh(record)
 
     except Exception as err:
         print(err)
@@ -1,4 +1,5 @@
 from pydantic import BaseModel, EmailStr
+from routes_schema.payments_schemas import PaymentResponse
 from datetime import datetime, date
 
 
@@ -20,6 +21,29 @@ class InvoiceResponse(BaseModel):
     status: str | None
 
 
+class PayerProfile(BaseModel):
+    user_id: int
+    name: str
+    email: EmailStr
+    phone_num: str
+    profile_pic: str | None
+
+
+class InvoiceDetailResponse(InvoiceResponse):
+    payments: list[PaymentResponse]
+    payer: PayerProfile | None
+
+
+class StatusCounter(BaseModel):
+    count: int
+    total: float
+
+
+class SummaryResponse(BaseModel):
+    invoices: dict[str, StatusCounter]
+    payments: dict[str, StatusCounter]
+
+
 class UpdateInvoice(BaseModel):
     inv_id: str
     title: str
@@ -0,0 +1,44 @@
+from fastapi import Query
+from pydantic import BaseModel
+from typing import Annotated, Generic, TypeVar
+import datetime
+
+
+T = TypeVar("T")
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+class Page(BaseModel, Generic[T]):
+    """a page of records, pass next_cursor back as the cursor query
+    parameter to get the next page. next_cursor is null on the last page.
+    """
+
+    items: list[T]
+    next_cursor: str | None
+
+
+def page_params(
+    cursor: str | None = None,
+    limit: Annotated[
+        int, Query(ge=1, le=MAX_PAGE_SIZE)
+    ] = DEFAULT_PAGE_SIZE,
+) -> dict:
+    """the pagination query parameters of list endpoints"""
+
+    return {"cursor": cursor, "limit": limit}
+
+
+def range_params(
+    since: Annotated[
+        datetime.date | None,
+        Query(
+            description="only the records on or after this date, older "
+            "dates include the archived records"
+        ),
+    ] = None,
+) -> dict:
+    """the date range query parameters of list endpoints sorted by date"""
+
+    return {"since": since}
@@ -0,0 +1,113 @@
+# The tests run against a throwaway sqlite database and a fake redis server,
+# DATABASE_URI and the redis clients are set before the app modules are
+# imported as the engines and some clients are built on import.
+# run `python -m pytest` from src/backend.
+
+import os, sys, tempfile
+
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+os.environ["DATABASE_URI"] = "sqlite:///" + os.path.join(
+    tempfile.mkdtemp(), "test.sqlite"
+)
+os.environ.pop("ASYNC_DATABASE_URI", None)
+os.environ.pop("READ_DATABASE_URI", None)
+for name, value in {
+    "SECRET_KEY": "test",
+    "ALGORITHM": "HS256",
+    "TOKEN_EXPIRATION_TIME": "30",
+    "FRONTEND_URL": "http://localhost",
+    "LIVE_PUBLIC_KEY": "FLWPUBK-test",
+    "LIVE_SECRET_KEY": "FLWSECK-test",
+    "RAVE_SECRET_KEY": "FLWSECK-test",
+    # the background jobs would add their queries to the counted ones
+    "EXPIRY_INTERVAL": "0",
+    "DB_HEALTH_INTERVAL": "3600",
+}.items():
+    os.environ.setdefault(name, value)
+
+from models import redis_db
+import fakeredis, pytest
+
+
+REDIS_SERVER = fakeredis.FakeServer()
+redis_db.redis_client = fakeredis.FakeStrictRedis(
+    server=REDIS_SERVER, decode_responses=True
+)
+
+
+@pytest.fixture(scope="session")
+def migrated():
+    """the database with every migration applied"""
+
+    import migrations
+
+    migrations.upgrade()
+
+
+@pytest.fixture(scope="module")
+def app_client(migrated):
+    """a client of the app, with the redis clients on a fake server
+
+    module scoped, the async engine pool is tied to the loop of the client
+    and disposed with it
+    """
+
+    import fakeredis, main
+    from fastapi.testclient import TestClient
+    from models import db_engine, redis_db
+
+    # the shutdown of the previous client closed the async one
+    redis_db.async_redis_client = fakeredis.FakeAsyncRedis(
+        server=REDIS_SERVER, decode_responses=True
+    )
+    with TestClient(main.app) as client:
+        yield client
+        client.portal.call(db_engine.async_engine.dispose)
+
+
+@pytest.fixture(scope="module")
+def login(app_client):
+    """registers, verifies and logs in users, returns their auth headers
+
+    login(email, role="user", verified=True)
+    """
+
+    def login(email: str, role: str = "user", verified: bool = True):
+        response = app_client.post(
+            "/user/register",
+            json={
+                "first_name": "Test",
+                "last_name": role,
+                "email": email,
+                "password": "password",
+                "phone_num": "+2348091234567",
+                "role": role,
+            },
+        )
+        assert response.status_code == 201, response.text
+
+        if verified:
+            verify_email(app_client, email)
+
+        response = app_client.post(
+            "/auth/", data={"username": email, "password": "password"}
+        )
+        assert response.status_code == 200, response.text
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    return login
+
+
+def verify_email(client, email: str) -> None:
+    """verifies the email through /auth/verifyEmail"""
+
+    from auth import oauth2_users
+    from utils import redis_user_token
+
+    token = oauth2_users.email_verification_token(email)
+    redis_user_token.add_email_token(email + ":email_token", token)
+    response = client.get("/auth/verifyEmail", params={"token": token})
+    assert response.status_code == 200, response.text
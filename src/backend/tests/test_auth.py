@@ -0,0 +1,45 @@
+# Checks the claims of versioned tokens never outlive the user state they
+# were issued with, see auth.oauth2_users.verify_token.
+
+from conftest import verify_email
+
+
+def test_token_issued_before_verification_works_after_it(app_client, login):
+    headers = login("unverified@example.com", verified=False)
+    response = app_client.get("/user/profile", headers=headers)
+    assert response.status_code == 401
+    assert response.json()["detail"] == "User not verified"
+
+    verify_email(app_client, "unverified@example.com")
+
+    response = app_client.get("/user/profile", headers=headers)
+    assert response.status_code == 200, response.text
+
+
+def test_demoted_admin_loses_admin_rights(app_client, login):
+    admin = login("admin@example.com", role="admin")
+    demoted = login("demoted@example.com", role="admin")
+    assert app_client.get("/user/allUsers", headers=demoted).status_code == 200
+
+    response = app_client.patch(
+        "/user/changeRole",
+        headers=admin,
+        json={"user_email": "demoted@example.com", "role": "user"},
+    )
+    assert response.status_code == 200, response.text
+
+    response = app_client.get("/user/allUsers", headers=demoted)
+    assert response.status_code == 401
+
+
+def test_logout_all_revokes_every_token(app_client, login):
+    first = login("devices@example.com")
+    response = app_client.post(
+        "/auth/",
+        data={"username": "devices@example.com", "password": "password"},
+    )
+    second = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    assert app_client.get("/auth/logoutAll", headers=first).status_code == 200
+    assert app_client.get("/user/profile", headers=first).status_code == 401
+    assert app_client.get("/user/profile", headers=second).status_code == 401
@@ -0,0 +1,133 @@
+# Checks the exports stream the rows a batch at a time with flat memory,
+# and that the request deadline doesn't cut a stream short, see
+# routes.export and deadlines.STREAMED_ROUTES.
+
+from sqlalchemy import func, select, union_all
+from models import db_engine, db_models, deadlines
+from routes import export
+import asyncio, datetime, pytest, time, tracemalloc
+
+
+ROWS = 20000
+BATCH_SIZE = 500
+
+invoices = db_models.Invoices.__table__
+
+
+@pytest.fixture(scope="module")
+def admin(app_client, login):
+    """an admin, with ROWS invoices in the database"""
+
+    now = datetime.datetime.utcnow()
+    with db_engine.engine.begin() as connection:
+        connection.execute(
+            invoices.insert(),
+            [
+                {
+                    "inv_id": f"JPC-EXPORT{index}",
+                    "title": "invoice",
+                    "desc": "exported invoice",
+                    "price": 10,
+                    "to_email": "export@example.com",
+                    "created_at": now - datetime.timedelta(seconds=index),
+                    "created_by": "admin",
+                    "due_date": now.date(),
+                    "status": "pending",
+                    "paid": False,
+                }
+                for index in range(ROWS)
+            ],
+        )
+
+    return login("export-admin@example.com", role="admin")
+
+
+def invoice_count() -> int:
+    """the invoices exported without since, the archived ones included"""
+
+    archived = db_models.invoices_archive
+    with db_engine.engine.connect() as connection:
+        return connection.scalar(
+            select(func.count()).select_from(
+                union_all(
+                    select(invoices.c.inv_id), select(archived.c.inv_id)
+                ).subquery()
+            )
+        )
+
+
+def test_rows_are_streamed_in_batches(app_client, admin, monkeypatch):
+    monkeypatch.setattr(export, "EXPORT_BATCH_SIZE", BATCH_SIZE)
+    names = [column.name for column in invoices.columns]
+    query = export.export_query(invoices, names, "created_at", None, None)
+
+    async def stream() -> tuple[list[int], int]:
+        """the rows of each chunk and the peak memory of the stream"""
+
+        tracemalloc.start()
+        try:
+            chunks = [
+                chunk.count(b"\n")
+                async for chunk in export.stream_rows(
+                    db_engine.async_engine, [query], names, "ndjson"
+                )
+            ]
+            return chunks, tracemalloc.get_traced_memory()[1]
+
+        finally:
+            tracemalloc.stop()
+
+    async def load() -> int:
+        """the peak memory of the same rows fetched at once"""
+
+        tracemalloc.start()
+        try:
+            async with db_engine.async_engine.connect() as connection:
+                rows = (await connection.execute(query)).all()
+                export.encode_rows(rows, names, "ndjson")
+
+            return tracemalloc.get_traced_memory()[1]
+
+        finally:
+            tracemalloc.stop()
+
+    chunks, streamed_peak = app_client.portal.call(stream)
+    loaded_peak = app_client.portal.call(load)
+
+    assert sum(chunks) >= ROWS
+    assert max(chunks) == BATCH_SIZE
+    assert len(chunks) >= ROWS // BATCH_SIZE
+    assert streamed_peak < loaded_peak / 4
+
+
+def test_streams_outlive_the_request_budget(app_client, admin, monkeypatch):
+    encode_rows = export.encode_rows
+
+    def slow_encode_rows(rows, names, format):
+        time.sleep(0.01)
+        return encode_rows(rows, names, format)
+
+    monkeypatch.setitem(deadlines.ROUTE_BUDGETS, "GET /export/invoices", 0.3)
+    monkeypatch.setattr(export, "EXPORT_BATCH_SIZE", 100)
+    monkeypatch.setattr(export, "encode_rows", slow_encode_rows)
+
+    start = time.monotonic()
+    response = app_client.get("/export/invoices", headers=admin)
+    assert time.monotonic() - start > 0.3
+
+    assert response.status_code == 200
+    # the header and every row
+    assert response.text.count("\n") == invoice_count() + 1
+
+
+def test_budget_still_applies_before_the_response(
+    app_client, admin, monkeypatch
+):
+    async def slow_export_table(request, db_table, params):
+        await asyncio.sleep(1)
+
+    monkeypatch.setitem(deadlines.ROUTE_BUDGETS, "GET /export/invoices", 0.3)
+    monkeypatch.setattr(export, "export_table", slow_export_table)
+
+    response = app_client.get("/export/invoices", headers=admin)
+    assert response.status_code == 504
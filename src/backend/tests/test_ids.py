@@ -0,0 +1,89 @@
+# Checks the invoice IDs of concurrent workers never collide and the node
+# claims of utils.ids, the workers are processes each holding a node
+# claimed from a fake redis server and minting IDs from several threads.
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from utils import ids
+import fakeredis, pytest
+
+
+WORKERS = 4
+THREADS = 8
+IDS = 10000
+
+
+@pytest.fixture
+def client():
+    """a fresh fake redis and a worker without a node"""
+
+    ids.node, ids.node_key = None, None
+    yield fakeredis.FakeStrictRedis(decode_responses=True)
+    ids.node, ids.node_key = None, None
+
+
+def mint(node: int, count: int) -> list[str]:
+    """mints count invoice IDs from THREADS threads with the node given"""
+
+    ids.node = node
+    with ThreadPoolExecutor(max_workers=THREADS) as pool:
+        return list(pool.map(lambda _: ids.invoice_id(), range(count)))
+
+
+def test_concurrent_workers_never_collide(client):
+    nodes = []
+    for _ in range(WORKERS):
+        ids.node = None
+        nodes.append(ids.claim_node(client))
+
+    assert len(set(nodes)) == WORKERS
+
+    with ProcessPoolExecutor(max_workers=WORKERS) as pool:
+        batches = pool.map(mint, nodes, [IDS // WORKERS] * WORKERS)
+        generated = [id_ for batch in batches for id_ in batch]
+
+    assert len(generated) == IDS
+    assert len(set(generated)) == IDS
+    assert all(len(id_) == len("JPC-") + ids.WIDTH for id_ in generated)
+
+
+def test_claim_fails_once_every_node_is_taken(client):
+    for _ in range(1 << ids.NODE_BITS):
+        ids.node = None
+        ids.claim_node(client)
+
+    ids.node = None
+    with pytest.raises(RuntimeError):
+        ids.claim_node(client)
+
+    # a node freed by a worker shutting down is claimed again
+    client.delete(ids.NODE_KEY.format(5))
+    assert ids.claim_node(client) == 5
+
+
+def test_keep_node_refreshes_the_claim(client):
+    node = ids.claim_node(client)
+    client.expire(ids.node_key, 1)
+
+    assert ids.keep_node(client) == node
+    assert client.ttl(ids.node_key) > 1
+
+
+def test_keep_node_claims_another_node_when_lost(client):
+    node = ids.claim_node(client)
+    # the claim expired and another worker took the node
+    client.set(ids.node_key, "another worker")
+
+    assert ids.keep_node(client) != node
+    assert client.get(ids.NODE_KEY.format(node)) == "another worker"
+
+
+def test_release_node_only_frees_its_own_claim(client):
+    node = ids.claim_node(client)
+    key = ids.node_key
+    ids.release_node(client)
+    assert client.get(key) is None
+
+    client.set(key, "another worker")
+    ids.node, ids.node_key = node, key
+    ids.release_node(client)
+    assert client.get(key) == "another worker"
@@ -0,0 +1,171 @@
+# Checks the list endpoints queries use the indexes of the list_indexes
+# migration and its successors, each paginate call of the routes is run
+# and the plan of its query is read with EXPLAIN QUERY PLAN. A filter or
+# keyset ORDER BY drifting away from its index shows up as a full table
+# SCAN or as a temp b-tree sorting the rows.
+
+from sqlalchemy import event
+from models import async_crud, db_engine, db_models
+import asyncio, datetime, pytest
+
+
+Invoices = db_models.Invoices
+Payments = db_models.Payments
+
+# name => (table, sort column, filters), as called by the routes
+LISTS = {
+    "users": (
+        db_models.User,
+        db_models.User.date_joined,
+        {"is_verified": True},
+    ),
+    "users by role": (
+        db_models.User,
+        db_models.User.date_joined,
+        {"role": "staff"},
+    ),
+    "drafts": (
+        db_models.Drafts,
+        db_models.Drafts.last_updated,
+        {"user_id": 1},
+    ),
+    "received notes": (
+        db_models.RecievedNotes,
+        db_models.RecievedNotes.sent_time,
+        {"to_id": 1},
+    ),
+    "files": (
+        db_models.Files,
+        db_models.Files.date_uploaded,
+        {"owner_id": 1},
+    ),
+    "files by folder": (
+        db_models.Files,
+        db_models.Files.date_uploaded,
+        {"owner_id": 1, "folder": "docs"},
+    ),
+    "user invoices": (Invoices, Invoices.created_at, {"to_user_id": 1}),
+    "all invoices": (Invoices, Invoices.created_at, {}),
+    "user pending invoices": (
+        Invoices,
+        Invoices.created_at,
+        {"paid": False, "status": "pending", "to_user_id": 1},
+    ),
+    "pending invoices": (
+        Invoices,
+        Invoices.created_at,
+        {"paid": False, "status": "pending"},
+    ),
+    "user expired invoices": (
+        Invoices,
+        Invoices.created_at,
+        {"paid": False, "status": "expired", "to_user_id": 1},
+    ),
+    "expired invoices": (
+        Invoices,
+        Invoices.created_at,
+        {"paid": False, "status": "expired"},
+    ),
+    "user paid invoices": (
+        Invoices,
+        Invoices.paid_at,
+        {"to_user_id": 1, "paid": True},
+    ),
+    "paid invoices": (Invoices, Invoices.paid_at, {"paid": True}),
+    "user payments": (Payments, Payments.paid_at, {"payer_id": 1}),
+    "all payments": (Payments, Payments.paid_at, {}),
+    "user pending payments": (
+        Payments,
+        Payments.ref_id,
+        {"status": "pending", "payer_id": 1},
+    ),
+    "pending payments": (Payments, Payments.ref_id, {"paid": False}),
+    "user paid payments": (
+        Payments,
+        Payments.paid_at,
+        {"paid": True, "payer_id": 1},
+    ),
+    "paid payments": (Payments, Payments.paid_at, {"paid": True}),
+    "user cancelled payments": (
+        Payments,
+        Payments.ref_id,
+        {"status": "cancelled", "payer_id": 1},
+    ),
+    "cancelled payments": (Payments, Payments.ref_id, {"status": "cancelled"}),
+}
+
+
+def page_statements(db_table, column, filters: dict, cursor=None) -> list:
+    """runs the paginate call, returns the (statement, parameters) run"""
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    async def page():
+        async with db_engine.AsyncSessionLocal() as session:
+            await async_crud.paginate(
+                session, db_table, column, cursor=cursor, **filters
+            )
+
+        # the pooled connections belong to the event loop of this run
+        await db_engine.async_engine.dispose()
+
+    sync_engine = db_engine.async_engine.sync_engine
+    event.listen(sync_engine, "before_cursor_execute", record)
+    try:
+        asyncio.run(page())
+
+    finally:
+        event.remove(sync_engine, "before_cursor_execute", record)
+
+    return [
+        (statement, parameters)
+        for statement, parameters in statements
+        if statement.lstrip().upper().startswith("SELECT")
+    ]
+
+
+def query_plan(statement: str, parameters) -> list[str]:
+    with db_engine.engine.connect() as connection:
+        rows = connection.exec_driver_sql(
+            "EXPLAIN QUERY PLAN " + statement, parameters
+        ).all()
+
+    return [row.detail for row in rows]
+
+
+@pytest.mark.parametrize("name", LISTS)
+@pytest.mark.parametrize("paged", [False, True], ids=["first", "next"])
+def test_list_query_uses_index(migrated, name, paged):
+    db_table, column, filters = LISTS[name]
+    cursor = None
+    if paged:
+        primary_key = db_table.__mapper__.primary_key[0]
+        value = datetime.datetime(2024, 1, 1)
+        if column is primary_key:
+            value = "REF-1"
+
+        key = 1 if primary_key.type.python_type is int else "KEY-1"
+        cursor = async_crud.encode_cursor(value, key)
+
+    statements = page_statements(db_table, column, filters, cursor)
+    assert statements, name
+
+    for statement, parameters in statements:
+        plan = query_plan(statement, parameters)
+        table = db_table.__tablename__
+        if filters:
+            assert any(
+                step.startswith(f"SEARCH {table} USING")
+                and "INDEX" in step
+                for step in plan
+            ), (name, plan)
+
+        assert not any(
+            step.startswith("SCAN") and "INDEX" not in step for step in plan
+        ), (name, plan)
+        # sqlite indexes only end with the rowid, the ties of the sort
+        # column on a text primary key are sorted on their own
+        assert "USE TEMP B-TREE FOR ORDER BY" not in plan, (name, plan)
@@ -0,0 +1,31 @@
+# Checks the login times buffered in redis by utils.login_tracker show up
+# in the user listings before and after they're flushed to the db.
+
+from models import redis_db
+from utils import login_tracker
+import datetime
+
+
+def test_buffered_login_is_listed_then_flushed(app_client, login):
+    before = datetime.datetime.utcnow()
+    headers = login("tracked@example.com")
+    user_id = app_client.get("/user/profile", headers=headers).json()[
+        "user_id"
+    ]
+
+    assert redis_db.redis_factory().hget(
+        login_tracker.LAST_LOGIN_KEY, user_id
+    )
+    profile = app_client.get("/user/profile", headers=headers).json()
+    last_login = datetime.datetime.fromisoformat(profile["last_login"])
+    assert last_login >= before
+
+    assert login_tracker.flush() >= 1
+    assert not redis_db.redis_factory().exists(
+        login_tracker.LAST_LOGIN_KEY, login_tracker.FLUSHING_KEY
+    )
+
+    profile = app_client.get("/user/profile", headers=headers).json()
+    assert datetime.datetime.fromisoformat(profile["last_login"]) == (
+        last_login
+    )
@@ -0,0 +1,131 @@
+# Checks the payment status transitions of the flutterwave callbacks, see
+# payments_utils.TRANSITIONS.
+
+from sqlalchemy import select
+from models import db_engine, db_models
+from online_payments import payments_utils
+import datetime, pytest
+
+
+Payments = db_models.Payments.__table__
+
+
+@pytest.fixture(scope="module")
+def payer_id(app_client, login):
+    headers = login("transitions-payer@example.com")
+    return app_client.get("/user/profile", headers=headers).json()[
+        "user_id"
+    ]
+
+
+@pytest.fixture
+def add_payment(payer_id):
+    """adds a payment of an invoice in the status given, returns its ref"""
+
+    def add_payment(ref_id: str, status: str) -> str:
+        with db_engine.engine.begin() as connection:
+            connection.execute(
+                db_models.Invoices.__table__.insert().values(
+                    inv_id=f"JPC-{ref_id}",
+                    title="invoice",
+                    desc="invoice",
+                    price=10,
+                    to_email="transitions-payer@example.com",
+                    to_user_id=payer_id,
+                    created_at=datetime.datetime.utcnow(),
+                    created_by="admin",
+                    due_date=datetime.date.today(),
+                    status="pending",
+                    paid=False,
+                )
+            )
+            connection.execute(
+                Payments.insert().values(
+                    ref_id=ref_id,
+                    inv_id=f"JPC-{ref_id}",
+                    title="invoice",
+                    amount=10,
+                    paid=False,
+                    status=status,
+                    payer_email="transitions-payer@example.com",
+                    payer_id=payer_id,
+                )
+            )
+
+        return ref_id
+
+    return add_payment
+
+
+@pytest.fixture
+def verifications(monkeypatch):
+    """the refs sent to flutterwave for verification, which confirms the
+    full amount
+    """
+
+    refs = []
+
+    def verv_api_call(refId, header):
+        refs.append(refId)
+        return {
+            "status": "success",
+            "data": {
+                "charged_amount": 10,
+                "flw_ref": "FLW-TRANSITIONS",
+                "payment_type": "card",
+            },
+        }
+
+    monkeypatch.setattr(payments_utils, "verv_api_call", verv_api_call)
+    return refs
+
+
+def payment_status(ref_id: str) -> str:
+    with db_engine.engine.connect() as connection:
+        return connection.scalar(
+            select(Payments.c.status).where(Payments.c.ref_id == ref_id)
+        )
+
+
+def callback(app_client, ref_id: str, tx_status: str):
+    return app_client.get(
+        "/flutterwave/paymentCallback",
+        params={
+            "tx_ref": ref_id,
+            "tx_status": tx_status,
+            "transaction_id": 1,
+        },
+    )
+
+
+def test_completed_callback_retries_a_failed_verification(
+    app_client, add_payment, verifications
+):
+    ref_id = add_payment("JPCR-ERROR", "error")
+
+    assert callback(app_client, ref_id, "completed").status_code == 200
+    assert verifications == [ref_id]
+    assert payment_status(ref_id) == "paid"
+
+
+def test_completed_callback_verifies_a_pending_payment_once(
+    app_client, add_payment, verifications
+):
+    ref_id = add_payment("JPCR-PENDING", "pending")
+
+    assert callback(app_client, ref_id, "completed").status_code == 200
+    assert payment_status(ref_id) == "paid"
+
+    # a repeated callback finds the payment verified
+    assert callback(app_client, ref_id, "completed").status_code == 200
+    assert verifications == [ref_id]
+
+
+def test_failed_callback_doesnt_override_a_failed_verification(
+    app_client, add_payment, verifications
+):
+    ref_id = add_payment("JPCR-ERRFAIL", "error")
+
+    assert callback(app_client, ref_id, "failed").status_code == 200
+    assert verifications == []
+    assert payment_status(ref_id) == "error"
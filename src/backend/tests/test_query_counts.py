@@ -0,0 +1,177 @@
+# Checks the number of queries of the checkout path and the list endpoints
+# stays flat whatever the number of rows, with db_metrics.max_queries. A
+# query added per payment or per listed row, an N+1, fails these tests.
+
+from models import db_engine, db_metrics, db_models
+from online_payments import payments_utils
+import asyncio, datetime, pytest
+
+
+ROWS = 30
+
+Invoices = db_models.Invoices.__table__
+Payments = db_models.Payments.__table__
+
+
+@pytest.fixture(scope="module")
+def user(app_client, login):
+    """a user with ROWS invoices, payments and notes, and their headers"""
+
+    headers = login("counts-user@example.com")
+    user_id = app_client.get("/user/profile", headers=headers).json()[
+        "user_id"
+    ]
+
+    now = datetime.datetime.utcnow()
+    due_date = datetime.date.today() + datetime.timedelta(days=3)
+    with db_engine.engine.begin() as connection:
+        connection.execute(
+            Invoices.insert(),
+            [
+                {
+                    "inv_id": f"JPC-COUNT{index}",
+                    "title": "invoice",
+                    "desc": "invoice",
+                    "price": 10,
+                    "to_email": "counts-user@example.com",
+                    "to_user_id": user_id,
+                    "created_at": now - datetime.timedelta(minutes=index),
+                    "created_by": "admin",
+                    "due_date": due_date,
+                    "status": "paid" if index % 2 else "pending",
+                    "paid": bool(index % 2),
+                    "paid_at": now if index % 2 else None,
+                }
+                for index in range(ROWS)
+            ],
+        )
+        connection.execute(
+            Payments.insert(),
+            [
+                {
+                    "ref_id": f"JPCR-COUNT{index:04d}",
+                    "inv_id": f"JPC-COUNT{index}",
+                    "title": "invoice",
+                    "amount": 10,
+                    "paid": bool(index % 2),
+                    "status": "paid" if index % 2 else "cancelled",
+                    "payer_email": "counts-user@example.com",
+                    "payer_id": user_id,
+                    "paid_at": now - datetime.timedelta(minutes=index),
+                }
+                for index in range(ROWS)
+            ],
+        )
+        connection.execute(
+            db_models.Drafts.__table__.insert(),
+            [
+                {
+                    "user_id": user_id,
+                    "title": f"note {index}",
+                    "content": "content",
+                    "date_created": now,
+                    "last_updated": now - datetime.timedelta(minutes=index),
+                }
+                for index in range(ROWS)
+            ],
+        )
+
+    return {"id": user_id, "headers": headers}
+
+
+def add_pending_payments(inv_id: str, user_id: int, count: int) -> None:
+    if not count:
+        return
+
+    with db_engine.engine.begin() as connection:
+        connection.execute(
+            Payments.insert(),
+            [
+                {
+                    "ref_id": f"JPCR-{inv_id[4:]}-{index}",
+                    "inv_id": inv_id,
+                    "title": "invoice",
+                    "amount": 10,
+                    "paid": False,
+                    "status": "pending",
+                    "payer_email": "counts-user@example.com",
+                    "payer_id": user_id,
+                }
+                for index in range(count)
+            ],
+        )
+
+
+def run_checkout(user_id: int, inv_id: str) -> int:
+    """runs the checks of a checkout and returns the number of queries"""
+
+    async def checkout():
+        try:
+            async with db_engine.AsyncSessionLocal() as session:
+                with db_metrics.count_queries() as stats:
+                    price = await payments_utils.checkout_price(
+                        session, user_id, inv_id
+                    )
+                    await payments_utils.validate_invoice(
+                        session, user_id, inv_id, price
+                    )
+
+                await session.rollback()
+                return stats.count
+
+        finally:
+            # the pooled connections are tied to the loop of asyncio.run
+            await db_engine.async_engine.dispose()
+
+    return asyncio.run(checkout())
+
+
+# pending invoices without payments, with one and with many to cancel
+@pytest.mark.parametrize(
+    "inv_id, pending_payments",
+    [("JPC-COUNT0", 0), ("JPC-COUNT2", 1), ("JPC-COUNT4", ROWS)],
+)
+def test_checkout_queries_dont_grow_with_the_payments(
+    app_client, user, inv_id, pending_payments
+):
+    add_pending_payments(inv_id, user["id"], pending_payments)
+
+    # the invoice twice, the active payments, and with some to cancel their
+    # update and the summary upsert
+    with db_metrics.max_queries(5):
+        count = run_checkout(user["id"], inv_id)
+
+    assert count == (5 if pending_payments else 3)
+
+
+@pytest.mark.parametrize(
+    "path",
+    [
+        "/invoice/all",
+        "/invoice/pending",
+        "/invoice/paidInvoice",
+        "/payments/all",
+        "/payments/paid",
+        "/payments/cancelledPayments",
+        "/notes/",
+    ],
+)
+def test_list_queries_dont_grow_with_the_rows(app_client, user, path):
+    params = {"limit": 5}
+    with db_metrics.max_queries(1):
+        response = app_client.get(
+            path, headers=user["headers"], params=params
+        )
+
+    assert response.status_code == 200, response.text
+    assert response.json()["next_cursor"]
+
+    # a full page of the next rows
+    params = {"limit": 10, "cursor": response.json()["next_cursor"]}
+    with db_metrics.max_queries(1):
+        response = app_client.get(
+            path, headers=user["headers"], params=params
+        )
+
+    assert response.status_code == 200, response.text
+    assert len(response.json()["items"]) == 10
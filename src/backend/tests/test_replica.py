@@ -0,0 +1,77 @@
+# Checks the payments confirmed outside of the payer's requests send the
+# payer's reads to the primary, see models.replica.mark_user_write.
+
+from models import db_engine, db_models, redis_db, replica
+from online_payments import payments_utils
+import datetime, pytest
+
+
+@pytest.fixture
+def payment(app_client, login):
+    """a payment being checked, the ref_id and the payer id"""
+
+    headers = login("replica-payer@example.com")
+    payer_id = app_client.get("/user/profile", headers=headers).json()[
+        "user_id"
+    ]
+
+    with db_engine.engine.begin() as connection:
+        connection.execute(
+            db_models.Invoices.__table__.insert().values(
+                inv_id="JPC-REPLICA",
+                title="invoice",
+                desc="invoice",
+                price=10,
+                to_email="replica-payer@example.com",
+                to_user_id=payer_id,
+                created_at=datetime.datetime.utcnow(),
+                created_by="admin",
+                due_date=datetime.date.today(),
+                status="pending",
+                paid=False,
+            )
+        )
+        connection.execute(
+            db_models.Payments.__table__.insert().values(
+                ref_id="JPCR-REPLICA",
+                inv_id="JPC-REPLICA",
+                title="invoice",
+                amount=10,
+                paid=False,
+                status="checking",
+                payer_email="replica-payer@example.com",
+                payer_id=payer_id,
+            )
+        )
+
+    return "JPCR-REPLICA", payer_id
+
+
+def test_confirmed_payment_marks_the_payer(app_client, payment, monkeypatch):
+    ref_id, payer_id = payment
+
+    # a replica is configured, flutterwave confirms the full amount
+    monkeypatch.setattr(db_engine, "read_engine", db_engine.async_engine)
+    monkeypatch.setattr(
+        payments_utils,
+        "verv_api_call",
+        lambda refId, header: {
+            "status": "success",
+            "data": {
+                "charged_amount": 10,
+                "flw_ref": "FLW-REPLICA",
+                "payment_type": "card",
+            },
+        },
+    )
+
+    # no active user, as in the flutterwave callbacks
+    assert replica.current_user.get() is None
+    response = app_client.portal.call(
+        payments_utils.confirm_user_payments, ref_id, {}
+    )
+    assert response["msg"] == "payment verified"
+
+    assert redis_db.redis_factory().exists(
+        replica.RECENT_WRITE_PREFIX + str(payer_id)
+    )
@@ -0,0 +1,119 @@
+# Smoke tests of the main routes through the app, on the sqlite profile
+# of the test database, see models.db_sqlite.
+
+from concurrent.futures import ThreadPoolExecutor
+import datetime, pytest
+
+
+@pytest.fixture(scope="module")
+def admin(login):
+    return login("routes-admin@example.com", role="admin")
+
+
+@pytest.fixture(scope="module")
+def user(login):
+    return login("routes-user@example.com")
+
+
+@pytest.fixture(scope="module")
+def invoice_id(app_client, admin, user):
+    due_date = datetime.date.today() + datetime.timedelta(days=3)
+    response = app_client.post(
+        "/invoice/create",
+        headers=admin,
+        json={
+            "title": "consultation",
+            "desc": "visa consultation",
+            "price": 10.5,
+            "to_email": "routes-user@example.com",
+            "due_date": str(due_date),
+        },
+    )
+    assert response.status_code == 201, response.text
+    return response.json()["invoiceId"]
+
+
+def test_index(app_client):
+    assert app_client.get("/").status_code == 200
+
+
+@pytest.mark.parametrize(
+    "path",
+    [
+        "/user/",
+        "/user/allUsers",
+        "/user/profile",
+        "/invoice/all",
+        "/invoice/pending",
+        "/invoice/summary",
+        "/payments/totalRevenue",
+    ],
+)
+def test_admin_reads(app_client, admin, invoice_id, path):
+    response = app_client.get(path, headers=admin)
+    assert response.status_code == 200, response.text
+
+
+@pytest.mark.parametrize(
+    "path", ["/user/profile", "/invoice/all", "/payments/totalSpend"]
+)
+def test_user_reads(app_client, user, invoice_id, path):
+    response = app_client.get(path, headers=user)
+    assert response.status_code == 200, response.text
+
+
+def test_user_reads_their_invoice(app_client, user, invoice_id):
+    response = app_client.get(f"/invoice/{invoice_id}", headers=user)
+    assert response.status_code == 200, response.text
+    assert response.json()["inv_id"] == invoice_id
+
+
+def test_users_can_not_list_all_users(app_client, user):
+    assert app_client.get("/user/allUsers", headers=user).status_code == 401
+
+
+def test_update_invoice(app_client, admin, invoice_id):
+    due_date = datetime.date.today() + datetime.timedelta(days=7)
+    response = app_client.put(
+        "/invoice/update",
+        headers=admin,
+        json={
+            "inv_id": invoice_id,
+            "title": "consultation",
+            "desc": "visa consultation, updated",
+            "price": 12,
+            "to_email": "routes-user@example.com",
+            "due_date": str(due_date),
+        },
+    )
+    assert response.status_code == 200, response.text
+
+
+def test_concurrent_reads_and_writes(app_client, user):
+    """the writes wait for the lock instead of failing with "database is
+    locked" while reads go on
+    """
+
+    def save(index: int) -> int:
+        return app_client.post(
+            "/notes/save",
+            headers=user,
+            json={"title": f"note {index}", "content": "c" * 500},
+        ).status_code
+
+    def read(index: int) -> int:
+        return app_client.get("/notes/", headers=user).status_code
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        saves = [pool.submit(save, index) for index in range(20)]
+        reads = [pool.submit(read, index) for index in range(20)]
+
+    assert [future.result() for future in saves] == [201] * 20
+    assert {future.result() for future in reads} <= {200, 404}
+    assert app_client.get("/notes/", headers=user).status_code == 200
+
+
+def test_logout(app_client, login):
+    headers = login("routes-logout@example.com")
+    assert app_client.get("/auth/logout", headers=headers).status_code == 200
+    assert app_client.get("/user/profile", headers=headers).status_code == 401
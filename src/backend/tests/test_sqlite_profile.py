@@ -0,0 +1,60 @@
+# Checks the connections of the sync and async engines get the pragmas of
+# the sqlite profile, see models.db_sqlite.
+
+from models import db_engine, db_pool, db_sqlite
+import asyncio, pytest
+
+
+# pragma => the value read back, synchronous NORMAL is 1, temp_store
+# MEMORY is 2
+EXPECTED = {
+    "journal_mode": "wal",
+    "synchronous": 1,
+    "mmap_size": db_sqlite.SQLITE_MMAP_SIZE,
+    "busy_timeout": db_sqlite.SQLITE_BUSY_TIMEOUT,
+    "temp_store": 2,
+    "cache_size": db_sqlite.PRAGMAS["cache_size"],
+}
+
+
+def sync_pragmas() -> dict:
+    with db_engine.engine.connect() as connection:
+        return {
+            name: connection.exec_driver_sql(f"PRAGMA {name}").scalar()
+            for name in EXPECTED
+        }
+
+
+async def async_pragmas() -> dict:
+    try:
+        async with db_engine.async_engine.connect() as connection:
+            return {
+                name: (
+                    await connection.exec_driver_sql(f"PRAGMA {name}")
+                ).scalar()
+                for name in EXPECTED
+            }
+
+    finally:
+        # the pooled connections are tied to the loop of asyncio.run
+        await db_engine.async_engine.dispose()
+
+
+def test_sync_engine_pragmas():
+    assert sync_pragmas() == EXPECTED
+
+
+def test_async_engine_pragmas():
+    assert asyncio.run(async_pragmas()) == EXPECTED
+
+
+@pytest.mark.parametrize(
+    "engine", [db_engine.engine, db_engine.async_engine], ids=["sync", "async"]
+)
+def test_file_databases_use_the_timed_pools(engine):
+    pool = getattr(engine, "sync_engine", engine).pool
+    assert type(pool) in (
+        db_pool.TimedQueuePool,
+        db_pool.TimedAsyncQueuePool,
+    )
+    assert pool.size() <= db_sqlite.SQLITE_POOL_SIZE
@@ -10,8 +10,11 @@ DRIVE_EXCEPTION = HTTPException(
 
 
 # tested
-def create_drive_api():
-    """creates the drive api client used in communicating with google srive api"""
+def create_drive_api(timeout: float | None = None):
+    """creates the drive api client used in communicating with google srive api
+
+    timeout: seconds each call to the api may take, no limit when None
+    """
 
     from google.oauth2 import service_account
     from googleapiclient.discovery import build
@@ -25,7 +28,20 @@ def create_drive_api():
         acc_json_file, scopes=["https://www.googleapis.com/auth/drive"]
     )
     try:
-        drive_api = build("drive", "v3", credentials=acc_cred)
+        if timeout is None:
+            drive_api = build("drive", "v3", credentials=acc_cred)
+
+        else:
+            from google_auth_httplib2 import AuthorizedHttp
+            import httplib2
+
+            drive_api = build(
+                "drive",
+                "v3",
+                http=AuthorizedHttp(
+                    acc_cred, http=httplib2.Http(timeout=timeout)
+                ),
+            )
 
     except exceptions.TransportError:
         raise HTTPException(
@@ -133,13 +149,18 @@ def file_permissions(drive, file_id):
 
 
 # tested
-def upload_file(fldr_id: str, name: str, data, mime_type: str) -> str:
-    """Uploads file to a folder existing on google drive"""
+def upload_file(
+    fldr_id: str, name: str, data, mime_type: str, timeout: float = None
+) -> str:
+    """Uploads file to a folder existing on google drive
+
+    timeout: seconds each call to the api may take, no limit when None
+    """
 
     from googleapiclient import http
     import io
 
-    drive = create_drive_api()
+    drive = create_drive_api(timeout)
     file_metadata = {"name": name, "parents": [fldr_id]}
     blob = http.MediaIoBaseUpload(
         io.BytesIO(data), mimetype=mime_type, resumable=False
@@ -155,7 +176,7 @@ def upload_file(fldr_id: str, name: str, data, mime_type: str) -> str:
             .execute()
         )
 
-    except errors.HttpError:
+    except (errors.HttpError, TimeoutError):
         raise DRIVE_EXCEPTION
 
     # print(file)
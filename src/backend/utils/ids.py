@@ -0,0 +1,205 @@
+# This module generates the invoice IDs and the payment reference IDs
+# an ID is a prefix and 11 crockford base32 characters holding 55 bits
+#   - 38 bits, the 10ms ticks since EPOCH, about 87 years of them
+#   - 7 bits, the node of the worker, claimed in redis or set with ID_NODE
+#   - 10 bits, the sequence of the IDs generated in the same tick
+# the IDs of a worker never repeat and grow with time, 1024 IDs a tick
+# borrow the next tick instead of waiting for it, and the nodes keep the
+# workers apart. The characters have a fixed width so the IDs sort as
+# strings by creation time, e.g
+#     new_id("JPC-") => "JPC-1CKX847G000"
+# and fit the 15 characters of the ref_id columns.
+#
+# a worker claims the first free "id_node:<node>" key with SET NX and a
+# NODE_TTL expiry, keep_node() refreshes it every NODE_TTL / 3 seconds and
+# release_node() frees it on shutdown, so a node is never shared by two
+# live workers and claim_node() fails once the 128 nodes are taken.
+# `python -m utils.ids` checks the IDs generated by concurrent threads.
+
+from fastapi.concurrency import run_in_threadpool
+from models import redis_db
+from redis.exceptions import RedisError
+from dotenv import load_dotenv
+import asyncio, datetime, os, random, threading, time, uuid
+
+
+load_dotenv()
+
+ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+WIDTH = 11
+
+EPOCH = datetime.datetime(2023, 1, 1, tzinfo=datetime.timezone.utc)
+TICK_SECONDS = 0.01
+
+NODE_BITS = 7
+SEQUENCE_BITS = 10
+NODE_KEY = "id_node:{}"
+# seconds a claim lasts without a refresh from keep_node
+NODE_TTL = int(os.getenv("ID_NODE_TTL", 60))
+
+lock = threading.Lock()
+node = os.getenv("ID_NODE")
+node = int(node) % (1 << NODE_BITS) if node is not None else None
+# the redis key of the claimed node, None when set with ID_NODE
+node_key = None
+# the value of node_key telling this worker holds it
+token = uuid.uuid4().hex
+last_tick = 0
+sequence = 0
+
+
+def claim_free_node(client) -> int:
+    """claims the first free node in redis, returns it"""
+
+    global node_key
+
+    for candidate in range(1 << NODE_BITS):
+        key = NODE_KEY.format(candidate)
+        if client.set(key, token, nx=True, ex=NODE_TTL):
+            node_key = key
+            return candidate
+
+    raise RuntimeError(
+        f"no free id node, {1 << NODE_BITS} workers already hold one"
+    )
+
+
+def claim_node(client=None) -> int:
+    """returns the node of the worker, claiming one on the first call"""
+
+    global node
+
+    if node is None:
+        client = client or redis_db.redis_factory()
+        try:
+            node = claim_free_node(client)
+
+        except RedisError as err:
+            # a random node only keeps a few workers apart
+            print(f"err claiming id node => {err}")
+            node = random.randrange(1 << NODE_BITS)
+
+    return node
+
+
+def holds(client, key: str, action: str) -> bool:
+    """runs expire or delete on the key if the worker still holds it"""
+
+    def check_and_run(pipe):
+        held = pipe.get(key) == token
+        pipe.multi()
+        if held and action == "expire":
+            pipe.expire(key, NODE_TTL)
+
+        elif held:
+            pipe.delete(key)
+
+        return held
+
+    return client.transaction(check_and_run, key, value_from_callable=True)
+
+
+def keep_node(client=None) -> int:
+    """refreshes the claim on the node, claims a free node when another
+    worker took it after the claim expired, returns the node
+    """
+
+    global node
+
+    if node_key is None:
+        return node
+
+    client = client or redis_db.redis_factory()
+    if not holds(client, node_key, "expire"):
+        print(f"lost id node {node}, claiming another")
+        # no IDs are minted with the lost node, even if none is free
+        node = None
+        node = claim_free_node(client)
+
+    return node
+
+
+def release_node(client=None) -> None:
+    """frees the claimed node for the next worker"""
+
+    global node, node_key
+
+    if node_key is not None:
+        holds(client or redis_db.redis_factory(), node_key, "delete")
+        node, node_key = None, None
+
+
+async def keep_node_periodically() -> None:
+    """refreshes the claim on the node every NODE_TTL / 3 seconds"""
+
+    while True:
+        await asyncio.sleep(NODE_TTL / 3)
+        try:
+            await run_in_threadpool(keep_node)
+
+        except Exception as err:
+            print(f"err keeping id node => {err}")
+
+
+def encode(value: int) -> str:
+    """returns the fixed width crockford base32 encoding of the value"""
+
+    chars = []
+    for _ in range(WIDTH):
+        value, digit = divmod(value, 32)
+        chars.append(ALPHABET[digit])
+
+    return "".join(reversed(chars))
+
+
+def new_id(prefix: str) -> str:
+    """returns a new ID starting with prefix"""
+
+    global last_tick, sequence
+
+    worker = claim_node()
+    now = int((time.time() - EPOCH.timestamp()) / TICK_SECONDS)
+    with lock:
+        if now > last_tick:
+            last_tick, sequence = now, 0
+
+        else:
+            # same tick or the clock went back, keep counting
+            sequence += 1
+            if sequence >> SEQUENCE_BITS:
+                last_tick, sequence = last_tick + 1, 0
+
+        tick = last_tick
+        seq = sequence
+
+    value = (
+        tick << (NODE_BITS + SEQUENCE_BITS)
+        | worker << SEQUENCE_BITS
+        | seq
+    )
+    return prefix + encode(value)
+
+
+def invoice_id() -> str:
+    return new_id("JPC-")
+
+
+def payment_ref() -> str:
+    return new_id("REF-")
+
+
+if __name__ == "__main__":
+    # checks the IDs of concurrent threads, python -m utils.ids [count]
+    from concurrent.futures import ThreadPoolExecutor
+    import sys
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        generated = list(pool.map(lambda _: invoice_id(), range(count)))
+
+    elapsed = time.perf_counter() - start
+    print(
+        f"{count} IDs in {elapsed:.2f}s, "
+        f"{count - len(set(generated))} collisions"
+    )
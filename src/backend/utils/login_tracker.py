@@ -0,0 +1,105 @@
+# This module buffers the users last login time in redis
+# logins are recorded in the "last_login" hash (user_id => iso timestamp)
+# and a background job writes the hash to the users table in one batched
+# UPDATE every LAST_LOGIN_FLUSH_INTERVAL seconds. The logins and the
+# listings use the async client, the flush runs in the threadpool.
+
+from fastapi.concurrency import run_in_threadpool
+from models import db_engine, db_models, redis_db
+from redis.exceptions import ResponseError
+from sqlalchemy import update
+from dotenv import load_dotenv
+import asyncio, datetime, os
+
+
+load_dotenv()
+redis = redis_db.redis_factory()
+
+LAST_LOGIN_KEY = "last_login"
+FLUSHING_KEY = "last_login:flushing"
+FLUSH_INTERVAL = int(os.getenv("LAST_LOGIN_FLUSH_INTERVAL", 30))
+
+
+async def record_login(user_id: int, timestamp: datetime.datetime) -> None:
+    """buffers the login time of the user"""
+
+    await redis_db.async_redis_factory().hset(
+        LAST_LOGIN_KEY, user_id, timestamp.isoformat()
+    )
+
+
+async def pending_logins(user_ids: list[int]) -> dict:
+    """returns the login times of the users that are not flushed yet"""
+
+    if not user_ids:
+        return {}
+
+    flushing, latest = await redis_db.async_pipeline(
+        ("hmget", FLUSHING_KEY, user_ids),
+        ("hmget", LAST_LOGIN_KEY, user_ids),
+    )
+
+    logins = {}
+    for user_id, *values in zip(user_ids, flushing, latest):
+        values = [datetime.datetime.fromisoformat(v) for v in values if v]
+        if values:
+            logins[user_id] = max(values)
+
+    return logins
+
+
+async def merge_last_login(users: list[dict]) -> list[dict]:
+    """updates the last_login of serialized users with the buffered
+    login times
+    """
+
+    logins = await pending_logins([user["user_id"] for user in users])
+    for user in users:
+        if user["user_id"] in logins:
+            user["last_login"] = logins[user["user_id"]]
+
+    return users
+
+
+def flush() -> int:
+    """writes the buffered login times to the users table and returns the
+    number of users updated
+    """
+
+    # a leftover batch means the previous flush failed, retry it first
+    if not redis.exists(FLUSHING_KEY):
+        try:
+            redis.rename(LAST_LOGIN_KEY, FLUSHING_KEY)
+
+        except ResponseError:
+            # no logins since the last flush
+            return 0
+
+    logins = redis.hgetall(FLUSHING_KEY)
+    records = [
+        {
+            "user_id": int(user_id),
+            "last_login": datetime.datetime.fromisoformat(timestamp),
+        }
+        for user_id, timestamp in logins.items()
+    ]
+
+    if records:
+        with db_engine.SessionLocal() as db:
+            db.execute(update(db_models.User), records)
+            db.commit()
+
+    redis.delete(FLUSHING_KEY)
+    return len(records)
+
+
+async def flush_periodically() -> None:
+    """flushes the buffered login times every FLUSH_INTERVAL seconds"""
+
+    while True:
+        await asyncio.sleep(FLUSH_INTERVAL)
+        try:
+            await run_in_threadpool(flush)
+
+        except Exception as err:
+            print(f"err at last_login flush => {err}")
@@ -1,7 +1,26 @@
+from concurrent.futures import ThreadPoolExecutor
 from passlib.context import CryptContext
+from dotenv import load_dotenv
+import asyncio, os
 
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+load_dotenv()
+
+# raising BCRYPT_ROUNDS makes older hashes get rehashed on the next login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+HASH_WORKERS = int(os.getenv("PWD_HASH_WORKERS", 4))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+)
+
+# bcrypt releases the GIL, so a thread pool keeps it off the event loop
+hash_executor = ThreadPoolExecutor(
+    max_workers=HASH_WORKERS, thread_name_prefix="pwd_hash"
+)
 
 
 def hash_pwd(raw_pwd: str) -> str:
@@ -14,3 +33,25 @@ def verify_pwd(raw_pwd: str, hashed_pwd: str) -> bool:
     """checks if raw_pwd and hashed_pwd are same"""
 
     return pwd_context.verify(raw_pwd, hashed_pwd)
+
+
+async def async_hash_pwd(raw_pwd: str) -> str:
+    """hashes raw_pwd on the hashing pool"""
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(hash_executor, hash_pwd, raw_pwd)
+
+
+async def async_verify_and_update(
+    raw_pwd: str, hashed_pwd: str
+) -> tuple[bool, str | None]:
+    """checks raw_pwd against hashed_pwd on the hashing pool
+
+    returns the verification result and a new hash when hashed_pwd was
+    created with an outdated cost, None otherwise
+    """
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        hash_executor, pwd_context.verify_and_update, raw_pwd, hashed_pwd
+    )
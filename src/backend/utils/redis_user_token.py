@@ -19,5 +19,4 @@ def add_email_token(key, token: str, expires_in=3600):
     # if not redis.exists(key):
     #    redis.set(key, token)
 
-    redis.set(key, token)
-    redis.expire(key, expires_in)
+    redis.set(key, token, ex=expires_in)